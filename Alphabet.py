@@ -0,0 +1,172 @@
+from bisect import bisect_right
+
+# Unicodeの最大の文字コード
+MAX_CODE_POINT = 0x10FFFF
+
+
+class CharRanges(object):
+    """
+    文字コードの区間の並びで表した一文字の文字列の集合
+    Unicode全体のような大きな集合も区間の数だけの大きさで持てるので、アルファベットや遷移のラベルに使える
+    (ラベルとして使う時は、同じオートマトンの他のラベルと重ならないようにする)
+
+    >>> letters = CharRanges([("a", "z")]) - CharRanges.of("aeiou")
+    >>> "b" in letters, "e" in letters, len(letters)
+    (True, False, 21)
+    >>> CharRanges.full() - CharRanges.of("x")
+    CharRanges([(0x0, 0x77), (0x79, 0x10ffff)])
+    """
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, ranges=()):
+        # rangesは(最初, 最後)の組の並び(両端を含み、文字でも文字コードでもよい)
+        # startsとendsは重ならず隣り合わない区間を小さい順に並べた両端の文字コード
+        self.starts = []
+        self.ends = []
+        for start, end in sorted((CharRanges.code(start), CharRanges.code(end)) for start, end in ranges):
+            if start > end:
+                continue
+            if self.ends and start <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    @staticmethod
+    def code(char):
+        """ 文字かその文字コードを受け取って文字コードを返す """
+        return char if isinstance(char, int) else ord(char)
+
+    @staticmethod
+    def of(chars):
+        """ 文字の集まりcharsからなる集合を返す """
+        return CharRanges((char, char) for char in chars)
+
+    @staticmethod
+    def full():
+        """ Unicodeの全部の文字の集合を返す """
+        return CharRanges([(0, MAX_CODE_POINT)])
+
+    def ranges(self):
+        """ (最初の文字コード, 最後の文字コード)の組のリストを返す """
+        return list(zip(self.starts, self.ends))
+
+    def first(self):
+        """ 一番小さい文字を返す(空ならNone) """
+        return chr(self.starts[0]) if self.starts else None
+
+    def __contains__(self, char):
+        if not isinstance(char, str) or len(char) != 1:
+            return False
+        code = ord(char)
+        i = bisect_right(self.starts, code) - 1
+        return i >= 0 and code <= self.ends[i]
+
+    def __len__(self):
+        return sum(end - start + 1 for start, end in zip(self.starts, self.ends))
+
+    def __bool__(self):
+        return bool(self.starts)
+
+    def __iter__(self):
+        for start, end in zip(self.starts, self.ends):
+            for code in range(start, end + 1):
+                yield chr(code)
+
+    def __or__(self, other):
+        return CharRanges(self.ranges() + other.ranges())
+
+    def __sub__(self, other):
+        result = []
+        for start, end in zip(self.starts, self.ends):
+            # 引く区間のうち[start, end]と重なるものだけを見る
+            i = max(bisect_right(other.ends, start - 1), 0)
+            while i < len(other.starts) and other.starts[i] <= end:
+                if other.starts[i] > start:
+                    result.append((start, other.starts[i] - 1))
+                start = max(start, other.ends[i] + 1)
+                i += 1
+            if start <= end:
+                result.append((start, end))
+        return CharRanges(result)
+
+    def __and__(self, other):
+        return self - (self - other)
+
+    def __eq__(self, other):
+        return isinstance(other, CharRanges) and self.starts == other.starts and self.ends == other.ends
+
+    def __hash__(self):
+        return hash((tuple(self.starts), tuple(self.ends)))
+
+    def __repr__(self):
+        return "CharRanges([%s])" % ", ".join("(%#x, %#x)" % pair for pair in self.ranges())
+
+
+def split_alphabet(alphabet, chars):
+    """
+    アルファベットalphabet(CharRangesか記号の集まり)を、chars(正規表現に現れる文字など)の各文字と残り全部に分けた
+    ラベルの集合を返す(残りは一つのCharRangesになり、どの遷移でも同じように振る舞う一つの同値類になる)
+    alphabetがCharRangesでなければそのまま返す
+
+    >>> sorted(split_alphabet(CharRanges([("a", "z")]), "ax"), key=str)
+    [CharRanges([(0x62, 0x77), (0x79, 0x7a)]), 'a', 'x']
+    """
+    if not isinstance(alphabet, CharRanges):
+        return alphabet
+    chars = set(char for char in chars if char in alphabet)
+    labels = set(chars)
+    rest = alphabet - CharRanges.of(chars)
+    if rest:
+        labels.add(rest)
+    return labels
+
+
+class SymbolClasses(dict):
+    """
+    入力の文字から同値類の番号(CompiledDFAの列番号)を引く表
+    文字のラベルは辞書として直接引き、CharRangesのラベルに入る文字は初めて引いた時に二分探索して辞書に覚える
+    labelsはラベル(文字かCharRanges)から番号への辞書
+    """
+
+    def __init__(self, labels):
+        super().__init__((label, column) for label, column in labels.items() if not isinstance(label, CharRanges))
+        self.labels = dict(labels)
+        spans = sorted((start, end, column) for label, column in labels.items() if isinstance(label, CharRanges)
+                       for start, end in label.ranges())
+        self.starts = [start for start, _, _ in spans]
+        self.ends = [end for _, end, _ in spans]
+        self.columns = [column for _, _, column in spans]
+
+    def spans(self):
+        """ (最初の文字コード, 最後の文字コード, 番号)の組のリストを返す(一文字のラベルも含む) """
+        singles = [(ord(label), ord(label), column) for label, column in self.labels.items() if isinstance(label, str) and len(label) == 1]
+        return singles + list(zip(self.starts, self.ends, self.columns))
+
+    def __missing__(self, char):
+        if isinstance(char, str) and len(char) == 1:
+            code = ord(char)
+            i = bisect_right(self.starts, code) - 1
+            if i >= 0 and code <= self.ends[i]:
+                self[char] = self.columns[i]
+                return self.columns[i]
+        raise KeyError(char)
+
+    def get(self, char, default=None):
+        try:
+            return self[char]
+        except KeyError:
+            return default
+
+    def __contains__(self, char):
+        return self.get(char) is not None
+
+    def __reduce__(self):
+        # 覚えた文字は捨て、ラベルから作り直す(match_parallelなどでほかのプロセスに送る時)
+        return SymbolClasses, (self.labels,)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,159 @@
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+import Automata
+from Alphabet import CharRanges, SymbolClasses, split_alphabet
+from Automata import NFAWithEpsilonTransition as eNFA
+from Regex import regex_to_eNFA
+
+
+class CharRangesTest(unittest.TestCase):
+    """ 文字コードの区間で表した文字の集合の確認 """
+
+    def test_normalize(self):
+        ranges = CharRanges([("d", "f"), ("a", "b"), ("c", "c"), ("x", "z"), ("y", "y")])
+        self.assertEqual([(ord("a"), ord("f")), (ord("x"), ord("z"))], ranges.ranges())
+        self.assertEqual(9, len(ranges))
+        self.assertEqual("abcdefxyz", "".join(ranges))
+        self.assertEqual("a", ranges.first())
+        self.assertFalse(CharRanges())
+
+    def test_operations(self):
+        left = CharRanges([(0, 100), (200, 300)])
+        right = CharRanges([(50, 60), (90, 210), (300, 400)])
+        self.assertEqual(set(left) | set(right), set(left | right))
+        self.assertEqual(set(left) - set(right), set(left - right))
+        self.assertEqual(set(right) - set(left), set(right - left))
+        self.assertEqual(set(left) & set(right), set(left & right))
+
+    def test_contains(self):
+        unicode = CharRanges.full() - CharRanges.of("x")
+        self.assertIn("日", unicode)
+        self.assertIn("\U0010ffff", unicode)
+        self.assertNotIn("x", unicode)
+        self.assertNotIn("ab", unicode)
+        self.assertNotIn(1, unicode)
+
+    def test_split_alphabet(self):
+        labels = split_alphabet(CharRanges.full(), "ab日")
+        self.assertEqual({"a", "b", "日", CharRanges.full() - CharRanges.of("ab日")}, labels)
+        self.assertEqual({"a", "b"}, split_alphabet(CharRanges.of("ab"), "ab"))
+        alphabet = {"a", "b", "c"}
+        self.assertIs(alphabet, split_alphabet(alphabet, "a"))
+
+
+class SymbolClassesTest(unittest.TestCase):
+    """ 文字から同値類の番号を引く表の確認 """
+
+    def setUp(self):
+        self.classes = SymbolClasses({"a": 0, CharRanges([("b", "y")]): 1, "z": 0})
+
+    def test_lookup(self):
+        self.assertEqual(0, self.classes["a"])
+        self.assertEqual(1, self.classes["m"])
+        self.assertEqual(1, self.classes.get("b"))
+        self.assertIsNone(self.classes.get("A"))
+        self.assertIn("y", self.classes)
+        self.assertNotIn("A", self.classes)
+        with self.assertRaises(KeyError):
+            self.classes["A"]
+
+    def test_spans(self):
+        self.assertEqual(sorted([(97, 97, 0), (98, 121, 1), (122, 122, 0)]), sorted(self.classes.spans()))
+
+    def test_pickle(self):
+        self.classes["m"]
+        copy = pickle.loads(pickle.dumps(self.classes))
+        self.assertEqual(self.classes.labels, copy.labels)
+        self.assertEqual(1, copy["c"])
+
+
+class UnicodeAlphabetTest(unittest.TestCase):
+    """ CharRangesをアルファベットにした正規表現とオートマトンの確認 """
+
+    def setUp(self):
+        self.enfa = regex_to_eNFA("a.*(b|c)", CharRanges.full())
+        self.dfa = self.enfa.convert_to_DFA().minimized()
+        self.tests = [("ab", True), ("a日本語c", True), ("a😀b😀c", True), ("a日本", False), ("日b", False), ("", False)]
+
+    def test_labels(self):
+        """ "."はUnicode全体でも数個の遷移にしかならない """
+        self.assertEqual(4, len(self.enfa.alphabet))
+        self.assertLess(len(self.enfa.states), 20)
+        self.assertEqual(3, self.dfa.compile().width)
+
+    def test_run(self):
+        for automata in [self.enfa, self.dfa]:
+            for string, expected in self.tests:
+                self.assertEqual(expected, automata.run(string))
+                self.assertEqual(expected, automata.matcher().feed(string).finish())
+
+    def test_run_many(self):
+        strings = [string for string, _ in self.tests]
+        expected = [expected for _, expected in self.tests]
+        self.assertEqual(expected, self.dfa.run_many(strings))
+        with mock.patch.object(Automata, "numpy", None):
+            self.assertEqual(expected, self.dfa.run_many(strings))
+
+    def test_excluded(self):
+        """ アルファベットに入らない文字は受理しない """
+        automata = regex_to_eNFA(".*", CharRanges.full() - CharRanges.of("x"))
+        with mock.patch("builtins.print"):
+            self.assertFalse(automata.run("axc"))
+        self.assertTrue(automata.run("abc"))
+        self.assertFalse(automata.convert_to_DFA().run_many(["axc"])[0])
+
+    def test_any_word(self):
+        automata = eNFA.any_word(CharRanges([("a", "z")]))
+        self.assertTrue(automata.run("q"))
+        self.assertFalse(automata.run("qq"))
+
+    def test_search(self):
+        self.assertEqual((2, 6), self.dfa.search("xxa😀😀b yy"))
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "automata.dfa")
+            self.dfa.save(path)
+            for use_mmap in [True, False]:
+                loaded = Automata.CompiledDFA.load(path, mmap=use_mmap)
+                self.assertEqual(self.dfa.compile().labels(), loaded.labels())
+                for string, expected in self.tests:
+                    self.assertEqual(expected, loaded.run(string))
+                del loaded
+
+
+class SymbolClassTest(unittest.TestCase):
+    """ 同じ遷移をする記号を一つの列にまとめる確認 """
+
+    def test_compressed(self):
+        alphabet = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ")
+        dfa = regex_to_eNFA("((a|A)(b|B)(c|C))*", alphabet).convert_to_DFA().minimized()
+        compiled = dfa.compile()
+        self.assertEqual(4, compiled.width)
+        self.assertEqual(compiled.symbols["a"], compiled.symbols["A"])
+        self.assertEqual(compiled.symbols["x"], compiled.symbols["Z"])
+        self.assertNotEqual(compiled.symbols["a"], compiled.symbols["b"])
+        for string, expected in [("abc", True), ("ABcAbc", True), ("abcabcc", False), ("abcAbcABCabCabc", True)]:
+            self.assertEqual(expected, compiled.run(string))
+            self.assertEqual(expected, compiled.to_DFA().run(string))
+
+    def test_version_1(self):
+        """ 記号ごとに一列の版1のファイルも読める """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "automata.dfa")
+            encoded = b"".join(bytes([1, 0]) + char for char in [b"0", b"1"])
+            with open(path, "wb") as file:
+                file.write(Automata.CompiledDFA.HEADER.pack(b"ADFA", 1, 0, 3, 2, 0, len(encoded)))
+                file.write(encoded + b"\0" * (-len(encoded) % 4))
+                file.write(bytes(Automata.array("i", [0, 1, 2, 0, 1, 2])))
+                file.write(bytes([1]))
+            loaded = Automata.CompiledDFA.load(path, mmap=False)
+            self.assertTrue(loaded.run("110"))
+            self.assertFalse(loaded.run("111"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,13 +1,391 @@
+import multiprocessing
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, deque
+from collections.abc import Mapping
+from contextlib import contextmanager
+from itertools import accumulate, chain, islice, repeat
+from multiprocessing.shared_memory import SharedMemory
+from mmap import ACCESS_READ, mmap as memory_map
+from types import MappingProxyType
+import Instrument
+from Alphabet import CharRanges, SymbolClasses
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class StateTable(object):
+    """ 状態や文字などのオブジェクトに0から番号を振り、オブジェクトと番号を相互に変換する表 """
+
+    __slots__ = ("objects", "index")
+
+    def __init__(self, objects=()):
+        self.objects = list(objects)
+        self.index = dict(zip(self.objects, range(len(self.objects))))
+        if len(self.index) != len(self.objects):
+            # 同じオブジェクトが何度も出てきたら一つずつ番号を振り直す
+            objects, self.objects, self.index = self.objects, [], {}
+            for obj in objects:
+                self.intern(obj)
+
+    def intern(self, obj):
+        """ objの番号を返す(まだ無ければ新しい番号を振る) """
+        number = self.index.get(obj)
+        if number is None:
+            number = self.index[obj] = len(self.objects)
+            self.objects.append(obj)
+        return number
+
+    def __len__(self):
+        return len(self.objects)
+
+
+class CompactTransitions(object):
+    """
+    {状態: {文字: 行き先}}の遷移関数を整数の配列にまとめたもの(CSR形式)
+    状態と文字はStateTableで番号にし、遷移は一つの行き先ごとに(文字の番号, 行き先の番号)の辺にする
+    番号iの状態から出る辺はcolumns[offsets[i]:offsets[i + 1]]とtargets[offsets[i]:offsets[i + 1]]で、文字の番号の順に並べる
+    (ある文字の辺は二分探索で探す。deterministicなら文字ごとに辺は一つで、そうでなければ行き先の集合の分だけ並ぶ)
+    配列の大きさは辺の数に比例し、状態の数と文字の数の積にはならない
+    """
+
+    __slots__ = ("states", "symbols", "offsets", "columns", "targets", "rows", "row_count", "deterministic")
+
+    def __init__(self, transitions, states=(), deterministic=False):
+        self.states = StateTable(states)
+        self.deterministic = deterministic
+        # 全部の辺を一列に並べ、番号を引くのはmapでまとめて行う(番号の無い状態があった時だけ一つずつ振る)
+        chars = list(chain.from_iterable(transitions.values()))
+        self.symbols = StateTable(set(chars))
+        index = self.states.index
+        sources = list(transitions)
+        lengths = [len(row) for row in transitions.values()]
+        targets = list(chain.from_iterable(row.values() for row in transitions.values()))
+        try:
+            numbers = self._numbers(targets)
+        except KeyError:
+            for target in targets:
+                for t in ((target,) if deterministic else target):
+                    self.states.intern(t)
+            numbers = self._numbers(targets)
+        for state in sources:
+            if state not in index:
+                self.states.intern(state)
+
+        rows = list(map(index.__getitem__, sources))
+        edges = zip(chain.from_iterable(map(repeat, rows, lengths)), map(self.symbols.index.__getitem__, chars), numbers)
+        if not deterministic:
+            # 行き先の集合は行き先ごとの辺に分ける
+            edges = ((i, c, t) for i, c, ts in edges for t in ts)
+        self._pack(sorted(edges))
+        self.rows = bytearray(len(self.states))
+        for i in rows:
+            self.rows[i] = 1
+        self.row_count = len(set(rows))
+
+    @staticmethod
+    def from_edges(size, symbols, sources, columns, targets):
+        """
+        状態が0からsize-1の整数のNFAの遷移を、k番目の辺がsources[k]から文字symbols.objects[columns[k]]でtargets[k]へ行く
+        三つの配列から作る(同じ辺が何度あってもよい)
+        """
+        compact = CompactTransitions({})
+        compact.states = StateTable(range(size))
+        compact.symbols = symbols
+        compact._pack(sorted(zip(sources, columns, targets)))
+        compact.rows = bytearray(b"\x01") * size
+        compact.row_count = size
+        return compact
+
+    def _numbers(self, targets):
+        """ 行き先(deterministicでなければ行き先の集合)の列を番号にする(番号の無い状態があればKeyError) """
+        index = self.states.index
+        if self.deterministic:
+            return list(map(index.__getitem__, targets))
+        return list(map(list, map(map, repeat(index.__getitem__), targets)))
+
+    def _pack(self, edges):
+        """ (状態の番号, 文字の番号, 行き先の番号)の順に並べた辺edgesを配列に詰める """
+        counts = Counter(edge[0] for edge in edges)
+        self.offsets = array("i", [0])
+        self.offsets.extend(accumulate(map(counts.get, range(len(self.states)), repeat(0))))
+        self.columns = array("i", [edge[1] for edge in edges])
+        self.targets = array("i", [edge[2] for edge in edges])
+
+    def span(self, i, c):
+        """ 番号iの状態から番号cの文字で出る辺の範囲(start, end)を返す(無ければstart == end) """
+        columns = self.columns
+        low, high = self.offsets[i], self.offsets[i + 1]
+        start = bisect_left(columns, c, low, high)
+        if start == high or columns[start] != c:
+            return start, start
+        if self.deterministic:
+            return start, start + 1
+        return start, bisect_right(columns, c, start, high)
+
+    def lookup(self, state, char):
+        """ stateからcharで行ける状態(deterministicなら一つの状態かNone、そうでなければ状態のリスト)を返す """
+        i = self.states.index.get(state)
+        c = self.symbols.index.get(char)
+        if i is None or c is None:
+            return None if self.deterministic else ()
+        start, end = self.span(i, c)
+        if self.deterministic:
+            return self.states.objects[self.targets[start]] if start != end else None
+        return [self.states.objects[t] for t in self.targets[start:end]]
+
+    def column(self, char):
+        """ deterministicな遷移で、各状態の番号からcharで行く状態の番号のリストを返す(遷移が無ければ-1) """
+        column = [-1] * len(self.states)
+        c = self.symbols.index.get(char)
+        width = len(self.symbols)
+        if c is not None and len(self.targets) == len(column) * width:
+            # どの状態にもどの文字の遷移もあれば、番号iの状態の辺はi * widthから文字の番号の順に並ぶ
+            return self.targets[c::width].tolist()
+        if c is not None:
+            for i in range(len(column)):
+                start, end = self.span(i, c)
+                if start != end:
+                    column[i] = self.targets[start]
+        return column
+
+    def successors(self, char):
+        """ 各状態からcharで行ける状態のリストを{状態: [行き先]}の辞書にして返す(行き先が無い状態は含めない) """
+        c = self.symbols.index.get(char)
+        if c is None:
+            return {}
+        objects = self.states.objects
+        successors = {}
+        for i, state in enumerate(objects):
+            start, end = self.span(i, c)
+            if start != end:
+                successors[state] = [objects[t] for t in self.targets[start:end]]
+        return successors
+
+    def row(self, i):
+        """ 番号iの状態の遷移を{文字: 行き先}の辞書にして返す(deterministicでなければ行き先はfrozenset) """
+        objects = self.states.objects
+        chars = self.symbols.objects
+        start, end = self.offsets[i], self.offsets[i + 1]
+        edges = zip(self.columns[start:end], self.targets[start:end])
+        if self.deterministic:
+            return {chars[c]: objects[t] for c, t in edges}
+        row = {}
+        for c, t in edges:
+            row.setdefault(chars[c], []).append(objects[t])
+        return {char: frozenset(targets) for char, targets in row.items()}
+
+    def nbytes(self):
+        """ 配列と番号の表が使っているおおよそのバイト数を返す(状態のオブジェクト自体は数えない) """
+        return (sum(sys.getsizeof(a) for a in (self.offsets, self.columns, self.targets)) + sys.getsizeof(self.rows) +
+                sys.getsizeof(self.states.objects) + sys.getsizeof(self.states.index) +
+                sys.getsizeof(self.symbols.objects) + sys.getsizeof(self.symbols.index))
+
+
+class TransitionView(Mapping):
+    """
+    CompactTransitionsを{状態: {文字: 行き先}}の辞書として読み出すためのもの
+    行は書き換えられない辞書(MappingProxyType)で、行き先の集合はfrozensetなので、その場で書き換えようとするとTypeErrorになる
+    (遷移を変える時はtransitionsに辞書を代入する)
+    同じ遷移を表す辞書やTransitionViewとは等しい
+    """
+
+    __slots__ = ("compact",)
+
+    def __init__(self, compact):
+        self.compact = compact
+
+    def __getitem__(self, state):
+        i = self.compact.states.index.get(state)
+        if i is None or not self.compact.rows[i]:
+            raise KeyError(state)
+        return MappingProxyType(self.compact.row(i))
+
+    def __contains__(self, state):
+        i = self.compact.states.index.get(state)
+        return i is not None and self.compact.rows[i] == 1
+
+    def __iter__(self):
+        rows = self.compact.rows
+        for i, state in enumerate(self.compact.states.objects):
+            if rows[i]:
+                yield state
+
+    def __len__(self):
+        return self.compact.row_count
+
+    def __repr__(self):
+        return repr({state: dict(row) for state, row in self.items()})
+
 
 class Automata(object):
     """ オートマトンの基底クラス """
 
+    __slots__ = ("_cache", "_transitions", "_init_state", "_final_states", "states", "alphabet")
+
+    # 遷移の行き先が一つの状態ならTrue、状態の集合ならFalse
+    deterministic = False
+
     def __init__(self, states, alphabet, transitions, init_state, final_states):
+        # _cacheには遷移から計算した表などを覚えておく(遷移が変わったら捨てる)
+        self._cache = {}
         self.states = frozenset(states)
         self.alphabet = frozenset(alphabet)
         self.transitions = transitions
         self.init_state = init_state
-        self.final_states = frozenset(final_states)
+        self.final_states = final_states
+
+    @property
+    def init_state(self):
+        """ 始状態 """
+        return self._init_state
+
+    @init_state.setter
+    def init_state(self, init_state):
+        # 始状態が変わったら、遷移から計算した表(CompiledDFAなど)も作り直す
+        self._init_state = init_state
+        self.invalidate()
+
+    @property
+    def final_states(self):
+        """ 受理状態の集合 """
+        return self._final_states
+
+    @final_states.setter
+    def final_states(self, final_states):
+        # 受理状態が変わったら、遷移から計算した表(CompiledDFAなど)も作り直す
+        self._final_states = frozenset(final_states)
+        self.invalidate()
+
+    @property
+    def transitions(self):
+        """ 遷移関数(整数の配列にまとめたものを辞書のように読み出すTransitionView) """
+        return self._transitions
+
+    @transitions.setter
+    def transitions(self, transitions):
+        # 辞書は整数の配列にまとめる(同じ種類のオートマトンのTransitionViewならそのまま共有する)
+        if not (isinstance(transitions, TransitionView) and transitions.compact.deterministic == self.deterministic):
+            transitions = TransitionView(CompactTransitions(transitions, self.states, self.deterministic))
+        self._transitions = transitions
+        self.invalidate()
+
+    def invalidate(self):
+        """ 遷移から計算して覚えている表を捨てる(遷移、始状態や受理状態を代入した時に自動で呼ばれる) """
+        self._cache.clear()
+
+    def engine(self):
+        """ runで使う実行器を返す(既定では通った状態集合を覚えておくLazyDFA、DFAはcompileした表を使う) """
+        if "lazy" not in self._cache:
+            self._cache["lazy"] = self.lazy_DFA()
+        return self._cache["lazy"]
+
+    def bitset(self):
+        """ 状態集合を整数のビット列で表して実行するBitsetNFAを返す(一度作ったものは覚えておく) """
+        if "bitset" not in self._cache:
+            self._cache["bitset"] = BitsetNFA.from_NFA(self)
+        return self._cache["bitset"]
+
+    def lazy_DFA(self, cache_size=1024, policy="lru"):
+        """ 必要な状態だけをその場で作るDFAとして実行するLazyDFAを返す """
+        return LazyDFA(self.bitset(), cache_size, policy)
+
+    def run(self, string, invalid="reject"):
+        """ stringを認識するかチェックする(アルファベットに無い文字はinvalidに従って扱う、INVALID_POLICIESを参照) """
+        return self.engine().run(string, invalid)
+
+    def matcher(self, invalid="reject"):
+        """ 文字列を少しずつ読ませて認識するMatcherを返す """
+        return Matcher(self.engine(), invalid)
+
+    def to_DFA(self):
+        """ 等価なDFAを返す """
+        return self.convert_to_DFA()
+
+    def match_parallel(self, strings, workers=None, chunksize=256):
+        """ 複数の文字列をworkers個のプロセスで分けて認識し、結果を入力の順番に返す(CompiledDFA.match_parallelを参照) """
+        return self.to_DFA().compile().match_parallel(strings, workers, chunksize, self.prefilter())
+
+    def run_parallel(self, string, workers=None, chunk_size=None):
+        """ 一つの長いstringを分けてworkers個のプロセスで同時に読んで認識する(CompiledDFA.run_parallelを参照) """
+        return self.to_DFA().compile().run_parallel(string, workers, chunk_size)
+
+    def prefilter(self):
+        """ 受理する文字列が必ず持つリテラルを先に調べるPrefilterを返す(付いていなければNone) """
+        return self._cache.get("prefilter")
+
+    def set_prefilter(self, prefilter):
+        """
+        受理する文字列が必ず持つリテラルを先に調べるPrefilterを付ける(Regexで作る時に付く)
+        search, match, finditer, run_manyとmatch_parallelは、当てはまらない入力や部分を読み飛ばす
+        遷移を書き換えると覚えている表と一緒に捨てる
+        """
+        self._cache["prefilter"] = prefilter
+        self._cache.pop("searcher", None)
+
+    def searcher(self):
+        """ 文字列の中から受理される部分を探すSearcherを返す(一度作ったものは覚えておく) """
+        if "searcher" not in self._cache:
+            self._cache["searcher"] = Searcher(self.to_DFA(), self.prefilter())
+        return self._cache["searcher"]
+
+    def search(self, text, pos=0):
+        """ text[pos:]の中で最も左から始まる最長の受理される部分の(始まり, 終わり)を返す(無ければNone) """
+        return self.searcher().search(text, pos)
+
+    def match(self, text, pos=0):
+        """ text[pos:]の先頭から始まる最長の受理される部分の(始まり, 終わり)を返す(無ければNone) """
+        return self.searcher().match(text, pos)
+
+    def finditer(self, text, pos=0):
+        """ text[pos:]の中の重ならない受理される部分の(始まり, 終わり)を左から順に返す """
+        return self.searcher().finditer(text, pos)
+
+    def intersect(self, other):
+        """ 自分とotherの両方が受理する文字列を受理するDFAを返す """
+        return ProductDFA(self.to_DFA(), other.to_DFA(), "intersection")
+
+    def union(self, other):
+        """ 自分とotherのどちらかが受理する文字列を受理するDFAを返す """
+        return ProductDFA(self.to_DFA(), other.to_DFA(), "union")
+
+    def difference(self, other):
+        """ 自分は受理するがotherは受理しない文字列を受理するDFAを返す """
+        dfa = self.to_DFA()
+        # otherの補集合(flliped)との共通部分を取る
+        complement = other.to_DFA().completed(dfa.alphabet.union(other.alphabet)).flliped()
+        return ProductDFA(dfa, complement, "intersection")
+
+    def symmetric_difference(self, other):
+        """ 自分とotherの片方だけが受理する文字列を受理するDFAを返す """
+        return ProductDFA(self.to_DFA(), other.to_DFA(), "symmetric_difference")
+
+    def find_witness(self):
+        """ 受理する文字列のうち最も短いものを一つ返す(一つも受理しなければNone) """
+        return self.to_DFA().find_witness()
+
+    def is_empty(self):
+        """ 受理する文字列が一つも無いならTrue """
+        return self.find_witness() is None
+
+    def is_subset_of(self, other):
+        """ 自分が受理する文字列を全部otherも受理するならTrue """
+        return self.inclusion_witness(other) is None
+
+    def inclusion_witness(self, other):
+        """ 自分は受理するがotherは受理しない最も短い文字列を返す(無ければNone) """
+        return antichain_inclusion(self, other)
+
+    def distinguishing_string(self, other):
+        """ 自分とotherの片方だけが受理する最も短い文字列を返す(同じ言語ならNone) """
+        witnesses = [witness for witness in (self.inclusion_witness(other), other.inclusion_witness(self)) if witness is not None]
+        return min(witnesses, key=len) if witnesses else None
 
     def __eq__(self, other):
         return self.states == other.states and \
@@ -41,24 +419,136 @@ class Automata(object):
 class DeterministicFiniteAutomata(Automata):
     """ 決定性有限オートマトン """
 
-    def run(self, string):
-        """ stringを認識するかチェックする """
-        state = self.init_state
-        for char in string:
-            if char not in self.alphabet:
-                print("ERROR : invalid character \"%s\"" % char)
-                return False
-            else:
-                state = self.transitions[state][char]
+    __slots__ = ()
+    deterministic = True
+
+    def engine(self):
+        """ runで使う実行器(整数の遷移表にまとめたCompiledDFA)を返す """
+        return self.compile()
+
+    def run_many(self, strings):
+        """ 複数の文字列をまとめて認識し、それぞれの結果のboolを並べたリストを返す """
+        return self.compile().run_many(strings, self.prefilter())
+
+    def to_DFA(self):
+        """ 等価なDFAを返す(自分自身) """
+        return self
+
+    def bitset(self):
+        """ 状態集合を整数のビット列で表して実行するBitsetNFAを返す(一度作ったものは覚えておく) """
+        if "bitset" not in self._cache:
+            transitions = {state: {char: {target} for char, target in trans_dict.items()} for state, trans_dict in self.transitions.items()}
+            nfa = NondeterministicFiniteAutomata(self.states, self.alphabet, transitions, self.init_state, self.final_states)
+            self._cache["bitset"] = BitsetNFA.from_NFA(nfa)
+        return self._cache["bitset"]
+
+    def inclusion_witness(self, other):
+        """ 自分は受理するがotherは受理しない最も短い文字列を返す(無ければNone) """
+        if isinstance(other, DeterministicFiniteAutomata):
+            return self.difference(other).find_witness()
+        return antichain_inclusion(self, other)
+
+    def distinguishing_string(self, other):
+        """ 自分とotherの片方だけが受理する最も短い文字列を返す(同じ言語ならNone) """
+        if not isinstance(other, DeterministicFiniteAutomata):
+            return super().distinguishing_string(other)
+        # 同じ言語かどうかはHopcroft-Karpで調べ、違う時だけ直積で最も短い文字列を探す
+        if hopcroft_karp(self, other):
+            return None
+        return self.symmetric_difference(other).find_witness()
+
+    def save(self, path):
+        """ 整数の遷移表にまとめてpathにバイナリ形式で書き出す(読み込みはCompiledDFA.load) """
+        self.compile().save(path)
+
+    def reversed(self):
+        """ 受理する文字列を逆順にした言語を受理するeNFAを返す """
+        # 元の状態は(0, 状態)にして、新しい始状態1から元の終了状態全部へε遷移する
+        init_state = 1
+        states = {init_state}.union((0, state) for state in self.states)
+        transitions = {state: {} for state in states}
+        transitions[init_state][-1] = set((0, state) for state in self.final_states)
+        for state, trans_dict in self.transitions.items():
+            for char, target in trans_dict.items():
+                transitions[(0, target)].setdefault(char, set()).add((0, state))
+        return NFAWithEpsilonTransition(states, self.alphabet, transitions, init_state, {(0, self.init_state)})
+
+    def compile(self):
+        """ 整数の遷移表にまとめたCompiledDFAを返す(一度作ったものは覚えておく) """
+        if "compiled" not in self._cache:
+            self._cache["compiled"] = CompiledDFA.from_DFA(self)
+        return self._cache["compiled"]
+
+    def step(self, state, char):
+        """ stateからcharを読んだ時の次の状態を返す(遷移が無ければNone) """
+        return self._transitions.compact.lookup(state, char)
+
+    def is_final(self, state):
+        """ stateが受理状態ならTrue """
         return state in self.final_states
 
+    def find_witness(self):
+        """ 受理する文字列のうち最も短いものを一つ返す(一つも受理しなければNone) """
+        # 始状態から幅優先で探し、受理状態が見つかったらすぐにやめる
+        alphabet = sorted(self.alphabet, key=str)
+        parents = {self.init_state: None}
+        queue = deque([self.init_state])
+        while queue:
+            state = queue.popleft()
+            if self.is_final(state):
+                chars = []
+                while parents[state] is not None:
+                    state, char = parents[state]
+                    chars.append(char)
+                return "".join(reversed(chars))
+            for char in alphabet:
+                next_state = self.step(state, char)
+                if next_state is not None and next_state not in parents:
+                    parents[next_state] = (state, char)
+                    queue.append(next_state)
+        return None
+
+    def completed(self, alphabet=None):
+        """ alphabet(省略したら自分のアルファベット)の全部の文字で遷移が定義されたDFAを返す(足りない遷移は行き止まりの状態へ) """
+        alphabet = self.alphabet if alphabet is None else frozenset(alphabet)
+        if alphabet == self.alphabet and all(len(self.transitions.get(state, {})) == len(alphabet) for state in self.states):
+            return self
+        # 行き止まりの状態はstatesとかぶらないように決める
+        sink = -1
+        while sink in self.states:
+            sink -= 1
+        transitions = {sink: {char: sink for char in alphabet}}
+        for state in self.states:
+            trans_dict = self.transitions.get(state, {})
+            transitions[state] = {char: trans_dict.get(char, sink) for char in alphabet}
+        states = self.states.union({sink})
+        return DeterministicFiniteAutomata(states, alphabet, transitions, self.init_state, self.final_states)
+
     def flliped(self):
         """ 受理する言語がひっくり返ったDFAを返す """
         final_states = set([x for x in self.states if x not in self.final_states])
         return DeterministicFiniteAutomata(self.states, self.alphabet, self.transitions, self.init_state, final_states)
 
-    def minimized(self):
-        """ 最小化されたDFAを返す """
+    @Instrument.timed("minimized")
+    def minimized(self, method="hopcroft", progress=None, token=None):
+        """
+        最小化されたDFAを返す
+        method="hopcroft"ならHopcroftの分割細分化(O(n|Σ|log n))、
+        method="table"なら区別できるペアの表を埋める従来のアルゴリズムを使う
+        progress(細分化した回数, 残りの回数の目安)を途中で呼び、tokenが取り消されたらInstrument.Cancelledを投げる
+        """
+        if method == "hopcroft":
+            blocks = self.hopcroft_partition(progress, token)
+        elif method == "table":
+            blocks = self.table_filling_partition(progress, token)
+        else:
+            raise ValueError("unknown minimization method: %s" % method)
+        return self.quotient(blocks)
+
+    def table_filling_partition(self, progress=None, token=None):
+        """ 区別できないペアの表を埋めて状態の同値類のリストを返す(参照用の実装) """
+        observer = Instrument.observer
+        rounds = 0
 
         # markedとunmarkedを初期化
         # markedは区別できるペアの集合
@@ -82,10 +572,15 @@ class DeterministicFiniteAutomata(Automata):
         flag = True
         while flag:
             flag = False
+            rounds += 1
+            if token is not None:
+                token.check()
+            if progress is not None and rounds % Instrument.PROGRESS_INTERVAL == 0:
+                progress(rounds, len(unmarked))
             for p, q in unmarked:
                 for s in self.alphabet:
                     # (p,q)をsで遷移させてmarkedにはいるなら(p,q)もmarkedに入る
-                    if frozenset({self.transitions[p][s], self.transitions[q][s]}) in marked:
+                    if frozenset({self.step(p, s), self.step(q, s)}) in marked:
                         flag = True
                         marked.add(frozenset({p, q}))
                         unmarked.remove(frozenset({p, q}))
@@ -93,7 +588,12 @@ class DeterministicFiniteAutomata(Automata):
                 if flag:
                     break
 
-        # まず最小DFAの状態がどうなるか計算する
+        if observer is not None:
+            observer.count("refinement_rounds", rounds)
+        if progress is not None:
+            progress(rounds, 0)
+
+        # 最小DFAの状態がどうなるか計算する
         states_dict = {}
         for p in self.states:
             states_dict[p] = {p}
@@ -102,238 +602,1123 @@ class DeterministicFiniteAutomata(Automata):
                 if frozenset({p, q}) in unmarked:
                     states_dict[p].add(q)
                     states_dict[q].add(p)
+        return list(set(frozenset(block) for block in states_dict.values()))
+
+    def hopcroft_partition(self, progress=None, token=None):
+        """ Hopcroftの分割細分化で状態の同値類のリストを返す """
+        observer = Instrument.observer
+        rounds = 0
+        # 状態の番号は遷移関数をまとめたCompactTransitionsの番号をそのまま使う
+        compact = self.transitions.compact
+        states = compact.states.objects
+        alphabet = list(self.alphabet)
+
+        # 逆遷移の索引: inverse[c][j]は記号alphabet[c]で状態jに遷移してくる状態番号のリスト
+        inverse = []
+        for char in alphabet:
+            inv = [[] for _ in states]
+            for i, j in enumerate(compact.column(char)):
+                if j < 0:
+                    raise KeyError((states[i], char))
+                inv[j].append(i)
+            inverse.append(inv)
+
+        # 初期分割は受理状態とそれ以外
+        finals = set(i for i, state in enumerate(states) if state in self.final_states)
+        others = set(range(len(states))) - finals
+        blocks = [block for block in (finals, others) if block]
+        block_of = [0] * len(states)
+        for b, block in enumerate(blocks):
+            for i in block:
+                block_of[i] = b
+
+        # 待ち行列には(ブロック番号, 記号番号)の組を入れる
+        # 最初は小さい方のブロックだけを入れれば十分
+        waiting = set()
+        if len(blocks) == 2:
+            smaller = 0 if len(blocks[0]) <= len(blocks[1]) else 1
+            waiting = set((smaller, c) for c in range(len(alphabet)))
+        while waiting:
+            splitter, c = waiting.pop()
+            inv = inverse[c]
+            rounds += 1
+            if token is not None:
+                token.check()
+            if progress is not None and rounds % Instrument.PROGRESS_INTERVAL == 0:
+                progress(rounds, len(waiting))
+
+            # splitterに遷移してくる状態をブロックごとに集める
+            touched = {}
+            for j in blocks[splitter]:
+                for i in inv[j]:
+                    touched.setdefault(block_of[i], set()).add(i)
+
+            for b, hit in touched.items():
+                if len(hit) == len(blocks[b]):
+                    continue
+                # ブロックbをhitとそれ以外に分割する
+                blocks[b] -= hit
+                new = len(blocks)
+                blocks.append(hit)
+                for i in hit:
+                    block_of[i] = new
+                for d in range(len(alphabet)):
+                    if (b, d) in waiting or len(hit) <= len(blocks[b]):
+                        waiting.add((new, d))
+                    else:
+                        waiting.add((b, d))
+
+        if observer is not None:
+            observer.count("refinement_rounds", rounds)
+            observer.count("block_splits", len(blocks) - 2 if len(blocks) >= 2 else 0)
+        if progress is not None:
+            progress(rounds, 0)
+        return [frozenset(states[i] for i in block) for block in blocks]
+
+    def quotient(self, blocks):
+        """ 状態の同値類のリストblocksで状態をまとめたDFAを返す """
+        block_of = {}
+        for block in blocks:
+            for state in block:
+                block_of[state] = block
 
-        # 次にstates_dictからtransitions, init_state, final_statesを作る
-        states = set()
-        init_state = None
-        final_states = set()
         transitions = {}
-        for p in self.states:
-            state = frozenset(states_dict[p])
-            if state in states:
-                continue
-            states.add(state)
-            transitions[state] = {}
+        final_states = set()
+        for block in blocks:
+            # next(iter(X))は「Xから適当に一つ取る」という意味
+            representative = next(iter(block))
+            transitions[block] = {}
             for s in self.alphabet:
-                # next(iter(X))は「Xから適当に一つ取る」という意味
-                transitions[state][s] = states_dict[self.transitions[next(iter(state))][s]]
-            if self.init_state in state:
-                init_state = state
-            if len(self.final_states.intersection(state)) != 0:
-                final_states.add(state)
-        alphabet = self.alphabet
-        return DeterministicFiniteAutomata(states, alphabet, transitions, init_state, final_states)
+                transitions[block][s] = block_of[self.step(representative, s)]
+            if representative in self.final_states:
+                final_states.add(block)
+        init_state = block_of[self.init_state]
+        return DeterministicFiniteAutomata(blocks, self.alphabet, transitions, init_state, final_states)
+
+
+class ExploringDFA(DeterministicFiniteAutomata):
+    """
+    状態と遷移を必要になった時に始状態からstepでたどって作るDFAの基底クラス(サブクラスはstepとis_finalを定義する)
+    states, transitions, final_statesを使うと行ける状態を全部作る
+    """
+
+    def __init__(self, alphabet, init_state):
+        # Automata.__init__は呼ばずに、状態と遷移は必要になった時に作る
+        self._cache = {}
+        self._transitions = None
+        self._states = None
+        self._final_states = None
+        self.alphabet = frozenset(alphabet)
+        self.init_state = init_state
+
+    def explore(self):
+        """ 始状態から行ける状態を全部作ってstates, transitions, final_statesを決める """
+        alphabet = sorted(self.alphabet, key=str)
+        transitions = {self.init_state: {}}
+        to_search = [self.init_state]
+        while to_search:
+            state = to_search.pop()
+            for char in alphabet:
+                next_state = self.step(state, char)
+                transitions[state][char] = next_state
+                if next_state not in transitions:
+                    transitions[next_state] = {}
+                    to_search.append(next_state)
+        self._states = frozenset(transitions)
+        self._transitions = TransitionView(CompactTransitions(transitions, self._states, True))
+        self._final_states = frozenset(state for state in transitions if self.is_final(state))
+
+    @property
+    def transitions(self):
+        """ 遷移関数(行ける状態を全部作る) """
+        if self._transitions is None:
+            self.explore()
+        return self._transitions
+
+    @property
+    def states(self):
+        """ 状態の集合(行ける状態を全部作る) """
+        if self._states is None:
+            self.explore()
+        return self._states
+
+    @property
+    def final_states(self):
+        """ 受理状態の集合(行ける状態を全部作る) """
+        if self._final_states is None:
+            self.explore()
+        return self._final_states
+
+
+class ProductDFA(ExploringDFA):
+    """
+    二つのDFA leftとrightの直積のDFA
+    状態は(leftの状態, rightの状態)の組で、遷移が無い側はNone(行き止まり)にする
+    始状態の組から行ける組だけを必要になった時に作るので、find_witnessやis_emptyは受理状態の組が見つかった所でやめる
+    """
+
+    # 組が受理状態かどうかを(leftで受理, rightで受理)から決める関数
+    OPERATIONS = {
+        "intersection": lambda left, right: left and right,
+        "union": lambda left, right: left or right,
+        "difference": lambda left, right: left and not right,
+        "symmetric_difference": lambda left, right: left != right,
+    }
+
+    def __init__(self, left, right, operation):
+        if operation not in ProductDFA.OPERATIONS:
+            raise ValueError("unknown operation: %s" % operation)
+        self.left = left
+        self.right = right
+        self.operation = operation
+        self.accept = ProductDFA.OPERATIONS[operation]
+        super().__init__(left.alphabet.union(right.alphabet), self.normalize((left.init_state, right.init_state)))
+
+    def normalize(self, state):
+        """ 片方が行き止まりで、もう片方に関係なく受理されないと決まる組は(None, None)にまとめる """
+        left, right = state
+        if left is None and not (self.accept(False, True) or self.accept(False, False)):
+            return (None, None)
+        if right is None and not (self.accept(True, False) or self.accept(False, False)):
+            return (None, None)
+        return state
+
+    def step(self, state, char):
+        """ 組stateからcharを読んだ時の次の組を返す """
+        left, right = state
+        left = None if left is None else self.left.step(left, char)
+        right = None if right is None else self.right.step(right, char)
+        return self.normalize((left, right))
+
+    def is_final(self, state):
+        """ 組stateが受理状態ならTrue """
+        left, right = state
+        return self.accept(left is not None and self.left.is_final(left), right is not None and self.right.is_final(right))
+
+
+def hopcroft_karp(left, right):
+    """
+    DFAのleftとrightが同じ言語を受理するならTrue
+    同じ文字列で行く状態の組をunion-findでまとめていき、受理するかが違う組が見つかった所でやめる
+    """
+    alphabet = sorted(left.alphabet.union(right.alphabet), key=str)
+    automaton = (left, right)
+    # 状態は(0か1, 元の状態)にして左右を区別し、遷移が無い時の元の状態はNone(行き止まり)にする
+    parent = {}
+
+    def find(state):
+        root = state
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while parent.get(state, state) != root:
+            parent[state], state = root, parent[state]
+        return root
+
+    def step(state, char):
+        side, original = state
+        return side, None if original is None else automaton[side].step(original, char)
+
+    def is_final(state):
+        side, original = state
+        return original is not None and automaton[side].is_final(original)
+
+    pair = ((0, left.init_state), (1, right.init_state))
+    parent[pair[0]] = pair[1]
+    queue = deque([pair])
+    while queue:
+        x, y = queue.popleft()
+        if is_final(x) != is_final(y):
+            return False
+        for char in alphabet:
+            next_x, next_y = step(x, char), step(y, char)
+            root_x, root_y = find(next_x), find(next_y)
+            if root_x != root_y:
+                parent[root_x] = root_y
+                queue.append((next_x, next_y))
+    return True
+
+
+def antichain_inclusion(left, right):
+    """
+    leftは受理するがrightは受理しない最も短い文字列を返す(無ければNone)
+    leftの状態pと、同じ文字列でrightが行ける状態集合Sの組(p, S)を幅優先で調べる
+    (p, S')でS'⊆Sの組を既に見ていれば(p, S)は調べなくてよいので、pごとに極小なSだけを覚えておく(antichain)
+    rightの部分集合構成を全部することは無い
+    """
+    nfa, other = left.bitset(), right.bitset()
+    alphabet = sorted(left.alphabet, key=str)
+    antichain = {}
+    parents = {}
+    queue = deque()
+
+    def witness(pair):
+        chars = []
+        while parents[pair] is not None:
+            pair, char = parents[pair]
+            chars.append(char)
+        return "".join(reversed(chars))
+
+    def push(pair, parent):
+        """ 組pairを調べる組に加え、leftだけが受理する組ならTrueを返す """
+        p, mask = pair
+        masks = antichain.setdefault(p, [])
+        if any(smaller & ~mask == 0 for smaller in masks):
+            return False
+        masks[:] = [larger for larger in masks if mask & ~larger != 0]
+        masks.append(mask)
+        parents[pair] = parent
+        queue.append(pair)
+        return nfa.final_mask >> p & 1 and not other.is_final(mask)
+
+    # 幅優先で加えた順に調べるので、最初に見つかった組への文字列が最も短い
+    for pair in ((p, other.init_state) for p in range(len(nfa.states)) if nfa.init_state >> p & 1):
+        if push(pair, None):
+            return witness(pair)
+    while queue:
+        pair = queue.popleft()
+        p, mask = pair
+        if mask not in antichain[p]:
+            # もっと小さい集合の組が後から見つかったので調べなくてよい
+            continue
+        for char in alphabet:
+            next_mask = other.next_states(mask, char) if char in other.masks else 0
+            targets = nfa.masks[char][p]
+            while targets:
+                low = targets & -targets
+                targets ^= low
+                next_pair = (low.bit_length() - 1, next_mask)
+                if push(next_pair, (pair, char)):
+                    return witness(next_pair)
+    return None
+
+
+def equivalent(left, right):
+    """ leftとrightが同じ言語を受理するならTrue(違う時に片方だけが受理する最も短い文字列はdistinguishing_stringで分かる) """
+    return left.distinguishing_string(right) is None
+
+
+# advanceで行き止まりの状態か受理し続ける状態に入ったかを確かめる間隔(文字数)
+SINK_CHECK_INTERVAL = 256
+
+# chunk_mappingで、この文字数を読む間に読み始めの状態が一つもまとまらなければ表を作るのをあきらめる
+MERGE_WINDOW = 64
+
+# アルファベットに無い文字を読んだ時の扱い
+#     "reject": その文字列を受理しない(advanceはNoneを返す)
+#     "raise" : InvalidSymbolErrorを投げる
+#     "dead"  : 行き止まりの状態に移ったとみなす(受理しないのは"reject"と同じだが、advanceは行き止まりの状態を返す)
+INVALID_POLICIES = ("reject", "raise", "dead")
+
+
+class InvalidSymbolError(ValueError):
+    """ アルファベットに無い文字を読んだ(positionは読んだ文字列の中の位置) """
+
+    def __init__(self, symbol, position):
+        super().__init__("invalid symbol %r at %d" % (symbol, position))
+        self.symbol = symbol
+        self.position = position
+
+
+def invalid_symbol(policy, symbol, position, dead=None):
+    """ アルファベットに無い文字symbolをpolicyに従って扱い、advanceが返す状態を返す(deadは行き止まりの状態) """
+    if policy == "reject":
+        return None
+    if policy == "dead":
+        return dead
+    if policy == "raise":
+        raise InvalidSymbolError(symbol, position)
+    raise ValueError("unknown invalid symbol policy: %s" % policy)
+
+
+def first_invalid(chars, start, symbols):
+    """ chars[start:]の中でsymbolsに無い最初の文字の位置を返す(無ければNone) """
+    for position in range(start, len(chars)):
+        if chars[position] not in symbols:
+            return position
+    return None
+
+
+class CompiledDFA(object):
+    """
+    状態を0から始まる整数に振り直し、遷移を一次元の整数配列にまとめたDFA
+    どの状態でも同じ遷移をする記号は一つの同値類にまとめ、列は同値類ごとに一つだけ持つ
+    状態sで列番号cの同値類の記号を読んだ時の遷移先はtable[s * width + c]
+    """
+
+    # saveで書き出すファイルの形式(数値はすべてリトルエンディアン)
+    #     ヘッダ      : マジックナンバー, 版, フラグ, 状態数, 列数, 始状態, 記号表のバイト数
+    #     記号表      : 区間の数(4バイト), 区間ごとに(最初の文字コード, 最後の文字コード, 列番号)(4バイトずつ)、
+    #                   続いて記号ごとに(UTF-8のバイト数(2バイト), 列番号(4バイト), UTF-8のバイト列)、4バイト境界まで0で埋める
+    #     遷移表      : 状態数 * 列数 個のint32
+    #     受理状態    : (状態数 + 7) // 8 バイトのビットマップ
+    #     sink_states : フラグにFLAG_SINKSがあれば、状態ごとに1バイト(UNDECIDED, DEAD, ACCEPTING_SINKのどれか)
+    # 版1の記号表は列番号の順に(UTF-8のバイト数(2バイト), UTF-8のバイト列)を並べたもの(読み込みだけできる)
+    MAGIC = b"ADFA"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHHIIII")
+    FLAG_SINKS = 1
+
+    # sink_statesで各状態に付ける印
+    #     UNDECIDED     : この後読む文字列で結果が変わる
+    #     DEAD          : 受理状態に行けない(この後何を読んでも受理しない)
+    #     ACCEPTING_SINK: 行ける状態が全部受理状態(この後何を読んでも受理する)
+    UNDECIDED = 0
+    DEAD = 1
+    ACCEPTING_SINK = 2
+
+    def __init__(self, symbols, table, accepting, init_state=0, states=None, width=None):
+        # symbolsは記号から列番号への辞書(CharRangesのラベルがあればSymbolClasses)
+        # 同値類にまとめた記号は同じ列番号になるので、widthは列数(Noneなら列番号の種類の数)
+        self.symbols = symbols
+        self.width = len(set(CompiledDFA.labels_of(symbols).values())) if width is None else width
+        self.table = table
+        # sizeは状態数(アルファベットが空なら始状態しか無い)
+        self.size = len(table) // self.width if self.width else 1
+        # acceptingは受理状態のビットマップ(状態sはaccepting[s >> 3]の(s & 7)ビット目)
+        self.accepting = accepting
+        self.init_state = init_state
+        # statesは番号から元のDFAの状態への対応(無ければNone)
+        self.states = states
+        # 必要になった時に作る表
+        self._sinks = None
+        self._live = None
+        self._arrays = None
+        self._region = None
+
+    @staticmethod
+    def labels_of(symbols):
+        """ 記号表symbolsのラベル(記号かCharRanges)から列番号への辞書を返す """
+        return symbols.labels if isinstance(symbols, SymbolClasses) else symbols
+
+    def labels(self):
+        """ ラベル(記号かCharRanges)から列番号への辞書を返す """
+        return CompiledDFA.labels_of(self.symbols)
+
+    @staticmethod
+    @Instrument.timed("compile")
+    def from_DFA(dfa):
+        """
+        DFAの始状態から到達できる状態だけを幅優先で番号付けしてCompiledDFAを作る
+        どの状態でも同じ遷移先になる記号は同じ列にまとめる
+        """
+        alphabet = sorted(dfa.alphabet, key=str)
+
+        # 始状態が0番になるように幅優先で番号を振る
+        # 遷移が定義されていない所は新しく作った行き止まりの状態に飛ばす
+        states = [dfa.init_state]
+        index = {dfa.init_state: 0}
+        table = array("i")
+        sink = None
+        i = 0
+        while i < len(states):
+            trans_dict = dfa.transitions.get(states[i], {}) if i != sink else {}
+            for char in alphabet:
+                if char in trans_dict:
+                    target = trans_dict[char]
+                    if target not in index:
+                        index[target] = len(states)
+                        states.append(target)
+                    table.append(index[target])
+                else:
+                    if sink is None:
+                        sink = len(states)
+                        states.append(None)
+                    table.append(sink)
+            i += 1
+
+        accepting = bytearray((len(states) + 7) // 8)
+        for i, state in enumerate(states):
+            if i != sink and state in dfa.final_states:
+                accepting[i >> 3] |= 1 << (i & 7)
+
+        # 列の中身が同じ記号を同じ同値類にし、同値類ごとに最初の記号の列だけを残す
+        width = len(alphabet)
+        classes = {}
+        labels = {char: classes.setdefault(table[column::width].tobytes(), len(classes)) for column, char in enumerate(alphabet)}
+        if len(classes) < width:
+            first = {}
+            for column, char in enumerate(alphabet):
+                first.setdefault(labels[char], column)
+            table = array("i", chain.from_iterable(zip(*[table[column::width] for column in first.values()])))
+        if any(isinstance(char, CharRanges) for char in alphabet):
+            symbols = SymbolClasses(labels)
+        else:
+            symbols = labels
+        compiled = CompiledDFA(symbols, table, accepting, 0, states, len(classes))
+        # 読み込んだ時や共有メモリにつないだ時に調べ直さなくてよいように、表を作る時に調べておく
+        compiled.sink_states()
+        return compiled
+
+    def save(self, path):
+        """ pathにバイナリ形式で書き出す(記号は文字列かCharRangesでなければならない) """
+        labels = sorted(self.labels().items(), key=lambda item: (item[1], str(item[0])))
+        if not all(isinstance(label, (str, CharRanges)) for label, _ in labels):
+            raise TypeError("only str symbols can be saved")
+        spans = [(start, end, column) for label, column in labels if isinstance(label, CharRanges) for start, end in label.ranges()]
+        encoded = struct.pack("<I", len(spans)) + b"".join(struct.pack("<III", *span) for span in spans)
+        for label, column in labels:
+            if isinstance(label, str):
+                data = label.encode("utf-8")
+                encoded += struct.pack("<HI", len(data), column) + data
+        table = array("i", self.table)
+        if sys.byteorder == "big":
+            table.byteswap()
+        sinks = self.sink_states()
+        with open(path, "wb") as file:
+            file.write(CompiledDFA.HEADER.pack(CompiledDFA.MAGIC, CompiledDFA.VERSION, CompiledDFA.FLAG_SINKS, self.size, self.width, self.init_state, len(encoded)))
+            file.write(encoded)
+            file.write(b"\0" * (-len(encoded) % 4))
+            file.write(table.tobytes())
+            file.write(bytes(self.accepting[:(self.size + 7) // 8]))
+            file.write(bytes(sinks))
+
+    @staticmethod
+    def load(path, mmap=True, validate=False):
+        """
+        saveで書き出したファイルを読み込む
+        mmap=Trueならファイルをメモリに写像し、遷移表と受理状態とsink_statesはそのmemoryviewを直接使う
+        (状態ごとのオブジェクトは作らず、同じファイルを読む複数のプロセスでページを共有できる)
+        ヘッダや長さが合わなかったり、始状態が状態の数を超えていたりすればValueError
+        validate=Trueなら、遷移先とsink_statesも全部調べ、範囲を超えていればValueError
+        (全部の要素を読むので、信頼できないファイルを読む時だけ使う)
+        """
+        with open(path, "rb") as file:
+            if mmap:
+                region = memory_map(file.fileno(), 0, access=ACCESS_READ)
+                data = memoryview(region)
+            else:
+                region = None
+                data = memoryview(file.read())
+        views = [data]
+        try:
+            if len(data) < CompiledDFA.HEADER.size:
+                raise ValueError("not a compiled DFA file: %s" % path)
+            magic, version, flags, size, width, init_state, symbols_length = CompiledDFA.HEADER.unpack_from(data, 0)
+            if magic != CompiledDFA.MAGIC:
+                raise ValueError("not a compiled DFA file: %s" % path)
+            if version not in (1, CompiledDFA.VERSION):
+                raise ValueError("unsupported compiled DFA version %d: %s" % (version, path))
+
+            labels = {}
+            offset = CompiledDFA.HEADER.size
+            end = offset + symbols_length
+            if version == 1:
+                while offset < end:
+                    (length,) = struct.unpack_from("<H", data, offset)
+                    labels[bytes(data[offset + 2:offset + 2 + length]).decode("utf-8")] = len(labels)
+                    offset += 2 + length
+            elif offset < end:
+                (count,) = struct.unpack_from("<I", data, offset)
+                offset += 4
+                ranges = {}
+                for _ in range(count):
+                    start, last, column = struct.unpack_from("<III", data, offset)
+                    ranges.setdefault(column, []).append((start, last))
+                    offset += 12
+                labels.update((CharRanges(pairs), column) for column, pairs in ranges.items())
+                while offset < end:
+                    length, column = struct.unpack_from("<HI", data, offset)
+                    labels[bytes(data[offset + 6:offset + 6 + length]).decode("utf-8")] = column
+                    offset += 6 + length
+            offset = end + (-symbols_length % 4)
+            symbols = SymbolClasses(labels) if any(isinstance(label, CharRanges) for label in labels) else labels
+
+            table_end = offset + size * width * 4
+            accepting_end = table_end + (size + 7) // 8
+            sinks_end = accepting_end + size if flags & CompiledDFA.FLAG_SINKS else accepting_end
+            if len(data) < sinks_end or any(column >= width for column in labels.values()):
+                raise ValueError("truncated compiled DFA file: %s" % path)
+            if init_state >= size:
+                raise ValueError("initial state %d out of range in compiled DFA file: %s" % (init_state, path))
+            if mmap and sys.byteorder == "little" and array("i").itemsize == 4:
+                table = data[offset:table_end].cast("i")
+                views.append(table)
+            else:
+                table = array("i")
+                table.frombytes(data[offset:table_end])
+                if sys.byteorder == "big":
+                    table.byteswap()
+            if validate and len(table) and (min(table) < 0 or max(table) >= size):
+                raise ValueError("transition out of range in compiled DFA file: %s" % path)
+            sinks = data[accepting_end:sinks_end] if flags & CompiledDFA.FLAG_SINKS else None
+            if sinks is not None:
+                views.append(sinks)
+                if validate and size and max(sinks) > CompiledDFA.ACCEPTING_SINK:
+                    raise ValueError("invalid sink state in compiled DFA file: %s" % path)
+            compiled = CompiledDFA(symbols, table, data[table_end:accepting_end], init_state, width=width)
+            compiled._sinks = sinks
+            views = None
+        except struct.error:
+            raise ValueError("truncated compiled DFA file: %s" % path) from None
+        finally:
+            # 読み込めなかった時は写像したメモリを閉じる(使っているmemoryviewを先に解放しないと閉じられない)
+            if views is not None:
+                for view in reversed(views):
+                    view.release()
+                if region is not None:
+                    region.close()
+        # 写像したメモリは読み込んだCompiledDFAが生きている間は開いておく
+        compiled._region = region
+        return compiled
+
+    def share(self):
+        """
+        遷移表と受理状態(分かっていればsink_statesも)を共有メモリにコピーし、(SharedMemory, attachに渡す引数のタプル)を返す
+        使い終わったら返したSharedMemoryのcloseとunlinkを呼ぶ
+        """
+        table_bytes = self.size * self.width * 4
+        accepting_bytes = (self.size + 7) // 8
+        sinks_bytes = self.size if self._sinks is not None else 0
+        memory = SharedMemory(create=True, size=table_bytes + accepting_bytes + sinks_bytes)
+        memory.buf[:table_bytes] = array("i", self.table).tobytes()
+        memory.buf[table_bytes:table_bytes + accepting_bytes] = bytes(self.accepting[:accepting_bytes])
+        if sinks_bytes:
+            memory.buf[table_bytes + accepting_bytes:table_bytes + accepting_bytes + sinks_bytes] = bytes(self._sinks)
+        return memory, (memory.name, self.size, self.width, self.symbols, self.init_state, bool(sinks_bytes))
+
+    @staticmethod
+    def attach(name, size, width, symbols, init_state, sinks=False):
+        """
+        shareで作った共有メモリnameの遷移表と受理状態をコピーせずに使うCompiledDFAを返す
+        sinksがTrueなら、共有メモリに置いたsink_statesもそのまま使う
+        """
+        memory = SharedMemory(name=name)
+        table_end = size * width * 4
+        accepting_end = table_end + (size + 7) // 8
+        table = memory.buf[:table_end].cast("i")
+        compiled = CompiledDFA(symbols, table, memory.buf[table_end:accepting_end], init_state, width=width)
+        if sinks:
+            compiled._sinks = memory.buf[accepting_end:accepting_end + size]
+        # 共有メモリは読み込んだCompiledDFAが生きている間は開いておく
+        compiled._region = memory
+        return compiled
+
+    @contextmanager
+    def shared_pool(self, workers):
+        """ 遷移表を共有メモリに置き、それにつないだworkers個のプロセスのPoolを返すコンテキストマネージャ """
+        memory, arguments = self.share()
+        try:
+            with multiprocessing.Pool(workers, _attach_shared, (arguments,)) as pool:
+                yield pool
+        finally:
+            memory.close()
+            memory.unlink()
+
+    def match_parallel(self, strings, workers=None, chunksize=256, prefilter=None):
+        """
+        複数の文字列をworkers個のプロセス(NoneならCPUの数)で分けて認識し、結果のboolを入力の順番に一つずつ返す
+        遷移表は一度だけ共有メモリに置き、各プロセスはそれを直接読む(オートマトン自体はpickleしない)
+        文字列はchunksize個ずつまとめて送り、アルファベットに無い文字を含む文字列は受理しない
+        prefilter(Prefilter)があれば、当てはまらない文字列は送らずにFalseにする
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if not prefilter:
+            prefilter = None
+        if workers <= 1:
+            for string in strings:
+                yield (prefilter is None or prefilter.may_match(string)) and self.run(string)
+            return
+        strings = iter(strings)
+        chunks = iter(lambda: list(islice(strings, chunksize)), [])
+        # 送ったまとまりごとのprefilterの結果(imapは別のスレッドでまとまりを作るので、結果より先に積まれる)
+        passes = deque()
+
+        def filtered(chunks):
+            for chunk in chunks:
+                passed = [prefilter.may_match(string) for string in chunk]
+                passes.append(passed)
+                yield [string for string, flag in zip(chunk, passed) if flag]
+
+        with self.shared_pool(workers) as pool:
+            for results in pool.imap(_match_shared, chunks if prefilter is None else filtered(chunks)):
+                if prefilter is None:
+                    for result in results:
+                        yield result == 1
+                    continue
+                results = iter(results)
+                for flag in passes.popleft():
+                    yield flag and next(results) == 1
+
+    def chunk_mapping(self, chunk, window=MERGE_WINDOW):
+        """
+        どの状態から読み始めてもchunkを読んだ後の状態が分かる表(添字が読み始めの状態番号)を返す
+        アルファベットに無い文字があればNone
+        全部の状態を同時に進め、行き先が同じになった状態はまとめて一つとして進める
+        (多くのDFAは少し読むと始めの状態を忘れるので、一つにまとまった後は普通に一本だけ進めるのと同じ)
+        window文字読む間に一つもまとまらなければ、一本だけ読むより状態の数倍遅くなるのであきらめて空のリストを返す
+        """
+        table = self.table
+        symbols = self.symbols
+        width = self.width
+        # sink_statesが分かっていなければ行き止まりの状態はまとめない(ここで調べると全部の遷移をたどることになる)
+        sinks = self._sinks
+        dead = self.dead_state() if sinks is not None else None
+        # origin[s]は状態sから読み始めたものが今distinctの何番目にいるか
+        origin = list(range(self.size))
+        distinct = list(origin)
+        tracked = len(distinct)
+        for i, char in enumerate(chunk):
+            column = symbols.get(char)
+            if column is None:
+                return None
+            distinct = [table[state * width + column] for state in distinct]
+            checkpoint = (i + 1) % window == 0
+            if checkpoint and dead is not None:
+                # 行き止まりの状態はどれも同じなので一つにまとめてから数える
+                distinct = [dead if sinks[state] == CompiledDFA.DEAD else state for state in distinct]
+            index = {}
+            renumber = [index.setdefault(state, len(index)) for state in distinct]
+            if len(index) < len(distinct):
+                origin = [renumber[j] for j in origin]
+                distinct = list(index)
+                if len(distinct) == 1:
+                    state = self.advance(distinct[0], chunk[i + 1:])
+                    return None if state is None else [state] * self.size
+            if checkpoint:
+                if len(distinct) >= tracked:
+                    return []
+                tracked = len(distinct)
+        return [distinct[j] for j in origin]
+
+    def run_parallel(self, string, workers=None, chunk_size=None):
+        """
+        一つの長いstringをchunk_size文字ずつ(Noneならworkers * 4個ほどに)分け、workers個のプロセスで同時に読んで認識する
+        最初の部分は始状態から普通に読み、残りの部分は各状態から読んだ後の状態の表(chunk_mapping)を作って
+        左から順に合成するので、結果はrunと同じ(アルファベットに無い文字があればFalse)
+        読み始めの状態がまとまらず表を作るのをあきらめた部分は、ここで普通に読む
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if chunk_size is None:
+            chunk_size = max(1, -(-len(string) // (workers * 4)))
+        if workers <= 1 or len(string) <= chunk_size:
+            return self.run(string)
+        starts = range(chunk_size, len(string), chunk_size)
+        chunks = (string[start:start + chunk_size] for start in starts)
+        with self.shared_pool(workers) as pool:
+            # 最初の部分は他のプロセスが表を作っている間にここで読む
+            results = pool.imap(_chunk_mapping_shared, chunks)
+            state = self.advance(self.init_state, string[:chunk_size])
+            for start, mapping in zip(starts, results):
+                if state is None or mapping is None:
+                    return False
+                state = mapping[state] if mapping else self.advance(state, string[start:start + chunk_size])
+        return state is not None and self.is_final(state)
+
+    def to_DFA(self):
+        """ 番号をそのまま状態とするDeterministicFiniteAutomataに戻す(そのcompile()は自分を返す) """
+        transitions = {}
+        for state in range(self.size):
+            row = state * self.width
+            transitions[state] = {char: self.table[row + column] for char, column in self.labels().items()}
+        final_states = [state for state in range(self.size) if self.is_final(state)]
+        dfa = DeterministicFiniteAutomata(range(self.size), self.labels(), transitions, self.init_state, final_states)
+        dfa._cache["compiled"] = self
+        return dfa
+
+    def is_final(self, state):
+        """ 番号stateの状態が受理状態ならTrue """
+        return (self.accepting[state >> 3] >> (state & 7)) & 1 == 1
+
+    def sink_states(self):
+        """
+        状態ごとにUNDECIDED, DEAD, ACCEPTING_SINKのどれかを並べたbytearray(読み込んだものならmemoryview)を返す
+        受理状態からと受理しない状態からそれぞれ遷移を逆にたどり、どちらにも行けるかを調べる
+        from_DFAで作った時とsaveで書き出したファイルを読み込んだ時は分かっているので、調べ直さない
+        """
+        if self._sinks is None:
+            size = self.size
+            width = self.width
+            inverse = [[] for _ in range(size)]
+            for state in range(size):
+                for target in set(self.table[state * width:(state + 1) * width]):
+                    inverse[target].append(state)
+
+            def backward(final):
+                # is_final(state) == finalの状態に行ける状態に1を立てたbytearrayを返す
+                found = bytearray(size)
+                to_search = [state for state in range(size) if self.is_final(state) == final]
+                for state in to_search:
+                    found[state] = 1
+                while to_search:
+                    for source in inverse[to_search.pop()]:
+                        if not found[source]:
+                            found[source] = 1
+                            to_search.append(source)
+                return found
+            accepts = backward(True)
+            rejects = backward(False)
+            self._sinks = bytearray(CompiledDFA.DEAD if not accepts[state] else CompiledDFA.ACCEPTING_SINK if not rejects[state] else CompiledDFA.UNDECIDED
+                                    for state in range(size))
+        return self._sinks
+
+    def live_states(self):
+        """ 受理状態に行ける状態なら1、行けない(行き止まりの)状態なら0を並べたbytearrayを返す """
+        if self._live is None:
+            self._live = bytearray(sink != CompiledDFA.DEAD for sink in self.sink_states())
+        return self._live
+
+    def is_dead(self, state):
+        """ 番号stateの状態から受理状態に行けない(この後何を読んでも受理しない)ならTrue """
+        return self.sink_states()[state] == CompiledDFA.DEAD
+
+    def dead_state(self):
+        """ 行き止まりの状態の番号を一つ返す(無ければNone) """
+        state = bytes(self.sink_states()).find(CompiledDFA.DEAD)
+        return state if state >= 0 else None
+
+    def run(self, string, invalid="reject"):
+        """ stringを認識するかチェックする(アルファベットに無い文字はinvalidに従って扱う) """
+        state = self.advance(self.init_state, string, invalid)
+        if Instrument.observer is not None:
+            Instrument.observer.count("run_chars", len(string))
+        return state is not None and self.is_final(state)
+
+    def advance(self, state, string, invalid="reject"):
+        """
+        番号stateの状態からstringを読んだ後の状態を返す(アルファベットに無い文字はinvalidに従って扱う)
+        sink_statesが分かっていれば、SINK_CHECK_INTERVAL文字ごとに、行き止まりの状態か受理し続ける状態に入ったかを確かめ、入っていたら残りは遷移させない
+        (受理し続ける状態か、invalidが"raise"なら、残りにアルファベットに無い文字が無いかだけを確かめる)
+        その時は読むのをやめた所の状態を返すので、本当の最後の状態とは違うことがあるがこの後の結果は同じ
+        sink_statesが分かっていない(sink_statesの無いファイルから読み込んだ)時は、ここでは調べずに最後まで遷移させる
+        """
+        table = self.table
+        symbols = self.symbols
+        width = self.width
+        sinks = self._sinks
+        interval = SINK_CHECK_INTERVAL if sinks is not None else max(len(string), 1)
+        start = 0
+        while start < len(string):
+            sink = sinks[state] if sinks is not None else CompiledDFA.UNDECIDED
+            if sink != CompiledDFA.UNDECIDED:
+                if sink == CompiledDFA.ACCEPTING_SINK or invalid == "raise":
+                    position = first_invalid(string, start, symbols)
+                    if position is not None:
+                        return invalid_symbol(invalid, string[position], position, self.dead_state())
+                return state
+            chunk = string[start:start + interval]
+            try:
+                for char in chunk:
+                    state = table[state * width + symbols[char]]
+            except KeyError:
+                return invalid_symbol(invalid, char, start + chunk.index(char), self.dead_state() if invalid == "dead" else None)
+            start += interval
+        return state
+
+    def run_many(self, strings, prefilter=None):
+        """
+        複数の文字列をまとめて認識し、それぞれの結果のboolを並べたリストを返す(NumPyがあっても無くても同じ)
+        NumPyがあれば全部の文字列を一文字ずつ同時に遷移させる(無ければ一つずつrunする)
+        アルファベットに無い文字を含む文字列は受理しない
+        prefilter(Prefilter)があれば、当てはまらない文字列は遷移させずにFalseにする
+        """
+        strings = list(strings)
+        if prefilter:
+            passed = [i for i, string in enumerate(strings) if prefilter.may_match(string)]
+            result = [False] * len(strings)
+            for i, accepted in zip(passed, self.run_many([strings[i] for i in passed])):
+                result[i] = accepted
+            return result
+        if numpy is None or not all(isinstance(char, CharRanges) or isinstance(char, str) and len(char) == 1 for char in self.labels()):
+            return [self.run(string) for string in strings]
+        if not strings:
+            return []
+        table, accepting, lookup = self._numpy_tables()
+        width = self.width + 1
+
+        # 全部の文字列をつなげて列番号の配列にし、各文字列の開始位置を覚えておく
+        lengths = numpy.fromiter((len(string) for string in strings), dtype=numpy.int64, count=len(strings))
+        points = numpy.frombuffer("".join(strings).encode("utf-32-le"), dtype=numpy.uint32)
+        columns = lookup[numpy.minimum(points, len(lookup) - 1)]
+        offsets = numpy.zeros(len(strings), dtype=numpy.int64)
+        numpy.cumsum(lengths[:-1], out=offsets[1:])
+
+        # 長い順に並べると、j文字目を読む文字列は常に先頭の何個かになる
+        order = numpy.argsort(-lengths, kind="stable")
+        offsets = offsets[order]
+        negative_lengths = -lengths[order]
+        states = numpy.full(len(strings), self.init_state, dtype=numpy.int64)
+        for j in range(int(-negative_lengths[0])):
+            active = int(numpy.searchsorted(negative_lengths, -j, side="left"))
+            states[:active] = table[states[:active] * width + columns[offsets[:active] + j]]
+
+        result = numpy.empty(len(strings), dtype=bool)
+        result[order] = accepting[states]
+        return result.tolist()
+
+    def _numpy_tables(self):
+        """
+        run_many用のNumPy配列(遷移表, 受理状態, 文字コードから列番号への表)を返す
+        遷移表にはアルファベットに無い文字の列と、そこから飛ぶ行き止まりの状態を一つずつ足してある
+        """
+        if self._arrays is None:
+            size = self.size
+            table = numpy.full((size + 1, self.width + 1), size, dtype=numpy.int64)
+            table[:size, :self.width] = numpy.frombuffer(self.table, dtype=numpy.int32).reshape(size, self.width)
+            accepting = numpy.zeros(size + 1, dtype=bool)
+            accepting[:size] = numpy.unpackbits(numpy.frombuffer(bytes(self.accepting), dtype=numpy.uint8), bitorder="little")[:size]
+            spans = SymbolClasses(self.labels()).spans()
+            lookup = numpy.full(max([end for _, end, _ in spans] + [0]) + 2, self.width, dtype=numpy.int64)
+            for start, end, column in spans:
+                lookup[start:end + 1] = column
+            self._arrays = (table.ravel(), accepting, lookup)
+        return self._arrays
+
+
+# match_parallelの各プロセスが共有メモリから作ったCompiledDFA
+_shared_dfa = None
+
+
+def _attach_shared(arguments):
+    """ match_parallelのプロセスの初期化(共有メモリの遷移表につなぐ) """
+    global _shared_dfa
+    _shared_dfa = CompiledDFA.attach(*arguments)
+
+
+def _match_shared(strings):
+    """ 文字列のリストを認識し、結果を一文字ずつ0か1にしたbytesで返す """
+    return bytes(map(_shared_dfa.run, strings))
+
+
+def _chunk_mapping_shared(chunk):
+    """ run_parallelで分けた部分chunkについてのchunk_mappingを返す """
+    return _shared_dfa.chunk_mapping(chunk)
 
 
 class NondeterministicFiniteAutomata(Automata):
     """ 非決定性有限オートマトン """
 
-    def run(self, string):
-        """ stringを認識するかチェックする """
-        states = {self.init_state}
-        for char in string:
-            if char not in self.alphabet:
-                print("ERROR : invalid character \"%s\"" % char)
-                return False
-            else:
-                states = self.next_states(states, char)
-        return len(states.intersection(self.final_states)) != 0
+    __slots__ = ()
 
     def next_states(self, states, char):
         """ statesからcharを読んだ時の次の状態集合を返す """
+        lookup = self._transitions.compact.lookup
         next_states = set()
         for state in states:
-            next_states = next_states.union(self.transitions[state].get(char, frozenset()))
+            next_states.update(lookup(state, char))
         return frozenset(next_states)
 
-    def convert_to_DFA(self):
-        """ 等価なDFAに変換する """
-        # 状態と遷移関数を作る
-        states = {frozenset({self.init_state})}
-        transitions = {}
-        to_search = {frozenset({self.init_state})}
-        searched = set()
-        while len(to_search) != 0:
-            searching = to_search.pop()
-            searched.add(searching)
-            for char in self.alphabet:
-                reachables = self.next_states(searching, char)
-                states.add(reachables)
-                if reachables not in searched:
-                    # 遷移させた先がまだ調べていない状態だったらさらに調べる必要がある
-                    to_search.add(reachables)
-                if not transitions.get(searching):
-                    # 二重辞書の要素を一気に作ることはできないので注意
-                    transitions[searching] = {}
-                transitions[searching][char] = frozenset(reachables)
-
-        # DFAの終了状態は終了状態を一つでも含む状態全体からなる集合
-        final_states = set([x for x in states if len(self.final_states.intersection(x)) != 0])
-        # DFAの始状態はNFAの始状態だけからなる集合
-        init_state = frozenset({self.init_state})
-        # DFAのアルファベットはNFAと同じ
-        alphabet = self.alphabet
-        return DeterministicFiniteAutomata(states, alphabet, transitions, init_state, final_states)
+    @Instrument.timed("convert_to_DFA")
+    def convert_to_DFA(self, progress=None, token=None):
+        """
+        等価なDFAに変換する
+        progress(調べた状態数, まだ調べていない状態数)をInstrument.PROGRESS_INTERVAL個調べるごとに呼び、
+        tokenが取り消されたらInstrument.Cancelledを投げる
+        """
+        # 状態集合を整数のビット列で表したBitsetNFAで部分集合構成をする
+        return self.bitset().to_DFA(self.alphabet, progress, token)
 
 
 class NFAWithEpsilonTransition(Automata):
     """ ε動作付き非決定性有限オートマトン """
 
+    __slots__ = ()
+
     def reachables_with_a_epsilon_from(self, state):
         """ stateから一回のε遷移だけで到達可能な状態の集合を返す """
-        return frozenset(self.transitions[state].get(-1, {}))
+        return frozenset(self._transitions.compact.lookup(state, -1))
+
+    def epsilon_successors(self):
+        """ 各状態から一回のε遷移だけで到達可能な状態のリストの辞書を返す(一度作ったものは覚えておく) """
+        if "epsilon" not in self._cache:
+            self._cache["epsilon"] = self._transitions.compact.successors(-1)
+        return self._cache["epsilon"]
 
     def reachables_with_epsilons_from(self, state):
         """ stateからε遷移だけで到達可能な状態の集合を返す """
-        ans = frozenset([state])
-        reachables = self.reachables_with_a_epsilon_from(state)
-        while not reachables.issubset(ans):
-            ans = ans.union(reachables)
-            new_reachables = frozenset()
-            for reachable in reachables:
-                new_reachables = new_reachables.union(self.reachables_with_a_epsilon_from(reachable))
-            reachables = new_reachables
-        return ans
+        closure = self.epsilon_closures().get(state)
+        return closure if closure is not None else frozenset([state])
+
+    def epsilon_closures(self):
+        """
+        各状態からε遷移だけで到達可能な状態の集合(ε閉包)の表を返す(一度作ったものは覚えておく)
+        ε遷移のグラフの強連結成分を行き先から順にたどるので、閉包の大きさの合計に比例する時間で求まる
+        """
+        if "closures" not in self._cache:
+            self._cache["closures"] = self._compute_epsilon_closures()
+        return self._cache["closures"]
+
+    @Instrument.timed("epsilon_closures")
+    def _compute_epsilon_closures(self):
+        """ 行き先の強連結成分の閉包を足していって全部のε閉包を求める(同じ強連結成分の状態は同じfrozensetを共有する) """
+        successors = self.epsilon_successors()
+        closures = {}
+        for component in self.epsilon_components():
+            closure = set(component)
+            for member in component:
+                for child in successors.get(member, ()):
+                    if child not in component:
+                        closure.update(closures[child])
+            closure = frozenset(closure)
+            for member in component:
+                closures[member] = closure
+        if Instrument.observer is not None:
+            Instrument.observer.count("epsilon_closures", len(closures))
+        return closures
+
+    @Instrument.timed("epsilon_closures")
+    def epsilon_closure_masks(self, index):
+        """ 状態に番号indexを振った時の、各状態のε閉包をビット列で表した整数の表を返す """
+        successors = self.epsilon_successors()
+        masks = {}
+        for component in self.epsilon_components():
+            mask = 0
+            for member in component:
+                mask |= 1 << index[member]
+            for member in component:
+                for child in successors.get(member, ()):
+                    if child not in component:
+                        mask |= masks[child]
+            for member in component:
+                masks[member] = mask
+        if Instrument.observer is not None:
+            Instrument.observer.count("epsilon_closures", len(masks))
+        return masks
+
+    def epsilon_components(self):
+        """
+        ε遷移のグラフをTarjanのアルゴリズムで強連結成分に分解し、成分(状態の集合)のリストを返す
+        ある成分からε遷移で行ける成分は、必ずその成分より前に並ぶ
+        """
+        if "components" in self._cache:
+            return self._cache["components"]
+
+        epsilon = self.epsilon_successors()
+
+        def successors(state):
+            return epsilon.get(state, ())
+
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        components = []
+        for root in self._transitions.compact.states.objects:
+            if root in index:
+                continue
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            # 再帰の代わりに(状態, 残りの行き先)のスタックで深さ優先探索する
+            work = [(root, iter(successors(root)))]
+            while work:
+                state, children = work[-1]
+                for child in children:
+                    if child not in index:
+                        index[child] = lowlink[child] = len(index)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(successors(child))))
+                        break
+                    elif child in on_stack:
+                        lowlink[state] = min(lowlink[state], index[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[state])
+                    if lowlink[state] != index[state]:
+                        continue
+                    # stateを根とする強連結成分を取り出す
+                    component = set()
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.add(member)
+                        if member == state:
+                            break
+                    components.append(component)
+        self._cache["components"] = components
+        return components
 
     def next_states(self, states, char):
         """ statesからcharを読んだ時の次の状態集合を返す """
-        next_states = frozenset()
+        closures = self.epsilon_closures()
+        lookup = self._transitions.compact.lookup
+        next_states = set()
         for state in states:
-            for reachable in self.transitions[state].get(char, frozenset()):
-                next_states = next_states.union(self.reachables_with_epsilons_from(reachable))
+            for reachable in lookup(state, char):
+                next_states.update(closures[reachable])
         return frozenset(next_states)
 
-    def run(self, string):
-        """ stringを認識するかチェックする """
-        states = self.reachables_with_epsilons_from(self.init_state)
-        for char in string:
-            if char not in self.alphabet:
-                print("ERROR : invalid character \"%s\"" % char)
-                return False
-            else:
-                states = self.next_states(states, char)
-        return len(states.intersection(self.final_states)) != 0
-
-    def convert_to_DFA(self):
-        """ 等価なDFAに変換する """
-        # 状態と遷移関数を作る
-        states = {self.reachables_with_epsilons_from(self.init_state)}
+    def epsilon_free(self):
+        """ ε遷移を取り除いた等価なNFAを返す """
+        closures = self.epsilon_closures()
         transitions = {}
-        to_search = {self.reachables_with_epsilons_from(self.init_state)}
-        searched = set()
-        while len(to_search) != 0:
-            searching = to_search.pop()
-            searched.add(searching)
+        for state in self.states:
+            transitions[state] = {}
             for char in self.alphabet:
-                reachables = self.next_states(searching, char)
-                states.add(reachables)
-                if reachables not in searched:
-                    # 遷移させた先がまだ調べていない状態だったらさらに調べる必要がある
-                    to_search.add(reachables)
-                if not transitions.get(searching):
-                    # 二重辞書の要素を一気に作ることはできないので注意
-                    transitions[searching] = {}
-                transitions[searching][char] = frozenset(reachables)
+                reachables = self.next_states(closures[state], char)
+                if reachables:
+                    transitions[state][char] = reachables
+        # ε遷移だけで終了状態に行ける状態も終了状態になる
+        final_states = set([x for x in self.states if not self.final_states.isdisjoint(closures[x])])
+        return NondeterministicFiniteAutomata(self.states, self.alphabet, transitions, self.init_state, final_states)
 
-        # DFAの終了状態は終了状態を一つでも含む状態全体からなる集合
-        final_states = set([x for x in states if len(self.final_states.intersection(x)) != 0])
-        # DFAの始状態はNFAの始状態からイプシロン遷移で到達できる状態の集合
-        init_state = self.reachables_with_epsilons_from(self.init_state)
-        # DFAのアルファベットはNFAと同じ
-        alphabet = self.alphabet
-        return DeterministicFiniteAutomata(states, alphabet, transitions, init_state, final_states)
+    def bitset(self):
+        """ 状態集合を整数のビット列で表して実行するBitsetNFAを返す(ε閉包は遷移に畳み込む) """
+        if "bitset" not in self._cache:
+            self._cache["bitset"] = BitsetNFA.from_NFA(self, self.epsilon_closure_masks)
+        return self._cache["bitset"]
+
+    @Instrument.timed("convert_to_DFA")
+    def convert_to_DFA(self, progress=None, token=None):
+        """
+        等価なDFAに変換する
+        progress(調べた状態数, まだ調べていない状態数)をInstrument.PROGRESS_INTERVAL個調べるごとに呼び、
+        tokenが取り消されたらInstrument.Cancelledを投げる
+        """
+        # 状態集合を整数のビット列で表したBitsetNFAで部分集合構成をする
+        return self.bitset().to_DFA(self.alphabet, progress, token)
 
     @staticmethod
     def serial_connect(automaton):
         """ 複数のオートマトンを横並びに一つにまとめる """
-        alphabet = set()
-        states = set()
-        transitions = {}
-        for i, automata in enumerate(automaton):
-            # alphabetを更新
-            alphabet = alphabet.union(automata.alphabet)
-
-            # statesを更新
-            # 状態とautomataのインデックスを組にすることで唯一性を確保
-            states = states.union(set([(i, state) for state in automata.states]))
-
-            # automata内部の遷移をtransitionsに追加
-            for final_state in automata.final_states:
-                transitions[(i, final_state)] = {}
-            for state, trans_dict in automata.transitions.items():
-                transitions[(i, state)] = {}
-                for char, states_transit_to in trans_dict.items():
-                    transitions[(i, state)][char] = frozenset([(i, state) for state in states_transit_to])
-
-            # 一つ前のautomataからのイプシロン遷移を追加
-            if i == 0:
-                continue
-            for pre_final_state in automaton[i - 1].final_states:
-                transitions[(i - 1, pre_final_state)][-1] = frozenset([(i, automata.init_state)])
-
-        # 始状態と終状態を作る
-        init_state = (0, automaton[0].init_state)
-        final_states = set([(len(automaton) - 1, f) for f in automaton[-1].final_states])
-        return NFAWithEpsilonTransition(states, alphabet, transitions, init_state, final_states)
+        builder = ThompsonBuilder()
+        init_state = None
+        pre_final_states = None
+        for automata in automaton:
+            start, final_states = builder.embed(automata)
+            if pre_final_states is None:
+                init_state = start
+            else:
+                # 一つ前のautomataからのイプシロン遷移を追加
+                for pre_final_state in pre_final_states:
+                    builder.add(pre_final_state, -1, start)
+            pre_final_states = final_states
+        return builder.build(init_state, pre_final_states)
 
     @staticmethod
     def parallel_connect(automaton):
         """ 複数のオートマトンを並列につなげる """
-        # 新しい始状態は定数1
-        init_state = 1
-        alphabet = set()
-        states = {init_state}
-        transitions = {}
-        final_states = set()
-        for i, automata in enumerate(automaton):
-            # alphabetを更新
-            alphabet = alphabet.union(automata.alphabet)
-
-            # statesを更新
-            # 状態とautomataのインデックスを組にすることで唯一性を確保
-            states = states.union(set([(i, state) for state in automata.states]))
-
-            # automata内部の遷移をtransitionsに追加
-            for state, trans_dict in automata.transitions.items():
-                transitions[(i, state)] = {}
-                for char, states_transit_to in trans_dict.items():
-                    transitions[(i, state)][char] = frozenset([(i, state) for state in states_transit_to])
-
-            # 終了状態にautomata.finalstatesを追加
-            final_states = final_states.union(set([(i, final_state) for final_state in automata.final_states]))
-
-        # 最初のイプシロン遷移を追加
-        transitions[init_state] = {}
-        transitions[init_state][-1] = frozenset([(i, automata.init_state) for i, automata in enumerate(automaton)])
-
-        return NFAWithEpsilonTransition(states, alphabet, transitions, init_state, final_states)
+        builder = ThompsonBuilder()
+        init_state = builder.new_state()
+        final_states = []
+        for automata in automaton:
+            start, automata_final_states = builder.embed(automata)
+            builder.add(init_state, -1, start)
+            final_states.extend(automata_final_states)
+        return builder.build(init_state, final_states)
 
     @staticmethod
     def repeat(automata):
         """ automataが受理する文字列をn回並べた文字列をすべて受理するeNFAを返す(n=0,1,2...) """
-        # init_stateとfinal_stateをautomataのstatesとかぶらないように決める
-        i = 1
-        while i in automata.states:
-            i += 1
-        init_state = i
-
-        j = -1
-        while j in automata.states:
-            j -= 1
-        final_state = j
-
-        # 状態は元の状態に始状態と終状態を追加したもの
-        states = automata.states.union({init_state, final_state})
+        builder = ThompsonBuilder()
+        start, final_states = builder.embed(automata)
+        init_state = builder.new_state()
+        final_state = builder.new_state()
+        for state in [init_state] + final_states:
+            builder.add(state, -1, start)
+            builder.add(state, -1, final_state)
+        return builder.build(init_state, [final_state])
 
-        # 遷移を追加する
-        transitions = automata.transitions
-        transitions[init_state] = {}
-        transitions[init_state][-1] = {automata.init_state, final_state}
-        transitions[final_state] = {}
-        for final in automata.final_states:
-            transitions[final][-1] = {automata.init_state, final_state}
-
-        return NFAWithEpsilonTransition(states, automata.alphabet, transitions, init_state, {final_state})
+    @staticmethod
+    def empty_word(alphabet):
+        """ 空文字列だけを認識するeNFAを返す """
+        states = {0}
+        transitions = {0: {}}
+        return NFAWithEpsilonTransition(states, alphabet, transitions, 0, {0})
 
     @staticmethod
     def one_word(char, alphabet):
@@ -350,9 +1735,10 @@ class NFAWithEpsilonTransition(Automata):
 
     @staticmethod
     def any_word(alphabet):
-        """ 任意の文字一文字を認識するeNFAを返す """
+        """ 任意の文字一文字を認識するeNFAを返す(alphabetがCharRangesなら遷移はそれ一つをラベルにしたものだけ) """
         states = {0, 1, 2}
-        alphabet = alphabet
+        if isinstance(alphabet, CharRanges):
+            alphabet = [alphabet]
         transitions = {0: {}, 1: {}, 2: {}}
         for char in alphabet:
             transitions[0][char] = {1}
@@ -361,3 +1747,590 @@ class NFAWithEpsilonTransition(Automata):
         init_state = 0
         final_states = {1}
         return NFAWithEpsilonTransition(states, alphabet, transitions, init_state, final_states)
+
+
+class ThompsonBuilder(object):
+    """
+    状態に共通のカウンタから新しい整数を割り当てながらeNFAを組み立てる
+    遷移は(元の状態, 文字の番号, 遷移先)の三つの配列に追記していき、buildで一度だけeNFAにする
+    断片(始状態, 終状態)を組み合わせるchar, any, epsilon, concat, union, starはどれも定数個の状態と遷移しか足さない
+    """
+
+    def __init__(self, alphabet=()):
+        self.alphabet = set(alphabet)
+        self.size = 0
+        self.symbols = StateTable([-1])
+        self.sources = array("i")
+        self.columns = array("i")
+        self.targets = array("i")
+
+    def new_state(self):
+        """ 新しい状態を作ってその番号を返す """
+        self.size += 1
+        return self.size - 1
+
+    def add(self, source, char, target):
+        """ sourceからcharでtargetへの遷移を追加する(charが-1ならε遷移) """
+        self.sources.append(source)
+        self.columns.append(self.symbols.intern(char))
+        self.targets.append(target)
+
+    def embed(self, automata):
+        """ NFAかeNFAのautomataの状態に新しい番号を振って写し、(始状態, 終状態のリスト)を返す """
+        self.alphabet.update(automata.alphabet)
+        index = {state: self.new_state() for state in automata.states}
+        for state, trans_dict in automata.transitions.items():
+            for char, targets in trans_dict.items():
+                for target in targets:
+                    self.add(index[state], char, index[target])
+        return index[automata.init_state], [index[state] for state in automata.final_states]
+
+    def char(self, char):
+        """ char一文字だけを認識する断片を返す """
+        start, end = self.new_state(), self.new_state()
+        self.add(start, char, end)
+        return start, end
+
+    def any(self):
+        """ アルファベットの任意の一文字を認識する断片を返す """
+        start, end = self.new_state(), self.new_state()
+        for char in self.alphabet:
+            self.add(start, char, end)
+        return start, end
+
+    def epsilon(self):
+        """ 空文字列だけを認識する断片を返す """
+        state = self.new_state()
+        return state, state
+
+    def concat(self, fragments):
+        """ 断片を順番につないだ断片を返す """
+        for (_, end), (start, _) in zip(fragments, fragments[1:]):
+            self.add(end, -1, start)
+        return fragments[0][0], fragments[-1][1]
+
+    def union(self, fragments):
+        """ どれかの断片が認識する文字列を認識する断片を返す """
+        start, end = self.new_state(), self.new_state()
+        for fragment_start, fragment_end in fragments:
+            self.add(start, -1, fragment_start)
+            self.add(fragment_end, -1, end)
+        return start, end
+
+    def star(self, fragment):
+        """ 断片が認識する文字列を0回以上並べた文字列を認識する断片を返す """
+        start, end = self.new_state(), self.new_state()
+        for state in (start, fragment[1]):
+            self.add(state, -1, fragment[0])
+            self.add(state, -1, end)
+        return start, end
+
+    def build(self, init_state, final_states):
+        """ ここまでに作った状態と遷移全部からなるeNFAを返す """
+        compact = CompactTransitions.from_edges(self.size, self.symbols, self.sources, self.columns, self.targets)
+        return NFAWithEpsilonTransition(range(self.size), self.alphabet, TransitionView(compact), init_state, final_states)
+
+
+class Searcher(object):
+    """
+    DFAが受理する部分を文字列の中から探す(最も左から始まるものの中で最長のものを選ぶ)
+    forward  : 元の言語のDFA(先頭を決めて最長の終わりを探す)
+    leftmost : 各位置から始まる部分を同時に読むが、一度受理したら新しく始めないDFA(leftmost_prefixedを参照)
+    backward : 逆順の言語の先頭に「.*」を付けた言語のDFA(後ろから読んで、受理される部分が始まる位置を探す)
+    prefilter: 受理される部分が必ず持つリテラルを先に調べるPrefilter(無ければNone)
+    searchはleftmostで前から、backwardで後ろから、forwardで前からそれぞれ一回ずつ読むだけで済む
+    """
+
+    def __init__(self, dfa, prefilter=None):
+        self.forward = dfa.compile()
+        self.leftmost = Searcher.leftmost_prefixed(dfa).minimized().compile()
+        self.backward = Searcher.any_prefixed(dfa.reversed().convert_to_DFA()).convert_to_DFA().minimized().compile()
+        self.prefilter = prefilter if prefilter else None
+
+    @staticmethod
+    def any_prefixed(dfa):
+        """ dfaの言語の先頭に任意の文字列を付けた言語を受理するeNFAを返す """
+        init_state = 1
+        states = {init_state}.union((0, state) for state in dfa.states)
+        transitions = {init_state: {char: {init_state} for char in dfa.alphabet}}
+        transitions[init_state][-1] = {(0, dfa.init_state)}
+        for state in dfa.states:
+            transitions[(0, state)] = {}
+        for state, trans_dict in dfa.transitions.items():
+            for char, target in trans_dict.items():
+                transitions[(0, state)][char] = {(0, target)}
+        final_states = set((0, state) for state in dfa.final_states)
+        return NFAWithEpsilonTransition(states, dfa.alphabet, transitions, init_state, final_states)
+
+    @staticmethod
+    def leftmost_prefixed(dfa):
+        """
+        各位置から始まる部分をdfaで同時に読むDFAを返す(受理状態はどれかの部分が受理される所)
+        ただし一度受理したらそれより後から始まる部分は加えないので、それまでに始まった部分が全部行き止まりになると行き止まりになる
+        状態は(まだ新しく始めるか, 読んでいる部分のdfaの状態の集合)の組で、受理状態に行けないdfaの状態は集合から除く
+        """
+        compiled = dfa.compile()
+        live = compiled.live_states()
+        live_states = set(state for i, state in enumerate(compiled.states) if live[i])
+
+        def make(opening, states):
+            states = frozenset(states) & live_states
+            return opening and states.isdisjoint(dfa.final_states), states
+
+        init_state = make(True, [dfa.init_state])
+        transitions = {}
+        stack = [init_state]
+        while stack:
+            state = stack.pop()
+            if state in transitions:
+                continue
+            opening, states = state
+            transitions[state] = {}
+            for char in dfa.alphabet:
+                targets = set(dfa.step(current, char) for current in states)
+                if opening:
+                    targets.add(dfa.init_state)
+                transitions[state][char] = make(opening, targets)
+                stack.append(transitions[state][char])
+        final_states = set(state for state in transitions if not state[1].isdisjoint(dfa.final_states))
+        return DeterministicFiniteAutomata(transitions.keys(), dfa.alphabet, transitions, init_state, final_states)
+
+    def last_end(self, text, pos=0):
+        """
+        text[pos:]の中で、受理される部分のうち一番早く終わるものより前から始まる部分の終わりの最大値を返す(無ければNone)
+        最も左から始まる受理される部分はその中にあるので、これより後ろは読まなくてよい
+        """
+        dfa = self.leftmost
+        table = dfa.table
+        symbols = dfa.symbols
+        width = dfa.width
+        live = dfa.live_states()
+        state = dfa.init_state
+        end = pos if dfa.is_final(state) else None
+        for i in range(pos, len(text)):
+            column = symbols.get(text[i])
+            if column is None:
+                if end is not None:
+                    break
+                # アルファベットに無い文字をまたぐ部分は無いので最初からやり直す
+                state = dfa.init_state
+                continue
+            state = table[state * width + column]
+            if not live[state]:
+                break
+            if dfa.is_final(state):
+                end = i + 1
+        return end
+
+    def first_start(self, text, end, pos=0):
+        """ text[pos:end]の中の受理される部分のうち一番左の始まりを返す(無ければNone) """
+        dfa = self.backward
+        table = dfa.table
+        symbols = dfa.symbols
+        width = dfa.width
+        state = dfa.init_state
+        start = end if dfa.is_final(state) else None
+        for i in range(end - 1, pos - 1, -1):
+            column = symbols.get(text[i])
+            # アルファベットに無い文字をまたぐ部分は無いので最初からやり直す
+            state = dfa.init_state if column is None else table[state * width + column]
+            if dfa.is_final(state):
+                start = i
+        return start
+
+    def longest_end(self, text, start):
+        """ startから始まる受理される部分のうち最長のものの終わりを返す(無ければNone) """
+        dfa = self.forward
+        table = dfa.table
+        symbols = dfa.symbols
+        width = dfa.width
+        live = dfa.live_states()
+        state = dfa.init_state
+        end = start if dfa.is_final(state) else None
+        for i in range(start, len(text)):
+            column = symbols.get(text[i])
+            if column is None:
+                break
+            state = table[state * width + column]
+            if not live[state]:
+                break
+            if dfa.is_final(state):
+                end = i + 1
+        return end
+
+    def match(self, text, pos=0):
+        """ posから始まる最長の受理される部分の(始まり, 終わり)を返す(無ければNone) """
+        if self.prefilter is not None and not self.prefilter.match_possible(text, pos):
+            return None
+        end = self.longest_end(text, pos)
+        return None if end is None else (pos, end)
+
+    def search(self, text, pos=0):
+        """ text[pos:]の中で最も左から始まる最長の受理される部分の(始まり, 終わり)を返す(無ければNone) """
+        if self.prefilter is not None:
+            # 受理される部分が始まりえない所は読み飛ばす
+            pos = self.prefilter.search_start(text, pos)
+            if pos is None:
+                return None
+        end = self.last_end(text, pos)
+        if end is None:
+            return None
+        start = self.first_start(text, end, pos)
+        return start, self.longest_end(text, start)
+
+    def finditer(self, text, pos=0):
+        """ text[pos:]の中の重ならない受理される部分の(始まり, 終わり)を左から順に返す """
+        while pos <= len(text):
+            found = self.search(text, pos)
+            if found is None:
+                return
+            yield found
+            start, end = found
+            pos = end if end > start else end + 1
+
+
+class BitsetNFA(object):
+    """
+    状態に0から番号を振り、状態集合をその番号のビットを立てた整数で表すNFAの実行器
+    masks[char][i]は番号iの状態からcharを読んで(その後ε遷移だけで)行ける状態集合
+    """
+
+    def __init__(self, masks, init_state, final_mask, states, classes=None, live=None):
+        self.masks = masks
+        self.init_state = init_state
+        self.final_mask = final_mask
+        # statesは番号から元の状態への対応
+        self.states = states
+        # classesはラベルにCharRangesがある時の、入力の文字からラベルへのSymbolClasses
+        self.classes = classes
+        # 受理状態に行ける状態のビット列(Noneなら必要になった時にmasksから作る)
+        self._live = live
+
+    @staticmethod
+    def from_NFA(automata, closure_masks=None):
+        """
+        automataからBitsetNFAを作る
+        closure_masks(index)は状態に番号indexを振った時の各状態のε閉包のビット列の表を返す関数(ε遷移が無ければNone)
+        """
+        # 状態の番号は遷移関数をまとめたCompactTransitionsの番号をそのまま使う
+        compact = automata.transitions.compact
+        states = compact.states.objects
+        index = compact.states.index
+        if closure_masks is None:
+            closure_masks = [1 << i for i in range(len(states))]
+        else:
+            masks = closure_masks(index)
+            closure_masks = [masks.get(state, 1 << i) for i, state in enumerate(states)]
+        offsets = compact.offsets
+        columns = compact.columns
+        targets = compact.targets
+        masks = {char: [0] * len(states) for char in automata.alphabet}
+        # 文字の番号からmasksの行への表(アルファベットに無い文字やε遷移はNone)
+        rows = [masks.get(char) for char in compact.symbols.objects]
+        for i in range(len(states)):
+            for k in range(offsets[i], offsets[i + 1]):
+                row = rows[columns[k]]
+                if row is not None:
+                    row[i] |= closure_masks[targets[k]]
+        final_mask = 0
+        for state in automata.final_states:
+            if state in index:
+                final_mask |= 1 << index[state]
+        classes = None
+        if any(isinstance(char, CharRanges) for char in automata.alphabet):
+            classes = SymbolClasses({char: char for char in automata.alphabet})
+
+        # 受理状態に行ける状態は元の遷移(ε遷移も含む)を逆にたどって集める(ε閉包のmasksをたどるより辺の数が少ない)
+        inverse = [[] for _ in states]
+        used = [char == -1 or char in masks for char in compact.symbols.objects]
+        for i in range(len(states)):
+            for k in range(offsets[i], offsets[i + 1]):
+                if used[columns[k]]:
+                    inverse[targets[k]].append(i)
+        live = final_mask
+        to_search = [index[state] for state in automata.final_states if state in index]
+        while to_search:
+            for source in inverse[to_search.pop()]:
+                if not live >> source & 1:
+                    live |= 1 << source
+                    to_search.append(source)
+        return BitsetNFA(masks, closure_masks[index[automata.init_state]], final_mask, states, classes, live)
+
+    def translate(self, string):
+        """ 入力の文字列をラベルの並びにする(アルファベットに無い文字はそのまま、CharRangesのラベルが無ければ文字列をそのまま返す) """
+        if self.classes is None:
+            return string
+        get = self.classes.get
+        return [get(char, char) for char in string]
+
+    def next_states(self, mask, char):
+        """ 状態集合maskからcharを読んだ時の次の状態集合を返す """
+        row = self.masks[char]
+        next_mask = 0
+        while mask:
+            # 一番下の立っているビットを取り出す
+            low = mask & -mask
+            next_mask |= row[low.bit_length() - 1]
+            mask ^= low
+        return next_mask
+
+    def is_final(self, mask):
+        """ 状態集合maskが受理状態を含むならTrue """
+        return mask & self.final_mask != 0
+
+    def live_mask(self):
+        """ 受理状態に行ける状態のビットを立てた整数を返す """
+        if self._live is None:
+            # 遷移を逆にたどって受理状態から行ける状態を集める(masksはε閉包を含むのでε遷移は見なくてよい)
+            inverse = [[] for _ in self.states]
+            for row in self.masks.values():
+                for source, mask in enumerate(row):
+                    while mask:
+                        low = mask & -mask
+                        inverse[low.bit_length() - 1].append(source)
+                        mask ^= low
+            live = self.final_mask
+            to_search = [i for i in range(len(self.states)) if live >> i & 1]
+            while to_search:
+                for source in inverse[to_search.pop()]:
+                    if not live >> source & 1:
+                        live |= 1 << source
+                        to_search.append(source)
+            self._live = live
+        return self._live
+
+    def is_dead(self, mask):
+        """ 状態集合maskから受理状態に行けない(この後何を読んでも受理しない)ならTrue """
+        return mask & self.live_mask() == 0
+
+    def to_states(self, mask):
+        """ 状態集合maskを元の状態のfrozensetにして返す """
+        states = self.states
+        members = []
+        while mask:
+            low = mask & -mask
+            members.append(states[low.bit_length() - 1])
+            mask ^= low
+        return frozenset(members)
+
+    def to_DFA(self, alphabet, progress=None, token=None):
+        """
+        部分集合構成でalphabetの文字を読む等価なDFAを返す(DFAの状態は元の状態のfrozenset)
+        progressとtokenはconvert_to_DFAと同じ
+        """
+        observer = Instrument.observer
+        alphabet = [char for char in alphabet if char in self.masks]
+        # どの状態からでも同じ状態集合に行く記号は同値類にまとめ、行き先は同値類ごとに一回だけ計算する
+        classes = {}
+        for char in alphabet:
+            classes.setdefault(tuple(self.masks[char]), []).append(char)
+        classes = list(classes.values())
+        # seenは見つけた状態集合(ビット列)から元の状態のfrozensetへの辞書
+        seen = {self.init_state: self.to_states(self.init_state)}
+        to_search = [self.init_state]
+        transitions = {}
+        searched = 0
+        while to_search:
+            mask = to_search.pop()
+            searched += 1
+            if token is not None:
+                token.check()
+            if progress is not None and searched % Instrument.PROGRESS_INTERVAL == 0:
+                progress(searched, len(to_search))
+            row = {}
+            for chars in classes:
+                target = self.next_states(mask, chars[0])
+                states = seen.get(target)
+                if states is None:
+                    # 遷移させた先がまだ見つけていない状態だったらさらに調べる必要がある
+                    states = seen[target] = self.to_states(target)
+                    to_search.append(target)
+                for char in chars:
+                    row[char] = states
+            transitions[seen[mask]] = row
+            if observer is not None:
+                observer.gauge("subset_frontier", len(to_search))
+        if observer is not None:
+            observer.count("subset_states", searched)
+        if progress is not None:
+            progress(searched, 0)
+        # DFAの終了状態は終了状態を一つでも含む状態全体からなる集合
+        final_states = [states for mask, states in seen.items() if mask & self.final_mask]
+        return DeterministicFiniteAutomata(seen.values(), alphabet, transitions, seen[self.init_state], final_states)
+
+    def run(self, string, invalid="reject"):
+        """ stringを認識するかチェックする(アルファベットに無い文字はinvalidに従って扱う) """
+        mask = self.advance(self.init_state, string, invalid)
+        if Instrument.observer is not None:
+            Instrument.observer.count("run_chars", len(string))
+        return mask is not None and self.is_final(mask)
+
+    def advance(self, mask, string, invalid="reject"):
+        """
+        状態集合maskからstringを読んだ後の状態集合を返す(アルファベットに無い文字はinvalidに従って扱う)
+        受理状態に行けない状態集合になったら残りは読まずにそれを返す(行き止まりの状態集合は空集合0)
+        (invalidが"raise"なら、残りにアルファベットに無い文字が無いかだけは確かめる)
+        """
+        masks = self.masks
+        live = self.live_mask()
+        chars = self.translate(string)
+        for position, char in enumerate(chars):
+            if not mask & live:
+                if invalid == "raise":
+                    position = first_invalid(chars, position, masks)
+                    if position is not None:
+                        raise InvalidSymbolError(string[position], position)
+                return mask
+            if char not in masks:
+                return invalid_symbol(invalid, string[position], position, 0)
+            mask = self.next_states(mask, char)
+        return mask
+
+
+class LazyDFA(object):
+    """
+    NFAを部分集合構成のDFAとして実行するが、DFAの状態は読んだ文字列に必要な分だけその場で作る
+    作った状態と遷移はcache_size個の状態までキャッシュしておき、あふれたらpolicyに従って捨てる
+        policy="lru"   : 最も長く使っていない状態を一つ捨てる
+        policy="clear" : キャッシュを全部捨てる
+    """
+
+    def __init__(self, nfa, cache_size=1024, policy="lru"):
+        if policy not in ("lru", "clear"):
+            raise ValueError("unknown cache policy: %s" % policy)
+        if cache_size < 1:
+            raise ValueError("cache_size must be positive: %s" % cache_size)
+        # nfaはBitsetNFAで、DFAの状態はNFAの状態集合を表す整数
+        self.nfa = nfa
+        self.init_state = nfa.init_state
+        self.cache_size = cache_size
+        self.policy = policy
+        # cacheはDFAの状態から{文字: 次の状態}への辞書
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """ キャッシュのヒット・ミス・追い出しの回数と今キャッシュしている状態数を返す """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "states": len(self.cache)}
+
+    def next_state(self, state, char):
+        """ DFAの状態stateからcharを読んだ時の次の状態を返す """
+        row = self.cache.get(state)
+        if row is None:
+            row = self._add_row(state)
+        elif self.policy == "lru":
+            self.cache.move_to_end(state)
+        next_state = row.get(char)
+        if next_state is None:
+            self.misses += 1
+            next_state = self.nfa.next_states(state, char)
+            row[char] = next_state
+        else:
+            self.hits += 1
+        return next_state
+
+    def _add_row(self, state):
+        """ stateの遷移を覚える場所をキャッシュに作る(あふれたら追い出す) """
+        if len(self.cache) >= self.cache_size:
+            if self.policy == "lru":
+                self.cache.popitem(last=False)
+                self.evictions += 1
+            else:
+                self.evictions += len(self.cache)
+                self.cache.clear()
+        row = {}
+        self.cache[state] = row
+        return row
+
+    def is_final(self, state):
+        """ DFAの状態stateが受理状態ならTrue """
+        return self.nfa.is_final(state)
+
+    def is_dead(self, state):
+        """ DFAの状態stateから受理状態に行けないならTrue """
+        return self.nfa.is_dead(state)
+
+    def run(self, string, invalid="reject"):
+        """ stringを認識するかチェックする(アルファベットに無い文字はinvalidに従って扱う) """
+        observer = Instrument.observer
+        if observer is not None:
+            hits, misses = self.hits, self.misses
+        state = self.advance(self.init_state, string, invalid)
+        if observer is not None:
+            observer.count("run_chars", len(string))
+            observer.count("lazy_hits", self.hits - hits)
+            observer.count("lazy_misses", self.misses - misses)
+        return state is not None and self.is_final(state)
+
+    def advance(self, state, string, invalid="reject"):
+        """
+        DFAの状態stateからstringを読んだ後の状態を返す(アルファベットに無い文字はinvalidに従って扱う)
+        受理状態に行けない状態になったら残りは読まずにそれを返す
+        (invalidが"raise"なら、残りにアルファベットに無い文字が無いかだけは確かめる)
+        """
+        masks = self.nfa.masks
+        live = self.nfa.live_mask()
+        chars = self.nfa.translate(string)
+        for position, char in enumerate(chars):
+            if not state & live:
+                if invalid == "raise":
+                    position = first_invalid(chars, position, masks)
+                    if position is not None:
+                        raise InvalidSymbolError(string[position], position)
+                return state
+            if char not in masks:
+                return invalid_symbol(invalid, string[position], position, 0)
+            state = self.next_state(state, char)
+        return state
+
+
+class Matcher(object):
+    """
+    文字列を少しずつ読ませて認識するためのオブジェクト
+    読み終わった部分は覚えず、実行器(CompiledDFA, LazyDFAなど)の今の状態だけを持つ
+    アルファベットに無い文字を読んだら、その後は何を読んでも受理しない
+    """
+
+    def __init__(self, engine, invalid="reject"):
+        if invalid not in INVALID_POLICIES:
+            raise ValueError("unknown invalid symbol policy: %s" % invalid)
+        self.engine = engine
+        # invalidはアルファベットに無い文字の扱い(INVALID_POLICIESのどれか)
+        self.invalid = invalid
+        self.state = engine.init_state
+        # positionは今までに読んだ文字数
+        self.position = 0
+
+    def feed(self, chunk):
+        """ 文字列chunkを続きとして読む(行き止まりの状態などに入っていたらほとんど何もしない) """
+        if self.state is not None:
+            try:
+                self.state = self.engine.advance(self.state, chunk, self.invalid)
+            except InvalidSymbolError as error:
+                # 位置はchunkの中ではなく今までに読んだ文字列全体の中の位置にする
+                raise InvalidSymbolError(error.symbol, self.position + error.position) from None
+        self.position += len(chunk)
+        if Instrument.observer is not None:
+            Instrument.observer.count("run_chars", len(chunk))
+        return self
+
+    def is_accepting(self):
+        """ ここまで読んだ文字列を受理するならTrue """
+        return self.state is not None and self.engine.is_final(self.state)
+
+    def is_dead(self):
+        """ この後何を読んでも受理しない(行き止まりの状態に入ったか、アルファベットに無い文字を読んだ)ならTrue """
+        return self.state is None or self.engine.is_dead(self.state)
+
+    def finish(self):
+        """ 入力の終わりを伝えて、読んだ文字列全体を受理するかを返す(状態は始めに戻る) """
+        result = self.is_accepting()
+        self.reset()
+        return result
+
+    def reset(self):
+        """ 状態を始めに戻す """
+        self.state = self.engine.init_state
+        self.position = 0
@@ -0,0 +1,307 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from Automata import CompactTransitions, DeterministicFiniteAutomata, NondeterministicFiniteAutomata
+from Regex import parse, regex_to_derivative_DFA, regex_to_eNFA
+
+
+def nested_union_pattern(length):
+    """ "(a|(a|(a|...b)))"のように入れ子になった長さlength程度の正規表現を返す """
+    depth = max(1, length // 4)
+    return "(a|" * depth + "b" + ")" * depth
+
+
+def long_concat_pattern(length):
+    """ "(ab|b)*a."を繰り返して並べた長さlength程度の正規表現を返す """
+    piece = "(ab|b)*a."
+    return piece * max(1, length // len(piece))
+
+
+def nested_star_pattern(depth):
+    """ "((((a|b)*a)*b)*a)*..."のようにスターが深さdepthまで入れ子になった正規表現を返す """
+    pattern = "(a|b)"
+    for i in range(depth):
+        pattern = "(%s*%s)" % (pattern, "ab"[i % 2])
+    return pattern
+
+
+def nth_from_end_pattern(n):
+    """ 後ろからn番目の文字が0の文字列を表す正規表現を返す(nth_from_endの正規表現版、最小のDFAは2^n状態) """
+    return "(0|1)*0" + "(0|1)" * (n - 1)
+
+
+def is_divisible_by(n):
+    """ 二進表記でnの倍数になる文字列を認識するn状態のDFAを返す(IsDivisibleBy3を一般にしたもの) """
+    transitions = {state: {"0": state * 2 % n, "1": (state * 2 + 1) % n} for state in range(n)}
+    return DeterministicFiniteAutomata(range(n), {"0", "1"}, transitions, 0, {0})
+
+
+def nth_from_end(n):
+    """ 後ろからn番目の文字が0の文字列を認識するn+1状態のNFAを返す(IsEnd0XXXを一般にしたもの、DFAにすると2^n状態) """
+    transitions = {0: {"0": {0, 1}, "1": {0}}}
+    for state in range(1, n):
+        transitions[state] = {"0": {state + 1}, "1": {state + 1}}
+    transitions[n] = {}
+    return NondeterministicFiniteAutomata(range(n + 1), {"0", "1"}, transitions, 0, {n})
+
+
+def random_NFA(n, alphabet="01", degree=2, seed=0):
+    """ 各状態から各文字で0からdegree個の状態へランダムに遷移するn状態のNFAを返す """
+    generator = random.Random(seed)
+    transitions = {}
+    for state in range(n):
+        transitions[state] = {char: set(generator.sample(range(n), generator.randint(0, degree))) for char in alphabet}
+    final_states = generator.sample(range(n), max(1, n // 4))
+    return NondeterministicFiniteAutomata(range(n), alphabet, transitions, 0, final_states)
+
+
+def random_string(length, alphabet="01", seed=0):
+    """ alphabetの文字をランダムに並べた長さlengthの文字列を返す """
+    generator = random.Random(seed)
+    return "".join(generator.choice(alphabet) for _ in range(length))
+
+
+def measure(function, *args, repeat=3):
+    """ function(*args)を何回か実行して一番速かった時の秒数を返す """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def peak_memory(function, *args):
+    """ function(*args)を一回実行して、その間に確保したメモリの最大量(バイト)と結果を返す """
+    # tracemallocを使うと遅くなるので、時間はmeasureで別に測る
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, result
+
+
+def record(benchmark, workload, size, function, *args, repeat=3, count=None):
+    """
+    function(*args)の時間とメモリを測った結果の辞書を返す
+    count(結果)は一秒あたりの量を出すための数(状態数や文字数)
+    """
+    peak, result = peak_memory(function, *args)
+    seconds = measure(function, *args, repeat=repeat)
+    entry = {"benchmark": benchmark, "workload": workload, "size": size, "seconds": seconds, "peak_bytes": peak}
+    if count is not None:
+        entry["count"] = count(result)
+        entry["per_second"] = entry["count"] / seconds if seconds > 0 else float("inf")
+    return entry
+
+
+def bench_regex(sizes=(10000, 40000), depths=(100, 1000), alphabet="ab"):
+    """ 構文解析の時間と、regex_to_eNFAで一秒あたりに作れるeNFAの状態数を測る """
+    def states(automata):
+        return len(automata.states)
+    results = []
+    for size in sizes:
+        for name, generator in [("nested_union", nested_union_pattern), ("long_concat", long_concat_pattern)]:
+            results.append(record("parse", name, size, parse, generator(size)))
+            results.append(record("regex_to_eNFA", name, size, regex_to_eNFA, generator(size), alphabet, count=states))
+    for depth in depths:
+        results.append(record("regex_to_eNFA", "nested_star", depth, regex_to_eNFA, nested_star_pattern(depth), alphabet, count=states))
+    return results
+
+
+def derivative_DFA(pattern, alphabet):
+    """ patternから導関数で行ける状態を全部作ったDFAを返す """
+    automata = regex_to_derivative_DFA(pattern, alphabet)
+    automata.explore()
+    return automata
+
+
+def minimized_DFA(pattern, alphabet):
+    """ patternからeNFA、部分集合構成、最小化の順に作ったDFAを返す """
+    return regex_to_eNFA(pattern, alphabet).convert_to_DFA().minimized()
+
+
+def bench_derivative(ns=(8, 12), depths=(10, 100), sizes=(1000,), alphabet="ab"):
+    """ 正規表現からDFAを作るのにかかる時間と状態数を、導関数で作る場合とeNFAを最小化する場合で比べる """
+    def states(automata):
+        return len(automata.states)
+    workloads = ([("nth_from_end", n, nth_from_end_pattern(n), "01") for n in ns] + [("nested_star", depth, nested_star_pattern(depth), alphabet) for depth in depths] +
+                 [("long_concat", size, long_concat_pattern(size), alphabet) for size in sizes])
+    results = []
+    for name, size, pattern, chars in workloads:
+        results.append(record("derivative_DFA", name, size, derivative_DFA, pattern, chars, count=states, repeat=1))
+        results.append(record("minimized_DFA", name, size, minimized_DFA, pattern, chars, count=states, repeat=1))
+    return results
+
+
+def bench_convert(sizes=(8, 12, 16), random_sizes=(20, 40)):
+    """ convert_to_DFAで一秒あたりに作れるDFAの状態数を測る """
+    def states(automata):
+        return len(automata.states)
+    results = []
+    for n in sizes:
+        results.append(record("convert_to_DFA", "nth_from_end", n, nth_from_end(n).convert_to_DFA, count=states, repeat=1))
+    for n in random_sizes:
+        results.append(record("convert_to_DFA", "random_NFA", n, random_NFA(n).convert_to_DFA, count=states, repeat=1))
+    return results
+
+
+def bench_minimize(sizes=(1000, 10000, 50000), nth_sizes=(10, 14)):
+    """ minimizedで一秒あたりに処理できるDFAの状態数を測る """
+    results = []
+    for n in sizes:
+        dfa = is_divisible_by(n)
+        results.append(record("minimized", "is_divisible_by", n, dfa.minimized, count=lambda _: len(dfa.states), repeat=1))
+    for n in nth_sizes:
+        dfa = nth_from_end(n).convert_to_DFA()
+        results.append(record("minimized", "nth_from_end", n, dfa.minimized, count=lambda _, dfa=dfa: len(dfa.states), repeat=1))
+    return results
+
+
+def bench_run(lengths=(100000, 1000000), n=12):
+    """ runで一秒あたりに読める文字数を測る(DFAは整数の遷移表、NFAはLazyDFA、導関数のDFAはDerivativeEngineで実行する) """
+    workloads = [("is_divisible_by", is_divisible_by(1000)), ("nth_from_end_dfa", nth_from_end(n).convert_to_DFA()), ("nth_from_end_lazy", nth_from_end(n)),
+                 ("nth_from_end_derivative", regex_to_derivative_DFA(nth_from_end_pattern(n), "01"))]
+    results = []
+    for length in lengths:
+        string = random_string(length)
+        for name, automata in workloads:
+            # 遷移表などを作る時間は含めない
+            automata.engine()
+            results.append(record("run", name, length, automata.run, string, count=lambda _: length))
+    return results
+
+
+def bench_parallel(lengths=(4000000,), workers=(1, 2, 4), n=10):
+    """
+    一つの長い文字列を分けて同時に読むrun_parallelで一秒あたりに読める文字数をプロセス数ごとに測り、
+    一プロセスの時と比べて何倍速いか(speedup)も出す
+    CPUの数より多いプロセス数は速くなりようがないので測らない(CPUが一つなら一プロセスの時だけ)
+    """
+    dfa = nth_from_end(n).convert_to_DFA()
+    dfa.engine()
+    cpus = os.cpu_count() or 1
+    results = []
+    for length in lengths:
+        string = random_string(length)
+        base = None
+        for count in workers:
+            if count > cpus:
+                continue
+            entry = record("run_parallel", "nth_from_end_x%d" % count, length, dfa.run_parallel, string, count, repeat=1, count=lambda _: length)
+            entry["workers"] = count
+            base = entry["seconds"] if base is None else base
+            entry["speedup"] = base / entry["seconds"] if entry["seconds"] > 0 else float("inf")
+            results.append(entry)
+    return results
+
+
+def retained_memory(function, *args):
+    """ function(*args)の結果を残しておくのに使っているメモリの量(バイト)と結果を返す """
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = function(*args)
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return after - before, result
+
+
+def bench_memory(sizes=(10, 14), lengths=(10000, 40000), alphabet="ab"):
+    """
+    遷移関数を{状態: {文字: 行き先}}の辞書で持つ時と、整数の配列にまとめたCompactTransitionsで持つ時の
+    状態一つあたりのバイト数を比べる(状態のオブジェクト自体はどちらも同じなので数えない)
+    """
+    workloads = [("nth_from_end_dfa", n, nth_from_end(n).convert_to_DFA()) for n in sizes]
+    workloads += [("long_concat_enfa", length, regex_to_eNFA(long_concat_pattern(length), alphabet)) for length in lengths]
+    results = []
+    for name, size, automata in workloads:
+        rows = dict(automata.transitions.items())
+        # NFAの行き先の集合はマスごとに別のオブジェクトなので一緒に数える
+        copy = (lambda target: target) if automata.deterministic else set
+        dict_bytes, _ = retained_memory(lambda: {state: {char: copy(target) for char, target in row.items()} for state, row in rows.items()})
+        compact_bytes, _ = retained_memory(CompactTransitions, rows, automata.states, automata.deterministic)
+        entry = record("memory", name, size, CompactTransitions, rows, automata.states, automata.deterministic, repeat=1)
+        entry["states"] = len(automata.states)
+        entry["dict_bytes_per_state"] = dict_bytes / len(automata.states)
+        entry["compact_bytes_per_state"] = compact_bytes / len(automata.states)
+        results.append(entry)
+    return results
+
+
+def run_all(quick=False):
+    """ 全部のベンチマークを実行して結果の辞書のリストを返す(quickなら小さい大きさだけ) """
+    if quick:
+        return (bench_regex((1000,), (50,)) + bench_derivative((6,), (10,), (100,)) + bench_convert((6, 8), (10,)) + bench_minimize((100, 1000), (8,)) +
+                bench_run((10000,), 8) + bench_parallel((20000,), (1, 2), 6) + bench_memory((8,), (1000,)))
+    return bench_regex() + bench_derivative() + bench_convert() + bench_minimize() + bench_run() + bench_parallel() + bench_memory()
+
+
+def key_of(entry):
+    """ 結果entryをベースラインと対応させるためのキーを返す """
+    return entry["benchmark"], entry["workload"], entry["size"]
+
+
+def save_results(results, path):
+    """ 結果をJSONでpathに書き出す """
+    with open(path, "w") as file:
+        json.dump({"python": sys.version.split()[0], "results": results}, file, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    """ save_resultsで書き出した結果を読む """
+    with open(path) as file:
+        return json.load(file)["results"]
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    resultsとベースラインbaselineを比べ、時間がtolerance(割合)より長くなったものを
+    (キー, ベースラインの秒数, 今回の秒数)のリストで返す
+    """
+    previous = {key_of(entry): entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        old = previous.get(key_of(entry))
+        if old is not None and entry["seconds"] > old["seconds"] * (1 + tolerance):
+            regressions.append((key_of(entry), old["seconds"], entry["seconds"]))
+    return regressions
+
+
+def main(arguments=None):
+    """ ベンチマークを実行して結果を表示し、ベースラインより遅くなったものがあれば1を返す """
+    parser = argparse.ArgumentParser(description="Benchmark automaton construction, minimization and matching.")
+    parser.add_argument("--quick", action="store_true", help="run only small sizes")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results stored in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline (default: 0.2)")
+    arguments = parser.parse_args(arguments)
+
+    results = run_all(arguments.quick)
+    for entry in results:
+        rate = " %14.1f/s" % entry["per_second"] if "per_second" in entry else ""
+        if entry["benchmark"] == "memory":
+            rate = " bytes/state dict=%.1f compact=%.1f" % (entry["dict_bytes_per_state"], entry["compact_bytes_per_state"])
+        if "speedup" in entry:
+            rate += " speedup=%.2fx%s" % (entry["speedup"], " (slower)" if entry["speedup"] < 1 else "")
+        print("%-15s %-18s size=%-8d %.4fs peak=%-10d%s" % (entry["benchmark"], entry["workload"], entry["size"], entry["seconds"], entry["peak_bytes"], rate))
+    if arguments.output:
+        save_results(results, arguments.output)
+    if arguments.baseline:
+        regressions = compare(results, load_results(arguments.baseline), arguments.tolerance)
+        for (benchmark, workload, size), old, new in regressions:
+            print("REGRESSION %s %s size=%d: %.4fs -> %.4fs" % (benchmark, workload, size, old, new))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
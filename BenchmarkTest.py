@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from Automata import equivalent
+from Benchmark import bench_parallel, compare, is_divisible_by, load_results, main, nested_star_pattern, nth_from_end, nth_from_end_pattern, random_NFA, save_results
+from Regex import STAR, parse, postorder, regex_to_eNFA, to_regex
+from Examples import IsDivisibleBy3, IsEnd0XXX
+
+
+class GeneratorTest(unittest.TestCase):
+    """ ベンチマークで使うオートマトンを作る関数の確認 """
+
+    def test_is_divisible_by(self):
+        self.assertTrue(equivalent(is_divisible_by(3), IsDivisibleBy3()))
+        dfa = is_divisible_by(7)
+        for n in range(50):
+            self.assertEqual(n % 7 == 0, dfa.run(format(n, "b")))
+
+    def test_nth_from_end(self):
+        self.assertTrue(equivalent(nth_from_end(4), IsEnd0XXX()))
+        self.assertEqual(len(nth_from_end(6).convert_to_DFA().minimized().states), 2 ** 6)
+
+    def test_nth_from_end_pattern(self):
+        self.assertTrue(equivalent(regex_to_eNFA(nth_from_end_pattern(4), "01"), IsEnd0XXX()))
+
+    def test_random_NFA(self):
+        self.assertTrue(equivalent(random_NFA(10, seed=1), random_NFA(10, seed=1)))
+        self.assertEqual(len(random_NFA(10).states), 10)
+
+    def test_nested_star_pattern(self):
+        self.assertEqual(to_regex(parse(nested_star_pattern(3))), "(((a|b)*a)*b)*a")
+        self.assertEqual(sum(node.kind == STAR for node in postorder(parse(nested_star_pattern(100)))), 100)
+
+
+class BaselineTest(unittest.TestCase):
+    """ 結果の保存とベースラインとの比較の確認 """
+
+    results = [{"benchmark": "run", "workload": "w", "size": 1, "seconds": 1.0, "peak_bytes": 0},
+               {"benchmark": "run", "workload": "w", "size": 2, "seconds": 2.0, "peak_bytes": 0}]
+
+    def test_compare(self):
+        slower = [dict(entry, seconds=entry["seconds"] * 1.5) for entry in self.results]
+        self.assertEqual(compare(self.results, self.results), [])
+        self.assertEqual(compare(slower, self.results, tolerance=0.6), [])
+        self.assertEqual(compare(slower, self.results), [(("run", "w", 1), 1.0, 1.5), (("run", "w", 2), 2.0, 3.0)])
+        # ベースラインに無いものは比べない
+        self.assertEqual(compare(slower, self.results[:1]), [(("run", "w", 1), 1.0, 1.5)])
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            save_results(self.results, path)
+            self.assertEqual(load_results(path), self.results)
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as null:
+            path = os.path.join(directory, "baseline.json")
+            with mock.patch("sys.stdout", null):
+                self.assertEqual(main(["--quick", "--output", path]), 0)
+                self.assertEqual(main(["--quick", "--baseline", path, "--tolerance", "1000"]), 0)
+            self.assertTrue(load_results(path))
+
+    def test_parallel_cpus(self):
+        """ CPUの数より多いプロセス数は測らない """
+        with mock.patch("os.cpu_count", return_value=1):
+            results = bench_parallel((1000,), (1, 2), 4)
+        self.assertEqual([1], [entry["workers"] for entry in results])
+
+
+if __name__ == "__main__":
+    unittest.main()
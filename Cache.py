@@ -0,0 +1,120 @@
+import hashlib
+import os
+import struct
+from collections import OrderedDict
+import Instrument
+from Alphabet import CharRanges
+from Automata import CompiledDFA, DeterministicFiniteAutomata, ExploringDFA
+
+
+class PatternCache(object):
+    """
+    正規表現をコンパイルした結果のキャッシュ
+    メモリ上では(正規表現, アルファベット, エンジン)をキーにmaxsize個までLRUで覚えておく
+    directoryを指定すると、コンパイル済みのDFAをそこにファイルとして保存し、次にプロセスが起動した時も使う
+    ディスク上のファイルの合計がmax_bytesを超えたら最も長く使っていないものから消す
+    """
+
+    SUFFIX = ".dfa"
+
+    def __init__(self, build, maxsize=256, directory=None, max_bytes=None):
+        # build(pattern, alphabet, engine)はキャッシュに無い時にコンパイルする関数
+        self.build = build
+        self.maxsize = maxsize
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.disk_evictions = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def stats(self):
+        """ メモリとディスクのヒット・ミス・追い出しの回数と、メモリ上の個数を返す """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "disk_hits": self.disk_hits, "disk_misses": self.disk_misses, "disk_evictions": self.disk_evictions,
+                "size": len(self.entries)}
+
+    def clear(self):
+        """ メモリ上のキャッシュを捨てる(ディスク上のファイルはそのまま) """
+        self.entries.clear()
+
+    def get(self, pattern, alphabet, engine):
+        """ patternをコンパイルした結果を返す(キャッシュにあればそれを使う) """
+        key = (pattern, alphabet if isinstance(alphabet, CharRanges) else frozenset(alphabet), engine)
+        automata = self.entries.get(key)
+        if automata is not None:
+            self.hits += 1
+            if Instrument.observer is not None:
+                Instrument.observer.count("pattern_cache_hits")
+            self.entries.move_to_end(key)
+            return automata
+        self.misses += 1
+        if Instrument.observer is not None:
+            Instrument.observer.count("pattern_cache_misses")
+
+        automata = self.load(key)
+        if automata is None:
+            automata = self.build(pattern, alphabet, engine)
+            self.store(key, automata)
+        self.entries[key] = automata
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return automata
+
+    def path(self, key):
+        """ keyのDFAを保存するファイルの場所を返す """
+        pattern, alphabet, engine = key
+        name = repr((pattern, alphabet if isinstance(alphabet, CharRanges) else sorted(alphabet, key=str), engine)).encode("utf-8")
+        return os.path.join(self.directory, hashlib.sha256(name).hexdigest() + PatternCache.SUFFIX)
+
+    def load(self, key):
+        """ ディスクからkeyのDFAを読む(無ければNone) """
+        if self.directory is None:
+            return None
+        path = self.path(key)
+        try:
+            compiled = CompiledDFA.load(path)
+        except (OSError, ValueError, struct.error):
+            self.disk_misses += 1
+            return None
+        self.disk_hits += 1
+        # 最近使ったファイルほど後まで残るように更新時刻を新しくする
+        os.utime(path)
+        return compiled.to_DFA()
+
+    def store(self, key, automata):
+        """
+        automataがDFAならディスクに保存する
+        状態を必要になった時に作るDFA(ExploringDFA)は、保存すると行ける状態を全部作ることになるので保存しない
+        """
+        if self.directory is None or not isinstance(automata, DeterministicFiniteAutomata) or isinstance(automata, ExploringDFA):
+            return
+        path = self.path(key)
+        temporary = "%s.%d.tmp" % (path, os.getpid())
+        automata.save(temporary)
+        os.replace(temporary, path)
+        self.evict_disk()
+
+    def evict_disk(self):
+        """ ディスク上のファイルの合計がmax_bytes以下になるまで最も長く使っていないものから消す """
+        if self.max_bytes is None:
+            return
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(PatternCache.SUFFIX):
+                status = os.stat(os.path.join(self.directory, name))
+                files.append((status.st_mtime, status.st_size, name))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, name in files:
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+            self.disk_evictions += 1
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+import Regex
+from Cache import PatternCache
+
+
+class PatternCacheTest(unittest.TestCase):
+    """ コンパイル結果のキャッシュの確認 """
+
+    def setUp(self):
+        self.built = []
+
+    def build(self, pattern, alphabet, engine):
+        self.built.append(pattern)
+        return Regex.build(pattern, alphabet, engine)
+
+    def test_memory(self):
+        cache = PatternCache(self.build, maxsize=2)
+        first = cache.get("ab*", "ab", "dfa")
+        self.assertIs(first, cache.get("ab*", {"b", "a"}, "dfa"))
+        cache.get("ab*", "ab", "lazy")
+        cache.get("ba*", "ab", "dfa")
+        self.assertEqual(self.built, ["ab*", "ab*", "ba*"])
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 3, "evictions": 1,
+                                         "disk_hits": 0, "disk_misses": 0, "disk_evictions": 0, "size": 2})
+        # 一番長く使っていない("ab*", "dfa")が追い出されている
+        cache.get("ab*", "ab", "dfa")
+        self.assertEqual(len(self.built), 4)
+
+    def test_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            PatternCache(self.build, directory=directory).get("(a|b)*abb", "ab", "dfa")
+            cache = PatternCache(self.build, directory=directory)
+            dfa = cache.get("(a|b)*abb", "ab", "dfa")
+            self.assertEqual(len(self.built), 1)
+            self.assertEqual(cache.stats()["disk_hits"], 1)
+            for string, expected in [("abb", True), ("babb", True), ("abba", False), ("", False)]:
+                self.assertEqual(expected, dfa.run(string))
+            # eNFAはディスクには保存しない
+            cache.get("(a|b)*abb", "ab", "lazy")
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_disk_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = PatternCache(self.build, directory=directory)
+            cache.get("a", "ab", "dfa")
+            size = os.path.getsize(os.path.join(directory, os.listdir(directory)[0]))
+            cache = PatternCache(self.build, directory=directory, max_bytes=size * 2 + size // 2)
+            for pattern in ["b", "ab", "ba"]:
+                cache.get(pattern, "ab", "dfa")
+            self.assertLessEqual(sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)), size * 2 + size // 2)
+            self.assertGreater(cache.stats()["disk_evictions"], 0)
+
+    def test_compile(self):
+        Regex.configure_cache(maxsize=8)
+        dfa = Regex.compile("(ab)*", "ab")
+        self.assertIs(dfa, Regex.compile("(ab)*", "ab"))
+        self.assertTrue(dfa.run("abab"))
+        self.assertTrue(Regex.compile("(ab)*", "ab", engine="lazy").run("abab"))
+        self.assertEqual(Regex.cache.stats()["hits"], 1)
+        with self.assertRaises(ValueError):
+            Regex.compile("a", "ab", engine="backtracking")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,351 @@
+import Instrument
+from Alphabet import CharRanges, SymbolClasses, split_alphabet
+from Automata import ExploringDFA, InvalidSymbolError, first_invalid, invalid_symbol
+
+# 項の種類
+EMPTY = 0
+EPSILON = 1
+CHAR = 2
+ANY = 3
+CONCAT = 4
+UNION = 5
+STAR = 6
+
+# Terms.subsetで調べる深さの上限
+SUBSET_DEPTH = 32
+# Terms.unionでほかの項に含まれる項を除くのは、項の数がこれ以下の時だけ(項の数の二乗だけsubsetを調べる)
+SUBSET_UNION_SIZE = 32
+
+
+class Terms(object):
+    """
+    正規表現の項を整数で表し、同じ形の項には同じ番号を振る表(hash-consing)
+    項はchar, any, epsilon, concat, union, starで作る(ThompsonBuilderと同じ形なので、Regexの構文木から同じように作れる)
+    作る時に次のように正規化するので、同じ言語の項の多くは同じ番号になり、導関数で作るDFAの状態が有限で少なくなる
+        concat: 空集合を含めば空集合、空文字列は除き、右結合にする(r*に含まれ空文字列を含むrはr*sの前から除く)
+        union : 入れ子を平らにし、空集合を除き、重複を除いて番号順に並べる(結合則・交換則・冪等則)
+                ほかの項に含まれることが形から分かる項(r*と一緒のrやr*sと一緒のrr*sなど)も除く
+        star  : (r*)* = r*、(ε|r)* = r*、空集合と空文字列のスターは空文字列
+    アルファベットがCharRangesなら、正規表現に現れる文字とそれ以外全部をまとめたものをラベルにする
+    導関数はラベルではなく、同じように振る舞うラベルをまとめた同値類の代表ごとに一度だけ計算して覚えておく
+    """
+
+    def __init__(self, alphabet, chars=()):
+        chars = set(chars)
+        self.alphabet = split_alphabet(alphabet, chars)
+        # 正規表現に現れる文字はそれぞれ一つの同値類にし、残りのラベルは(anyでしか読めないので)全部一つにまとめる
+        others = sorted((label for label in self.alphabet if label not in chars), key=str)
+        # representativesはラベルから同値類の代表への辞書、classesは入力の文字から代表を引く表
+        self.representatives = {label: label if label in chars else others[0] for label in self.alphabet}
+        if any(isinstance(label, CharRanges) for label in self.alphabet):
+            self.classes = SymbolClasses(self.representatives)
+        else:
+            self.classes = self.representatives
+        # 項の番号から(種類, 文字, 子の番号のタプル)と、空文字列を含むかへのリスト
+        self.terms = []
+        self.nullable = []
+        self.index = {}
+        # (項の番号, 同値類の代表)から導関数の項の番号への辞書
+        self.derivatives = {}
+        # (項の番号, 項の番号)からsubsetの結果への辞書
+        self.subsets = {}
+        self.empty = self.make(EMPTY)
+        self.epsilon_term = self.make(EPSILON)
+        # 全部のラベルが正規表現に現れる文字なら、その文字全部の和はanyと同じ
+        self.all_chars = frozenset(self.alphabet) if not others else None
+        # 任意の文字列を表す項(これを含む和はこれになる)
+        self.universal = self.star(self.any()) if self.alphabet else None
+
+    def make(self, kind, char=None, children=()):
+        """ 種類kindの項の番号を返す(同じ形の項が既にあればその番号) """
+        key = (kind, char, children)
+        term = self.index.get(key)
+        if term is None:
+            term = len(self.terms)
+            self.terms.append(key)
+            if kind == CONCAT:
+                nullable = all(self.nullable[child] for child in children)
+            elif kind == UNION:
+                nullable = any(self.nullable[child] for child in children)
+            else:
+                nullable = kind in (EPSILON, STAR)
+            self.nullable.append(nullable)
+            self.index[key] = term
+        return term
+
+    def char(self, char):
+        """ char一文字だけを表す項を返す(アルファベットに無ければ空集合) """
+        return self.make(CHAR, char) if char in self.classes else self.empty
+
+    def any(self):
+        """ アルファベットの任意の一文字を表す項を返す """
+        return self.make(ANY) if self.alphabet else self.empty
+
+    def epsilon(self):
+        """ 空文字列だけを表す項を返す """
+        return self.epsilon_term
+
+    def concat(self, terms):
+        """ 項を順番につないだ項を返す """
+        result = self.epsilon_term
+        for term in reversed(terms):
+            result = self.concat_pair(term, result)
+        return result
+
+    def concat_pair(self, left, right):
+        """ leftの後にrightをつないだ項を返す(leftが連結なら右結合に組み直す) """
+        for part in reversed(self.parts(left)):
+            if part == self.empty or right == self.empty:
+                return self.empty
+            if part == self.epsilon_term:
+                continue
+            if right == self.epsilon_term:
+                right = part
+            elif part == self.universal and self.nullable[right]:
+                # 任意の文字列と空文字列を含むものをつないでも任意の文字列
+                right = self.universal
+            elif self.nullable[part] and self.terms[self.head(right)][0] == STAR and self.subset(part, self.head(right)):
+                # rが空文字列を含みr*に含まれるならr(r*s) = r*s((ε|r)r*s, r*r*sなど)
+                continue
+            else:
+                right = self.make(CONCAT, None, (part, right))
+        return right
+
+    def head(self, term):
+        """ 連結の項termの最初の項を返す(連結でなければterm自身) """
+        kind, _, children = self.terms[term]
+        return children[0] if kind == CONCAT else term
+
+    def parts(self, term):
+        """ 連結の項termを、右結合をほどいて並べた項のリストにする """
+        parts = []
+        while self.terms[term][0] == CONCAT:
+            first, term = self.terms[term][2]
+            parts.append(first)
+        parts.append(term)
+        return parts
+
+    def subset(self, left, right, depth=0):
+        """
+        項leftの言語が項rightの言語に含まれることが形から分かればTrue(分からなければFalse)
+        unionとconcatで冗長な項を除くのに使う(深さSUBSET_DEPTHより先は調べずにFalseにする)
+        """
+        if left == right or left == self.empty or right == self.universal:
+            return True
+        if depth > SUBSET_DEPTH:
+            return False
+        key = (left, right)
+        result = self.subsets.get(key)
+        if result is None:
+            result = self.subsets[key] = self._subset(left, right, depth + 1)
+        return result
+
+    def _subset(self, left, right, depth):
+        left_kind, _, left_children = self.terms[left]
+        right_kind, _, right_children = self.terms[right]
+        if left_kind == EPSILON:
+            return self.nullable[right]
+        if left_kind == UNION:
+            return all(self.subset(child, right, depth) for child in left_children)
+        if right_kind == UNION and any(self.subset(left, child, depth) for child in right_children):
+            return True
+        if left_kind == CHAR and right_kind == ANY:
+            return True
+        if right_kind == STAR and (self.subset(left, right_children[0], depth) or left_kind == STAR and self.subset(left_children[0], right, depth)):
+            return True
+        # rightがr*s(starだけならsは空文字列)の時
+        head, rest = right_children if right_kind == CONCAT else (right, self.epsilon_term)
+        if self.terms[head][0] == STAR:
+            if self.subset(left, rest, depth):
+                return True
+            # leftがr(...)で、(...)がr*sに含まれる(rは連結でもよい)
+            remainder = left
+            for part in self.parts(self.terms[head][2][0]):
+                kind, _, children = self.terms[remainder]
+                if kind != CONCAT or children[0] != part:
+                    remainder = None
+                    break
+                remainder = children[1]
+            if remainder is not None and self.subset(remainder, right, depth):
+                return True
+            # leftがr*(...)で、(...)がr*sに含まれる
+            if left_kind == CONCAT and left_children[0] == head and self.subset(left_children[1], right, depth):
+                return True
+        if left_kind == CONCAT and right_kind == CONCAT and left_children[0] == right_children[0]:
+            return self.subset(left_children[1], right_children[1], depth)
+        return False
+
+    def union(self, terms):
+        """ どれかの項が表す文字列を表す項を返す """
+        children = set()
+        for term in terms:
+            kind, _, grandchildren = self.terms[term]
+            if kind == UNION:
+                children.update(grandchildren)
+            elif kind != EMPTY:
+                children.add(term)
+        chars = set(self.terms[term][1] for term in children if self.terms[term][0] == CHAR)
+        if chars and (chars == self.all_chars or self.make(ANY) in children):
+            # 文字の和がアルファベット全部ならanyにする(anyと一緒の文字も除く)
+            children = set(term for term in children if self.terms[term][0] != CHAR)
+            children.add(self.make(ANY))
+        if self.universal in children:
+            return self.universal
+        if len(children) <= SUBSET_UNION_SIZE:
+            # ほかの項に含まれる項は除く(言語が同じ項は番号の小さい方を残す)
+            for term in sorted(children, reverse=True):
+                if any(self.subset(term, other) for other in children if other != term):
+                    children.discard(term)
+        if not children:
+            return self.empty
+        if len(children) == 1:
+            return children.pop()
+        return self.make(UNION, None, tuple(sorted(children)))
+
+    def star(self, term):
+        """ 項が表す文字列を0回以上並べた文字列を表す項を返す """
+        if term in (self.empty, self.epsilon_term):
+            return self.epsilon_term
+        kind, _, children = self.terms[term]
+        if kind == STAR:
+            return term
+        if kind == UNION and self.epsilon_term in children:
+            # (ε|r)* = r*
+            return self.star(self.union([child for child in children if child != self.epsilon_term]))
+        return self.make(STAR, None, (term,))
+
+    def derivative(self, term, label):
+        """
+        項termの同値類の代表labelによる導関数(termが表す文字列のうちlabelで始まるものからlabelを除いたもの)の項を返す
+        覚えていない部分項の導関数だけを、子が親より先になる順番で計算する(再帰しない)
+        """
+        derivatives = self.derivatives
+        stack = [term]
+        computed = 0
+        while stack:
+            current = stack[-1]
+            if (current, label) in derivatives:
+                stack.pop()
+                continue
+            kind, char, children = self.terms[current]
+            # 連結で左が空文字列を含まなければ、右の導関数は要らない
+            needed = children[:1] if kind == CONCAT and not self.nullable[children[0]] else children
+            missing = [child for child in needed if (child, label) not in derivatives]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            if kind == CHAR:
+                result = self.epsilon_term if char == label else self.empty
+            elif kind == ANY:
+                result = self.epsilon_term
+            elif kind == CONCAT:
+                left, right = children
+                result = self.concat_pair(derivatives[(left, label)], right)
+                if self.nullable[left]:
+                    result = self.union([result, derivatives[(right, label)]])
+            elif kind == UNION:
+                result = self.union([derivatives[(child, label)] for child in children])
+            elif kind == STAR:
+                result = self.concat_pair(derivatives[(children[0], label)], current)
+            else:
+                result = self.empty
+            derivatives[(current, label)] = result
+            computed += 1
+        if computed and Instrument.observer is not None:
+            Instrument.observer.count("derivatives", computed)
+        return derivatives[(term, label)]
+
+
+class DerivativeEngine(object):
+    """
+    項を状態とし、読んだ文字での導関数を次の状態とするDFAの実行器
+    状態と遷移は読んだ文字列に必要な分だけその場で作って覚えておく(eNFAも部分集合構成も使わない)
+    """
+
+    def __init__(self, terms, init_state):
+        self.terms = terms
+        self.init_state = init_state
+        # rowsは状態から{文字: 次の状態}への辞書
+        self.rows = {}
+
+    def stats(self):
+        """ 遷移を作った状態と、計算して覚えている導関数の数を返す """
+        return {"states": len(self.rows), "derivatives": len(self.terms.derivatives)}
+
+    def next_state(self, state, char):
+        """ 状態stateからcharを読んだ時の次の状態を返す(アルファベットに無い文字ならNone) """
+        row = self.rows.setdefault(state, {})
+        next_state = row.get(char)
+        if next_state is None:
+            label = self.terms.classes.get(char)
+            if label is not None:
+                next_state = row[char] = self.terms.derivative(state, label)
+        return next_state
+
+    def is_final(self, state):
+        """ 状態stateが受理状態(空文字列を含む項)ならTrue """
+        return self.terms.nullable[state]
+
+    def is_dead(self, state):
+        """ 状態stateから受理状態に行けないならTrue(正規化で空の言語の項は全部空集合になる) """
+        return state == self.terms.empty
+
+    def run(self, string, invalid="reject"):
+        """ stringを認識するかチェックする(アルファベットに無い文字はinvalidに従って扱う) """
+        state = self.advance(self.init_state, string, invalid)
+        if Instrument.observer is not None:
+            Instrument.observer.count("run_chars", len(string))
+        return state is not None and self.is_final(state)
+
+    def advance(self, state, string, invalid="reject"):
+        """
+        状態stateからstringを読んだ後の状態を返す(アルファベットに無い文字はinvalidに従って扱う)
+        空集合の項になったら残りは読まずにそれを返す(invalidが"raise"なら、残りにアルファベットに無い文字が無いかだけは確かめる)
+        """
+        rows = self.rows
+        empty = self.terms.empty
+        for position, char in enumerate(string):
+            if state == empty:
+                if invalid == "raise":
+                    position = first_invalid(string, position, self.terms.classes)
+                    if position is not None:
+                        raise InvalidSymbolError(string[position], position)
+                return state
+            row = rows.get(state)
+            next_state = None if row is None else row.get(char)
+            if next_state is None:
+                next_state = self.next_state(state, char)
+                if next_state is None:
+                    return invalid_symbol(invalid, char, position, empty)
+            state = next_state
+        return state
+
+
+class DerivativeDFA(ExploringDFA):
+    """
+    正規表現の項termsの導関数で作るDFA(状態は項の番号)
+    runなどはDerivativeEngineで読んだ文字列に必要な状態だけを作って実行する
+    states, transitions, final_states(とcompile, searchなどそれを使うもの)を使うと行ける項を全部作る
+    """
+
+    def __init__(self, terms, init_state):
+        self.terms = terms
+        super().__init__(terms.alphabet, init_state)
+
+    def engine(self):
+        """ runで使う実行器(DerivativeEngine)を返す """
+        if "derivative" not in self._cache:
+            self._cache["derivative"] = DerivativeEngine(self.terms, self.init_state)
+        return self._cache["derivative"]
+
+    def step(self, state, char):
+        """ 項stateからchar(ラベルか入力の文字)を読んだ時の次の項を返す(アルファベットに無い文字ならNone) """
+        label = self.terms.representatives.get(char)
+        if label is not None:
+            return self.terms.derivative(state, label)
+        return self.engine().next_state(state, char)
+
+    def is_final(self, state):
+        """ 項stateが受理状態(空文字列を含む)ならTrue """
+        return self.terms.nullable[state]
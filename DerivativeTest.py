@@ -0,0 +1,133 @@
+import itertools
+import os
+import tempfile
+import unittest
+import Automata
+import Regex
+from Alphabet import CharRanges
+from Automata import InvalidSymbolError, equivalent
+from Benchmark import nested_star_pattern
+from Derivative import Terms
+from Instrument import Recorder, observing
+from Regex import regex_to_derivative_DFA, regex_to_eNFA
+
+
+class TermsTest(unittest.TestCase):
+    """ 項の正規化の確認 """
+
+    def setUp(self):
+        self.terms = Terms("ab", "ab")
+        self.a = self.terms.char("a")
+        self.b = self.terms.char("b")
+
+    def test_hash_consing(self):
+        terms = self.terms
+        self.assertEqual(terms.concat([self.a, self.b]), terms.concat([self.a, terms.epsilon(), self.b]))
+        self.assertEqual(terms.concat([terms.concat([self.a, self.b]), self.a]), terms.concat([self.a, terms.concat([self.b, self.a])]))
+        self.assertEqual(terms.empty, terms.concat([self.a, terms.empty]))
+
+    def test_union(self):
+        terms = self.terms
+        self.assertEqual(terms.union([self.a, self.b]), terms.union([self.b, terms.union([self.a, self.a])]))
+        self.assertEqual(terms.any(), terms.union([self.a, self.b]))
+        self.assertEqual(terms.universal, terms.star(terms.union([self.a, self.b])))
+        self.assertEqual(terms.star(self.a), terms.union([terms.epsilon(), self.a, terms.star(self.a)]))
+        self.assertEqual(self.a, terms.union([self.a, terms.empty]))
+
+    def test_star(self):
+        terms = self.terms
+        star = terms.star(self.a)
+        self.assertEqual(star, terms.star(star))
+        self.assertEqual(star, terms.star(terms.union([terms.epsilon(), self.a])))
+        self.assertEqual(terms.epsilon(), terms.star(terms.empty))
+        self.assertEqual(star, terms.concat([terms.union([terms.epsilon(), self.a]), star]))
+
+
+class DerivativeDFATest(unittest.TestCase):
+    """ 導関数で作るDFAがeNFAと同じ言語を受理するかの確認 """
+
+    patterns = ["", "abc", "ab*c", "(ab|ac)c*b", "a.*bc", ".*cab", "(a|)*", "((a|b)*a)*b", "c(a|b)*c(a|b)*c", "(abc)*", "(a*b*)*c", "ba.c|b"]
+
+    def test_run(self):
+        strings = ["".join(chars) for length in range(6) for chars in itertools.product("abcx", repeat=length)]
+        for pattern in self.patterns:
+            enfa = regex_to_eNFA(pattern, "abc")
+            dfa = regex_to_derivative_DFA(pattern, "abc")
+            for string in strings:
+                self.assertEqual(enfa.run(string), dfa.run(string), (pattern, string))
+            self.assertTrue(equivalent(dfa, enfa.convert_to_DFA().minimized()), pattern)
+
+    def test_lazy(self):
+        """ runは読んだ文字列に必要な状態しか作らない """
+        dfa = regex_to_derivative_DFA("(0|1)*0(0|1)(0|1)(0|1)(0|1)(0|1)(0|1)(0|1)(0|1)(0|1)", "01")
+        self.assertTrue(dfa.run("0000000000"))
+        self.assertEqual(10, dfa.engine().stats()["states"])
+        self.assertIsNone(dfa._transitions)
+        self.assertEqual(1024, len(dfa.states))
+
+    def test_nested_star(self):
+        """ 入れ子になったスターでも状態数は深さに比例する程度で済む """
+        for depth in [10, 40]:
+            pattern = nested_star_pattern(depth)
+            dfa = regex_to_derivative_DFA(pattern, "ab")
+            self.assertLess(len(dfa.states), 2 * depth)
+            self.assertTrue(equivalent(dfa, regex_to_eNFA(pattern, "ab")))
+
+    def test_long_pattern(self):
+        """ 長い正規表現でも再帰しないので大丈夫 """
+        dfa = regex_to_derivative_DFA("a*b*" * 2000, "ab")
+        self.assertTrue(dfa.run("ab" * 1500))
+        self.assertFalse(dfa.run("ba" * 2001))
+
+    def test_unicode(self):
+        dfa = regex_to_derivative_DFA("a.*(b|c)", CharRanges.full() - CharRanges.of("x"))
+        for string, expected in [("ab", True), ("a日本語c", True), ("a😀b😀c", True), ("a日本", False), ("日b", False), ("axb", False)]:
+            self.assertEqual(expected, dfa.run(string), string)
+            # CharRangesのラベルでもstepで遷移できる
+            self.assertEqual(expected, dfa.minimized().run(string), string)
+        self.assertEqual(4, len(dfa.alphabet))
+
+    def test_invalid(self):
+        dfa = regex_to_derivative_DFA("a*", "ab")
+        self.assertFalse(dfa.run("aax"))
+        with self.assertRaises(InvalidSymbolError) as context:
+            dfa.run("aax", "raise")
+        self.assertEqual(2, context.exception.position)
+        matcher = dfa.matcher("dead")
+        self.assertTrue(matcher.feed("ax").is_dead())
+
+    def test_early_exit(self):
+        dfa = regex_to_derivative_DFA("ab*", "ab")
+        with observing(Recorder()) as recorder:
+            self.assertFalse(dfa.run("b" + "a" * 1000))
+        self.assertEqual(1, dfa.engine().stats()["states"])
+        self.assertGreater(recorder.counts["derivatives"], 0)
+        # 空集合の項になっても、"raise"なら後ろのアルファベットに無い文字は見つける
+        string = "b" * (Automata.SINK_CHECK_INTERVAL + 44) + "z"
+        with self.assertRaises(InvalidSymbolError) as context:
+            dfa.run(string, "raise")
+        self.assertEqual(len(string) - 1, context.exception.position)
+        self.assertFalse(dfa.run(string))
+
+    def test_compile(self):
+        automata = Regex.compile("x(a|b)*y", "abxy", engine="derivative")
+        self.assertIs(automata, Regex.compile("x(a|b)*y", "abxy", engine="derivative"))
+        self.assertTrue(automata.run("xabby"))
+        self.assertEqual((2, 6), automata.search("aaxaby"))
+        self.assertEqual([True, False], automata.run_many(["xy", "xay y"]))
+
+    def test_disk_cache(self):
+        """ ディスクのキャッシュがあっても保存はせず、行ける項を全部は作らない """
+        with tempfile.TemporaryDirectory() as directory:
+            try:
+                Regex.configure_cache(directory=directory)
+                automata = Regex.compile("(a|b)*a(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)", "ab", engine="derivative")
+                self.assertTrue(automata.run("ba" * 4))
+                self.assertEqual([], os.listdir(directory))
+                self.assertIsNone(automata._states)
+            finally:
+                Regex.configure_cache()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# 計測した値を受け取るObserver(Noneなら何も計測しない)
+observer = None
+
+# 長い構築でprogressを呼ぶ間隔(調べた状態や処理した分割の数)
+PROGRESS_INTERVAL = 1024
+
+
+class Cancelled(Exception):
+    """ CancellationTokenで構築が取り消された """
+    pass
+
+
+class CancellationToken(object):
+    """
+    長い構築(convert_to_DFA, minimizedなど)を途中でやめさせるための印
+    別のスレッドなどからcancelを呼ぶか、timeout秒が過ぎると、構築しているところでCancelledが投げられる
+    """
+
+    def __init__(self, timeout=None):
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self._cancelled = False
+
+    def cancel(self):
+        """ 取り消す """
+        self._cancelled = True
+
+    @property
+    def cancelled(self):
+        """ 取り消されていればTrue """
+        if not self._cancelled and self.deadline is not None and time.monotonic() >= self.deadline:
+            self._cancelled = True
+        return self._cancelled
+
+    def check(self):
+        """ 取り消されていればCancelledを投げる """
+        if self.cancelled:
+            raise Cancelled("construction was cancelled")
+
+
+class Observer(object):
+    """
+    計測した値を受け取る基底クラス(どのメソッドも何もしないので、必要なものだけ上書きする)
+    名前は次のようなもの
+        count: subset_states, epsilon_closures, refinement_rounds, block_splits, run_chars,
+               lazy_hits, lazy_misses, pattern_cache_hits, pattern_cache_misses, prefilter_checked, prefilter_rejected,
+               derivatives
+        gauge: subset_frontier
+        span : convert_to_DFA, minimized, epsilon_closures, compile
+    """
+
+    def count(self, name, amount=1):
+        """ 回数nameがamount増えた """
+
+    def gauge(self, name, value):
+        """ 大きさnameが今valueになった """
+
+    def span_start(self, name):
+        """ 処理nameが始まった """
+
+    def span_end(self, name, seconds):
+        """ 処理nameがseconds秒かかって終わった(例外で終わった時も呼ぶ) """
+
+
+class Recorder(Observer):
+    """ 回数の合計、大きさの最大値、処理ごとの回数と合計時間を覚えておくObserver """
+
+    def __init__(self):
+        self.counts = {}
+        self.maxima = {}
+        self.spans = {}
+
+    def count(self, name, amount=1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        if value > self.maxima.get(name, value - 1):
+            self.maxima[name] = value
+
+    def span_end(self, name, seconds):
+        calls, total = self.spans.get(name, (0, 0.0))
+        self.spans[name] = (calls + 1, total + seconds)
+
+    def hit_rate(self, prefix):
+        """ prefix_hitsとprefix_missesからヒット率を返す(一度も引いていなければNone) """
+        hits = self.counts.get(prefix + "_hits", 0)
+        total = hits + self.counts.get(prefix + "_misses", 0)
+        return hits / total if total else None
+
+    def report(self):
+        """ 覚えている値とキャッシュのヒット率をまとめた辞書を返す """
+        return {"counts": dict(self.counts), "maxima": dict(self.maxima),
+                "spans": {name: {"calls": calls, "seconds": total} for name, (calls, total) in self.spans.items()},
+                "hit_rates": {prefix: self.hit_rate(prefix) for prefix in ("lazy", "pattern_cache")}}
+
+
+def set_observer(new_observer):
+    """ 計測した値を送るObserverをnew_observerにして(Noneなら計測をやめる)、前のObserverを返す """
+    global observer
+    previous, observer = observer, new_observer
+    return previous
+
+
+@contextmanager
+def observing(new_observer):
+    """ withの中だけnew_observerに計測した値を送る """
+    previous = set_observer(new_observer)
+    try:
+        yield new_observer
+    finally:
+        set_observer(previous)
+
+
+def timed(name):
+    """ 関数の実行をObserverに処理nameとして知らせるデコレータ(Observerが無ければそのまま呼ぶだけ) """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            current = observer
+            if current is None:
+                return function(*args, **kwargs)
+            current.span_start(name)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                current.span_end(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
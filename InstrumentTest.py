@@ -0,0 +1,129 @@
+import threading
+import unittest
+import Instrument
+from Benchmark import is_divisible_by, nth_from_end
+from Cache import PatternCache
+from Instrument import Cancelled, CancellationToken, Observer, Recorder, observing
+from Regex import build, regex_to_eNFA
+from Examples import Has010, Has010_DFA, IsDivisibleBy3
+
+
+class RecorderTest(unittest.TestCase):
+    """ Recorderに計測した値が届くかの確認 """
+
+    def test_disabled(self):
+        self.assertIsNone(Instrument.observer)
+        self.assertTrue(IsDivisibleBy3().run("0011"))
+
+    def test_convert(self):
+        with observing(Recorder()) as recorder:
+            dfa = nth_from_end(6).convert_to_DFA()
+        self.assertIsNone(Instrument.observer)
+        self.assertEqual(recorder.counts["subset_states"], len(dfa.states))
+        self.assertGreater(recorder.maxima["subset_frontier"], 0)
+        self.assertEqual(recorder.spans["convert_to_DFA"][0], 1)
+
+    def test_epsilon_closures(self):
+        enfa = regex_to_eNFA("(a|b)*abb", "ab")
+        with observing(Recorder()) as recorder:
+            enfa.convert_to_DFA()
+        self.assertEqual(recorder.counts["epsilon_closures"], len(enfa.states))
+        self.assertIn("epsilon_closures", recorder.spans)
+
+    def test_minimize(self):
+        for method in ["hopcroft", "table"]:
+            with observing(Recorder()) as recorder:
+                Has010_DFA().minimized(method)
+            self.assertGreater(recorder.counts["refinement_rounds"], 0)
+            self.assertEqual(recorder.spans["minimized"][0], 1)
+
+    def test_run(self):
+        lazy = Has010()
+        lazy.run("0")
+        with observing(Recorder()) as recorder:
+            IsDivisibleBy3().run("0011")
+            lazy.run("0101")
+            lazy.run("0101")
+            IsDivisibleBy3().matcher().feed("01").feed("1")
+        self.assertEqual(recorder.counts["run_chars"], 15)
+        self.assertEqual(recorder.counts["lazy_hits"] + recorder.counts["lazy_misses"], 8)
+        self.assertGreater(recorder.hit_rate("lazy"), 0.5)
+
+    def test_compile(self):
+        """ compileの計測は表を作った時だけで、覚えておいた表を使うrunでは知らせない """
+        dfa = IsDivisibleBy3()
+        with observing(Recorder()) as recorder:
+            dfa.run("0011")
+            dfa.run("0011")
+        self.assertEqual(recorder.spans["compile"][0], 1)
+
+    def test_pattern_cache(self):
+        cache = PatternCache(build)
+        with observing(Recorder()) as recorder:
+            for _ in range(4):
+                cache.get("ab*", "ab", "dfa")
+        self.assertEqual(recorder.report()["hit_rates"]["pattern_cache"], 0.75)
+        self.assertIsNone(recorder.report()["hit_rates"]["lazy"])
+
+    def test_observer_interface(self):
+        """ 上書きしていないメソッドは何もしない """
+        events = []
+
+        class Spans(Observer):
+            def span_start(self, name):
+                events.append(("start", name))
+
+            def span_end(self, name, seconds):
+                events.append(("end", name))
+
+        with observing(Spans()):
+            is_divisible_by(5).minimized()
+        self.assertEqual(events, [("start", "minimized"), ("end", "minimized")])
+
+
+class ProgressTest(unittest.TestCase):
+    """ 長い構築の途中経過と取り消しの確認 """
+
+    def test_progress(self):
+        calls = []
+        dfa = nth_from_end(12).convert_to_DFA(progress=lambda done, pending: calls.append((done, pending)))
+        self.assertEqual(len(calls), len(dfa.states) // Instrument.PROGRESS_INTERVAL + 1)
+        self.assertEqual(calls[-1], (len(dfa.states), 0))
+        calls = []
+        is_divisible_by(3000).minimized(progress=lambda done, pending: calls.append(done))
+        self.assertEqual(calls[-1], max(calls))
+
+    def test_cancel(self):
+        token = CancellationToken()
+        token.cancel()
+        with self.assertRaises(Cancelled):
+            nth_from_end(8).convert_to_DFA(token=token)
+        with self.assertRaises(Cancelled):
+            is_divisible_by(100).minimized(token=token)
+        with self.assertRaises(Cancelled):
+            is_divisible_by(100).minimized("table", token=token)
+
+    def test_cancel_from_progress(self):
+        """ progressの中から取り消すと次に調べる状態の所で止まる """
+        token = CancellationToken()
+        with self.assertRaises(Cancelled):
+            nth_from_end(14).convert_to_DFA(progress=lambda done, pending: token.cancel(), token=token)
+
+    def test_timeout(self):
+        token = CancellationToken(timeout=0)
+        self.assertTrue(token.cancelled)
+        self.assertFalse(CancellationToken(timeout=60).cancelled)
+
+    def test_cancel_from_thread(self):
+        token = CancellationToken()
+        timer = threading.Timer(0.01, token.cancel)
+        timer.start()
+        try:
+            with self.assertRaises(Cancelled):
+                nth_from_end(20).convert_to_DFA(token=token)
+        finally:
+            timer.cancel()
+
+
+if __name__ == "__main__":
+    unittest.main()
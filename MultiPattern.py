@@ -0,0 +1,194 @@
+from array import array
+from collections import deque
+from Automata import LazyDFA, NFAWithEpsilonTransition, ThompsonBuilder
+from Regex import ast_to_fragment, literal_of, parse
+
+
+class TaggedDFA(object):
+    """
+    受理状態に当てはまったパターンの番号の集合を持たせたDFA
+    lazy=Falseなら始状態から行ける状態を全部作って整数の遷移表にまとめる
+    lazy=Trueなら必要な状態だけをLazyDFAでその場で作る
+    """
+
+    def __init__(self, enfa, final_ids, lazy=False, cache_size=1024):
+        # final_idsはeNFAの終了状態からパターンの番号への辞書
+        nfa = enfa.bitset()
+        index = {state: i for i, state in enumerate(nfa.states)}
+        self.id_masks = {}
+        for state, pattern_id in final_ids.items():
+            self.id_masks[pattern_id] = self.id_masks.get(pattern_id, 0) | 1 << index[state]
+        self.alphabet = frozenset(enfa.alphabet)
+        self.lazy = LazyDFA(nfa, cache_size) if lazy else None
+        if lazy:
+            self.init_state = nfa.init_state
+            self.id_cache = {}
+            self.cache_size = cache_size
+        else:
+            self.build(nfa)
+
+    def build(self, nfa):
+        """ 部分集合構成で全部の状態を作り、遷移表と状態ごとのパターンの番号の集合を作る """
+        alphabet = sorted(self.alphabet, key=str)
+        self.symbols = {char: column for column, char in enumerate(alphabet)}
+        self.width = len(alphabet)
+        self.table = array("i")
+        masks = [nfa.init_state]
+        index = {nfa.init_state: 0}
+        i = 0
+        while i < len(masks):
+            for char in alphabet:
+                target = nfa.next_states(masks[i], char)
+                if target not in index:
+                    index[target] = len(masks)
+                    masks.append(target)
+                self.table.append(index[target])
+            i += 1
+        self.init_state = 0
+        self.ids = [self.ids_of_mask(mask) for mask in masks]
+
+    def ids_of_mask(self, mask):
+        """ NFAの状態集合maskに含まれる終了状態のパターンの番号の集合を返す """
+        return frozenset(pattern_id for pattern_id, id_mask in self.id_masks.items() if mask & id_mask)
+
+    def ids_of(self, state):
+        """ DFAの状態stateで当てはまっているパターンの番号の集合を返す """
+        if self.lazy is None:
+            return self.ids[state]
+        ids = self.id_cache.get(state)
+        if ids is None:
+            if len(self.id_cache) >= self.cache_size:
+                self.id_cache.clear()
+            ids = self.id_cache[state] = self.ids_of_mask(state)
+        return ids
+
+    def step(self, state, char):
+        """ DFAの状態stateからcharを読んだ時の次の状態を返す """
+        if self.lazy is None:
+            return self.table[state * self.width + self.symbols[char]]
+        return self.lazy.next_state(state, char)
+
+
+class AhoCorasick(object):
+    """ 決まった文字列(リテラル)だけのパターンの集合を探すAho-Corasickのオートマトン """
+
+    def __init__(self, literals):
+        # literalsは(パターンの番号, 文字列)のリスト
+        # gotoはトライの各節点の{文字: 次の節点}、outputはその節点で見つかるパターンの番号の集合
+        self.goto = [{}]
+        self.output = [set()]
+        for pattern_id, literal in literals:
+            node = 0
+            for char in literal:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.output.append(set())
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.output[node].add(pattern_id)
+
+        # 幅優先で失敗したときの戻り先を決め、戻り先で見つかるパターンも引き継ぐ
+        # (根の子の戻り先は根なので、根の子から始めればnodeが根になることは無い)
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] |= self.output[self.fail[child]]
+                queue.append(child)
+        self.output = [frozenset(output) for output in self.output]
+
+    def search(self, text, alphabet):
+        """ textの中に現れるパターンの番号の集合を返す(alphabetに無い文字をまたぐものは数えない) """
+        goto = self.goto
+        fail = self.fail
+        seen = bytearray(len(goto))
+        seen[0] = 1
+        found = set(self.output[0])
+        node = 0
+        for char in text:
+            if char not in alphabet:
+                node = 0
+                continue
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if not seen[node]:
+                seen[node] = 1
+                found |= self.output[node]
+        return frozenset(found)
+
+
+class MultiPattern(object):
+    """
+    複数の正規表現を一つのDFAにまとめ、一回読むだけでどのパターンに当てはまるかを調べる
+    patternsはリスト(番号は添字)か{番号: 正規表現}の辞書
+    全部のパターンがリテラルならAho-Corasickのオートマトンを使う
+    """
+
+    def __init__(self, patterns, alphabet, lazy=False, cache_size=1024):
+        items = list(patterns.items()) if isinstance(patterns, dict) else list(enumerate(patterns))
+        self.patterns = dict(items)
+        self.alphabet = frozenset(alphabet)
+        trees = [(pattern_id, parse(pattern)) for pattern_id, pattern in items]
+        literals = [(pattern_id, literal_of(tree)) for pattern_id, tree in trees]
+
+        if all(literal is not None for _, literal in literals):
+            # アルファベットに無い文字を含むリテラルはどこにも当てはまらない
+            literals = [(pattern_id, literal) for pattern_id, literal in literals if set(literal) <= self.alphabet]
+            self.literals = {}
+            for pattern_id, literal in literals:
+                self.literals.setdefault(literal, set()).add(pattern_id)
+            self.aho_corasick = AhoCorasick(literals)
+            return
+        self.aho_corasick = None
+
+        # 全部のパターンの断片を一つのThompsonBuilderに作り、始状態からε遷移でつなぐ
+        # searchでは先頭に任意の文字列を読み飛ばせる状態を付けたものを使う
+        builder = ThompsonBuilder(self.alphabet)
+        init_state = builder.new_state()
+        final_ids = {}
+        for pattern_id, tree in trees:
+            start, end = ast_to_fragment(tree, builder)
+            builder.add(init_state, -1, start)
+            final_ids[end] = pattern_id
+        unanchored_state = builder.new_state()
+        builder.add(unanchored_state, -1, init_state)
+        for char in self.alphabet:
+            builder.add(unanchored_state, char, unanchored_state)
+        anchored = builder.build(init_state, final_ids)
+        unanchored = NFAWithEpsilonTransition(anchored.states, anchored.alphabet, anchored.transitions, unanchored_state, final_ids)
+        self.anchored = TaggedDFA(anchored, final_ids, lazy, cache_size)
+        self.unanchored = TaggedDFA(unanchored, final_ids, lazy, cache_size)
+
+    def run(self, string):
+        """ string全体に当てはまるパターンの番号の集合を返す """
+        if self.aho_corasick is not None:
+            return frozenset(self.literals.get(string, ()))
+        dfa = self.anchored
+        state = dfa.init_state
+        for char in string:
+            if char not in self.alphabet:
+                return frozenset()
+            state = dfa.step(state, char)
+        return dfa.ids_of(state)
+
+    def search(self, text):
+        """ textのどこかの部分に当てはまるパターンの番号の集合を返す(textは一回前から読むだけ) """
+        if self.aho_corasick is not None:
+            return self.aho_corasick.search(text, self.alphabet)
+        dfa = self.unanchored
+        state = dfa.init_state
+        seen = {state}
+        found = set(dfa.ids_of(state))
+        for char in text:
+            # アルファベットに無い文字をまたぐ部分は無いので最初からやり直す
+            state = dfa.init_state if char not in self.alphabet else dfa.step(state, char)
+            if state not in seen:
+                seen.add(state)
+                found |= dfa.ids_of(state)
+        return frozenset(found)
@@ -0,0 +1,43 @@
+import random
+import unittest
+from MultiPattern import MultiPattern
+from Regex import regex_to_eNFA
+
+
+class MultiPatternTest(unittest.TestCase):
+    """ 複数パターンをまとめたDFAの確認 """
+    alphabet = {"a", "b", "c"}
+
+    def check(self, patterns, lazy=False):
+        """ 一つずつのeNFAで調べた結果と同じになるか """
+        multi = MultiPattern(patterns, self.alphabet, lazy=lazy)
+        automaton = [regex_to_eNFA(pattern, self.alphabet) for pattern in patterns]
+        random.seed(len(patterns))
+        for _ in range(200):
+            text = "".join(random.choice("abcx") for _ in range(random.randint(0, 10)))
+            expected = frozenset(i for i, automata in enumerate(automaton) if automata.matcher().feed(text).finish())
+            self.assertEqual(expected, multi.run(text))
+            expected = frozenset(i for i, automata in enumerate(automaton) if automata.search(text) is not None)
+            self.assertEqual(expected, multi.search(text))
+        return multi
+
+    def test_regex(self):
+        patterns = ["a*b", "(ab|c)*", "abc", "a.c", "(a|b)*cc", "b"]
+        self.assertIsNone(self.check(patterns).aho_corasick)
+        self.check(patterns, lazy=True)
+
+    def test_literals(self):
+        patterns = ["ab", "b", "abc", "bca", "cab", "x", "caa", "aab"]
+        self.assertIsNotNone(self.check(patterns).aho_corasick)
+        self.assertEqual(MultiPattern(["ab", "b", "abb"], self.alphabet).search("xabbx"), frozenset({0, 1, 2}))
+
+    def test_ids(self):
+        multi = MultiPattern({"even": "(..)*", "has_c": ".*c.*"}, self.alphabet)
+        self.assertEqual(multi.run("ab"), frozenset({"even"}))
+        self.assertEqual(multi.run("ac"), frozenset({"even", "has_c"}))
+        self.assertEqual(multi.run("acc"), frozenset({"has_c"}))
+        self.assertEqual(multi.run("ax"), frozenset())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import codecs
+import Instrument
+
+# bytesのままリテラルを探せる符号化(状態を持たずBOMも付かないので、文字列を符号化したものがそのまま部分列になる)
+PLAIN_ENCODINGS = {"utf-8", "ascii", "iso8859-1", "cp1252", "utf-16-le", "utf-16-be", "utf-32-le", "utf-32-be"}
+
+
+class Prefilter(object):
+    """
+    受理する文字列が必ず含むリテラル(先頭, 末尾, 途中のどこか)をstr.find/bytes.findで先に調べ、
+    当てはまるはずの無い入力や部分をオートマトンを動かす前に読み飛ばすためのもの
+        prefix    : 受理する文字列は必ずこれで始まる
+        suffix    : 受理する文字列は必ずこれで終わる
+        factor    : 受理する文字列は必ずこれを含む(prefixやsuffixより長ければこちらを使う)
+        min_length: 受理する文字列の長さの最小値
+        max_length: 受理する文字列の長さの最大値(上限が無ければNone)
+    checkedは調べた回数、rejectedはそのうち当てはまらないと分かった回数
+    """
+
+    def __init__(self, prefix="", suffix="", factor="", min_length=0, max_length=None):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.factor = max([factor, prefix, suffix], key=len)
+        self.min_length = min_length
+        self.max_length = max_length
+        self.checked = 0
+        self.rejected = 0
+        # 符号化の方式からbytesにしたリテラル(prefix, suffix, factor)への辞書
+        self._encoded = {}
+
+    def __repr__(self):
+        return "Prefilter(prefix=%r, suffix=%r, factor=%r, min_length=%d, max_length=%r)" % (
+            self.prefix, self.suffix, self.factor, self.min_length, self.max_length)
+
+    def __bool__(self):
+        """ 何か読み飛ばせる条件があればTrue """
+        return bool(self.factor) or self.min_length > 0 or self.max_length is not None
+
+    def literals(self, text, encoding):
+        """
+        textがstrでなければencodingでbytesにした(prefix, suffix, factor)を返す
+        PLAIN_ENCODINGSに無い符号化や、リテラルを符号化できない時はbytesのままでは調べられないのでNone
+        """
+        if isinstance(text, str):
+            return self.prefix, self.suffix, self.factor
+        if encoding not in self._encoded:
+            try:
+                if codecs.lookup(encoding).name not in PLAIN_ENCODINGS:
+                    raise ValueError(encoding)
+                self._encoded[encoding] = tuple(literal.encode(encoding) for literal in (self.prefix, self.suffix, self.factor))
+            except (LookupError, ValueError):
+                self._encoded[encoding] = None
+        return self._encoded[encoding]
+
+    def count(self, passed):
+        """ 調べた回数を数え、passedをそのまま返す """
+        self.checked += 1
+        if not passed:
+            self.rejected += 1
+        if Instrument.observer is not None:
+            Instrument.observer.count("prefilter_checked")
+            if not passed:
+                Instrument.observer.count("prefilter_rejected")
+        return passed
+
+    def may_match(self, text, encoding="utf-8"):
+        """
+        text全体が受理される可能性があればTrue(Falseなら受理されないことが確実)
+        textはstrか、findとスライスができるbytes-likeなもの(bytes, bytearray, mmapなど)
+        """
+        literals = self.literals(text, encoding)
+        if literals is None:
+            return True
+        prefix, suffix, factor = literals
+        length = len(text)
+        # 符号化したbytesの長さは文字数と違うので、長さの範囲はstrの時だけ確かめる
+        passed = not isinstance(text, str) or self.min_length <= length and (self.max_length is None or length <= self.max_length)
+        passed = (passed and length >= max(len(prefix), len(suffix)) and text[:len(prefix)] == prefix
+                  and text[length - len(suffix):] == suffix and (not factor or text.find(factor) != -1))
+        return self.count(passed)
+
+    def match_possible(self, text, pos=0):
+        """ text[pos:]の先頭から始まる受理される部分がありうるならTrue """
+        end = None if self.max_length is None else pos + self.max_length
+        passed = text.startswith(self.prefix, pos) and (not self.factor or text.find(self.factor, pos, end) != -1)
+        return self.count(passed)
+
+    def search_start(self, text, pos=0):
+        """
+        text[pos:]の中の受理される部分が始まりうる最初の位置を返す(どこにも無いことが確実ならNone)
+        prefixの最初の出現より前や、長さに上限がある時にfactorの最初の出現から遠すぎる所からは始まらない
+        """
+        if self.prefix:
+            pos = text.find(self.prefix, pos)
+        if pos != -1 and self.factor:
+            found = text.find(self.factor, pos)
+            if found == -1:
+                pos = -1
+            elif self.max_length is not None:
+                pos = max(pos, found + len(self.factor) - self.max_length)
+        if not self.count(pos != -1):
+            return None
+        return pos
+
+    def stats(self):
+        """ 調べた回数、当てはまらないと分かった回数と、調べたうち通した割合(selectivity)を返す """
+        passed = self.checked - self.rejected
+        return {"checked": self.checked, "rejected": self.rejected, "selectivity": passed / self.checked if self.checked else None}
@@ -0,0 +1,136 @@
+import itertools
+import os
+import tempfile
+import unittest
+import Automata
+import Regex
+from unittest import mock
+from Instrument import Recorder, observing
+from Prefilter import Prefilter
+from Regex import FACTOR_LENGTH_LIMIT, build, common_factor, parse, prefilter, regex_to_eNFA, required_literals
+from Stream import match_mmap
+
+
+class RequiredLiteralsTest(unittest.TestCase):
+    """ 正規表現が必ず持つリテラルの確認 """
+
+    def test_literals(self):
+        cases = [("abc", "abc", "abc", "abc", 3, 3),
+                 ("ab*c", "a", "c", "a", 2, None),
+                 ("x.*foo.*y", "x", "y", "foo", 5, None),
+                 ("(ab|ac)d", "a", "d", "a", 3, 3),
+                 ("(xabcx|yabcy)", "", "", "abc", 5, 5),
+                 ("(a|b)*", "", "", "", 0, None),
+                 ("a(|b)c", "a", "c", "a", 2, 3)]
+        for pattern, prefix, suffix, factor, min_length, max_length in cases:
+            literals = required_literals(parse(pattern))
+            self.assertEqual((prefix, suffix, factor, min_length, max_length), literals[1:], pattern)
+
+    def test_common_factor(self):
+        """ 全部の部分文字列を長い順に試すのと同じものを返す """
+        def naive(strings):
+            first = strings[0]
+            for length in range(len(first), 0, -1):
+                for start in range(len(first) - length + 1):
+                    if all(first[start:start + length] in string for string in strings):
+                        return first[start:start + length]
+            return ""
+        words = ["".join(chars) for length in range(5) for chars in itertools.product("ab", repeat=length)]
+        for strings in itertools.product(words[::3], words[1::4], words[2::5]):
+            self.assertEqual(naive(strings), common_factor(strings), strings)
+        # 長い文字列でもすぐに終わり、長さはFACTOR_LENGTH_LIMITまで
+        strings = ["x" + "ab" * 1500, "ab" * 1500 + "y"]
+        self.assertEqual("ab" * (FACTOR_LENGTH_LIMIT // 2), common_factor(strings))
+
+    def test_empty(self):
+        self.assertFalse(prefilter("(a|b)*"))
+        self.assertTrue(prefilter("(a|b)*c"))
+        self.assertTrue(prefilter("(a|b)(a|b)"))
+
+
+class PrefilterTest(unittest.TestCase):
+    """ Prefilterを付けても結果が変わらず、当てはまらない入力を読み飛ばすかの確認 """
+
+    patterns = ["abc", "ab*c", "(ab|ac)c*b", "a.*bc", ".*cab", "(bab|cab)a*", "c(a|b)*c(a|b)*c", "(abc)*", "ba.c"]
+
+    def setUp(self):
+        self.strings = ["".join(chars) for length in range(7) for chars in itertools.product("abc", repeat=length)]
+
+    def test_run_many(self):
+        for pattern in self.patterns:
+            plain = regex_to_eNFA(pattern, "abc").convert_to_DFA().minimized()
+            filtered = build(pattern, "abc")
+            expected = [plain.run(string) for string in self.strings]
+            self.assertEqual(expected, filtered.run_many(self.strings), pattern)
+            with mock.patch.object(Automata, "numpy", None):
+                self.assertEqual(expected, filtered.run_many(self.strings), pattern)
+            self.assertEqual(expected, list(filtered.match_parallel(self.strings, workers=1)), pattern)
+
+    def test_search(self):
+        for pattern in self.patterns:
+            plain = regex_to_eNFA(pattern, "abc").convert_to_DFA().minimized()
+            filtered = build(pattern, "abc")
+            self.assertEqual(bool(prefilter(pattern)), filtered.searcher().prefilter is not None)
+            for text in self.strings[::7]:
+                for pos in range(len(text) + 1):
+                    self.assertEqual(plain.search(text, pos), filtered.search(text, pos), (pattern, text, pos))
+                    self.assertEqual(plain.match(text, pos), filtered.match(text, pos), (pattern, text, pos))
+                self.assertEqual(list(plain.finditer(text)), list(filtered.finditer(text)), (pattern, text))
+
+    def test_match_parallel(self):
+        automata = build("a.*bc", "abc")
+        strings = self.strings[:300]
+        expected = [automata.run(string) for string in strings]
+        self.assertEqual(expected, list(automata.match_parallel(strings, workers=2, chunksize=16)))
+
+    def test_stats(self):
+        automata = build("x.*foo", "fox")
+        with observing(Recorder()) as recorder:
+            results = list(automata.run_many(["xfoo", "xxfoo", "foo", "xofo"]))
+        self.assertEqual([True, True, False, False], results)
+        self.assertEqual({"checked": 4, "rejected": 2, "selectivity": 0.5}, automata.prefilter().stats())
+        self.assertEqual(4, recorder.counts["prefilter_checked"])
+        self.assertEqual(2, recorder.counts["prefilter_rejected"])
+
+    def test_disk_cache(self):
+        """ ディスクのキャッシュから読んだDFAにもPrefilterが付く """
+        with tempfile.TemporaryDirectory() as directory:
+            try:
+                cache = Regex.configure_cache(directory=directory)
+                Regex.compile("ab*c", "abc")
+                cache.clear()
+                automata = Regex.compile("ab*c", "abc")
+                self.assertEqual(1, cache.stats()["disk_hits"])
+                self.assertEqual("a", automata.prefilter().prefix)
+            finally:
+                Regex.configure_cache()
+
+    def test_search_start(self):
+        """ 長さに上限があれば、factorの最初の出現から遠すぎる所は読み飛ばす """
+        literals = Prefilter(factor="foo", max_length=5)
+        self.assertEqual(6, literals.search_start("xxxxxxxxfoo"))
+        self.assertEqual(1, literals.search_start("xxxfoo"))
+        self.assertIsNone(literals.search_start("xxfo"))
+        self.assertEqual(3, Prefilter(prefix="ab").search_start("xxxabx"))
+
+    def test_bytes(self):
+        literals = prefilter("日.*本")
+        self.assertTrue(literals.may_match("日xx本".encode("utf-8")))
+        self.assertFalse(literals.may_match("日xx".encode("utf-8")))
+        self.assertTrue(literals.may_match("日xx本".encode("utf-16-le"), "utf-16-le"))
+        # BOMの付く符号化ではbytesのままでは調べない
+        self.assertTrue(literals.may_match("日xx".encode("utf-16"), "utf-16"))
+
+    def test_mmap(self):
+        automata = build("a.*bc", "abc")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "input.txt")
+            for text, expected in [("aaabc", True), ("aaab", False), ("babc", False)]:
+                with open(path, "w") as file:
+                    file.write(text)
+                self.assertEqual(expected, match_mmap(automata, path))
+        self.assertEqual(2, automata.prefilter().rejected)
+
+
+if __name__ == "__main__":
+    unittest.main()
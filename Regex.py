@@ -1,141 +1,365 @@
-from Automata import NFAWithEpsilonTransition as eNFA
+from collections import namedtuple
+from Alphabet import split_alphabet
+from Automata import ThompsonBuilder
+from Cache import PatternCache
+from Derivative import DerivativeDFA, Terms
+from Prefilter import Prefilter
 
 
-def is_dot(string):
-    """ stringが任意の一文字を表す記号"."ならTrue """
-    return string == "."
+# 構文木の節の種類
+EPSILON = "epsilon"
+CHAR = "char"
+DOT = "dot"
+CONCAT = "concat"
+UNION = "union"
+STAR = "star"
 
+# 構文木の節: kindは上の種類、charはCHARの文字、childrenは子の節のタプル
+Node = namedtuple("Node", ["kind", "char", "children"])
 
-def is_atom(string):
+# 構文木が表す文字列が必ず持つリテラル
+#     exact     : 決まった一つの文字列だけを表すならその文字列(そうでなければNone)
+#     prefix    : 必ずこれで始まる
+#     suffix    : 必ずこれで終わる
+#     factor    : 必ずこれを含む(見つかったうちで最長のもの)
+#     min_length: 長さの最小値
+#     max_length: 長さの最大値(上限が無ければNone)
+Literals = namedtuple("Literals", ["exact", "prefix", "suffix", "factor", "min_length", "max_length"])
+
+SPECIAL_CHARS = "()|*."
+
+# common_factorで探す部分文字列の長さの上限(これより長くても入力を読み飛ばす効果はほとんど変わらない)
+FACTOR_LENGTH_LIMIT = 256
+
+
+def tokenize(string):
+    """
+    正規表現stringを(種類, 文字, 位置)の字句の列にする
+    種類は"("、")"、"|"、"*"、"."、通常の文字ならCHAR
+
+    >>> [kind for kind, _, _ in tokenize("(a|b)*.")]
+    ['(', 'char', '|', 'char', ')', '*', '.']
+    """
+    for position, char in enumerate(string):
+        yield (char if char in SPECIAL_CHARS else CHAR), char, position
+
+
+def sequence(items):
+    """ 項のリストitemsを連結した節を返す """
+    if not items:
+        return Node(EPSILON, None, ())
+    if len(items) == 1:
+        return items[0]
+    return Node(CONCAT, None, tuple(items))
+
+
+def alternation(branches):
+    """ 選択肢のリストbranchesの和の節を返す """
+    if len(branches) == 1:
+        return branches[0]
+    return Node(UNION, None, tuple(branches))
+
+
+def parse(string):
     """
-    stringが通常の文字一つならTrue、それ以外はFalse
-    >>> is_atom("a")
-    True
-    >>> is_atom("a*")
-    False
-    >>> is_atom("(ab)")
-    False
+    正規表現stringを一回前から読むだけで構文木にする(再帰しないので深い入れ子でも大丈夫)
+    優先順位は強い方から "*", 連結, "|" で、"()"でくくった部分は一つの項になる
+
+    >>> to_regex(parse("(abc)*(a|b|c)(cba)*abc"))
+    '(abc)*(a|b|c)(cba)*abc'
+    >>> to_regex(parse("(a|(b|c))"))
+    '(a|(b|c))'
+    >>> to_regex(parse("(((a|A)(b|B)(c|C)))"))
+    '(a|A)(b|B)(c|C)'
+    >>> parse("a|b*").kind
+    'union'
+    >>> parse("(a|)").children[1].kind
+    'epsilon'
     """
-    return True if len(string) == 1 and string not in "()|*." else False
+    # stackには外側のグループの(選択肢のリスト, 連結している項のリスト)を積む
+    stack = []
+    branches = []
+    items = []
+    for kind, char, position in tokenize(string):
+        if kind == "(":
+            stack.append((branches, items))
+            branches, items = [], []
+        elif kind == ")":
+            if not stack:
+                raise ValueError("invalid regular expression: unbalanced ')' at %d in %s" % (position, string))
+            group = alternation(branches + [sequence(items)])
+            branches, items = stack.pop()
+            items.append(group)
+        elif kind == "|":
+            branches.append(sequence(items))
+            items = []
+        elif kind == "*":
+            if not items:
+                raise ValueError("invalid regular expression: nothing to repeat at %d in %s" % (position, string))
+            if items[-1].kind != STAR:
+                items[-1] = Node(STAR, None, (items[-1],))
+        elif kind == ".":
+            items.append(Node(DOT, None, ()))
+        else:
+            items.append(Node(CHAR, char, ()))
+    if stack:
+        raise ValueError("invalid regular expression: missing ')' in %s" % string)
+    return alternation(branches + [sequence(items)])
 
 
-def is_repeat(string):
+def postorder(node):
+    """ 構文木nodeの節を子が親より先に来る順番で返す(再帰しない) """
+    stack = [(node, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded or not node.children:
+            yield node
+            continue
+        stack.append((node, True))
+        for child in reversed(node.children):
+            stack.append((child, False))
+
+
+def fold(node, function):
+    """ 構文木nodeを葉から順にfunction(節, 子の結果のリスト)で畳み込んだ結果を返す """
+    results = []
+    for current in postorder(node):
+        count = len(current.children)
+        children = results[len(results) - count:]
+        del results[len(results) - count:]
+        results.append(function(current, children))
+    return results[0]
+
+
+def to_regex(node):
+    """ 構文木nodeを正規表現の文字列に戻す """
+    def function(node, children):
+        if node.kind == EPSILON:
+            return ""
+        if node.kind == CHAR:
+            return node.char
+        if node.kind == DOT:
+            return "."
+        if node.kind == CONCAT:
+            return "".join(children)
+        if node.kind == UNION:
+            return "(%s)" % "|".join(children)
+        # STAR
+        child = children[0]
+        return child + "*" if len(child) == 1 or node.children[0].kind == UNION else "(%s)*" % child
+    return fold(node, function)
+
+
+def ast_to_fragment(node, builder):
+    """ 正規表現の構文木nodeを認識する断片(始状態, 終状態)をThompsonBuilderのbuilderに作る """
+    def function(node, children):
+        if node.kind == EPSILON:
+            return builder.epsilon()
+        if node.kind == CHAR:
+            return builder.char(node.char)
+        if node.kind == DOT:
+            return builder.any()
+        if node.kind == CONCAT:
+            return builder.concat(children)
+        if node.kind == UNION:
+            return builder.union(children)
+        return builder.star(children[0])
+    return fold(node, function)
+
+
+def ast_to_eNFA(node, alphabet):
     """
-    stringが"X*"ならTrue、それ以外はFalse
-
-    >>> is_repeat("a*")
-    True
-    >>> is_repeat("(ab)*")
-    True
-    >>> is_repeat("abc")
-    False
+    正規表現の構文木nodeを認識するeNFAを返す(状態は0から始まる整数で、数は構文木の大きさに比例する)
+    alphabetがCharRangesなら、正規表現に現れる文字とそれ以外全部をまとめたCharRangesをラベルにする
+    (Unicode全体のような大きなアルファベットでも"."は遷移を数個しか作らない)
     """
-    return len(string) > 1 and string[-1] == "*"
+    chars = (current.char for current in postorder(node) if current.kind == CHAR)
+    builder = ThompsonBuilder(split_alphabet(alphabet, chars))
+    init_state, final_state = ast_to_fragment(node, builder)
+    return builder.build(init_state, {final_state})
 
 
-def is_union(string):
+def ast_to_derivative_DFA(node, alphabet):
     """
-    stringが文字の集合を表す正規表現ならTrue
-
-    >>> is_union("(abcd)")
-    True
-    >>> is_union("(a(bc)d)")
-    True
-    >>> is_union("ab(cd)")
-    False
+    正規表現の構文木nodeを認識するDFAを、eNFAも部分集合構成も使わずに導関数で作って返す(DerivativeDFA)
+    状態は読んだ文字列に必要な分だけその場で作る
     """
-    return string[0] == "(" and string[-1] == ")"
+    terms = Terms(alphabet, (current.char for current in postorder(node) if current.kind == CHAR))
+    return DerivativeDFA(terms, ast_to_fragment(node, terms))
 
 
-def remove_outer_branket(string):
+def literal_of(node):
     """
-    一番外側のカッコが外せるなら外して、外せないならそのまま返す
+    構文木nodeが決まった一つの文字列だけを表すならその文字列を、そうでなければNoneを返す
 
-    >>> remove_outer_branket("(abc)")
+    >>> literal_of(parse("abc"))
     'abc'
-    >>> remove_outer_branket("(a|b)(c|d)")
-    '(a|b)(c|d)'
+    >>> literal_of(parse("a(bc)")), literal_of(parse("")), literal_of(parse("ab*"))
+    ('abc', '', None)
     """
-    if not (string[0] == "(" and string[-1] == ")"):
-        return string
-
-    blanket_count = 0
-    for char in string[:-1]:
-        if char == "(":
-            blanket_count += 1
-        elif char == ")":
-            blanket_count -= 1
-        if blanket_count == 0:
-            return string
-        if blanket_count == 1 and char == "|":
-            return string
-    return remove_outer_branket(string[1:-1])
-
-
-def concat_split(string):
+    chars = []
+    for current in postorder(node):
+        if current.kind == CHAR:
+            chars.append(current.char)
+        elif current.kind not in (EPSILON, CONCAT):
+            return None
+    return "".join(chars)
+
+
+def exact_literals(string):
+    """ 決まった一つの文字列stringだけを表すLiterals """
+    return Literals(string, string, string, string, len(string), len(string))
+
+
+def common_prefix(strings):
+    """ stringsの共通の接頭辞を返す """
+    first, last = min(strings), max(strings)
+    length = 0
+    while length < len(first) and first[length] == last[length]:
+        length += 1
+    return first[:length]
+
+
+def common_factor(strings):
     """
-    正規表現の連結stringを正規表現一つづつに切って返す
-
-    >>> concat_split("ab")
-    ['a', 'b']
-    >>> concat_split("a*")
-    ['a*']
-    >>> concat_split("(abc)*(a|b|c)(cba)*abc")
-    ['(abc)*', '(a|b|c)', '(cba)*', 'a', 'b', 'c']
-    >>> concat_split("...")
-    ['.', '.', '.']
-    >>> concat_split("(((a|A)(b|B)(c|C)))")
-    ['(a|A)', '(b|B)', '(c|C)']
-    >>> concat_split("((a|A)(b|B)(c|C))*")
-    ['((a|A)(b|B)(c|C))*']
+    stringsの全部に含まれる最長の部分文字列を返す(長さはFACTOR_LENGTH_LIMITまで)
+    長さlengthのものがあればそれより短いものもあるので、長さを二分探索する
     """
-    ans = []
-    right = left = 0
-    string = remove_outer_branket(string)
-    while left < len(string):
-        if string[left] == "(":
-            blanket_count = 1
-            while blanket_count > 0:
-                left += 1
-                if string[left] == "(":
-                    blanket_count += 1
-                elif string[left] == ")":
-                    blanket_count -= 1
-        if left + 1 < len(string) and string[left + 1] == "*":
-            left += 1
-        ans.append(string[right:left + 1])
-        right, left = left + 1, left + 1
-    return ans
-
-
-def union_split(string):
+    low, high = 0, min(min(len(string) for string in strings), FACTOR_LENGTH_LIMIT)
+    found = ""
+    while low < high:
+        length = (low + high + 1) // 2
+        factor = common_factor_of_length(strings, length)
+        if factor is None:
+            high = length - 1
+        else:
+            low, found = length, factor
+    return found
+
+
+def common_factor_of_length(strings, length):
+    """ stringsの全部に含まれる長さlengthの部分文字列のうち、最初の文字列で最初に現れるものを返す(無ければNone) """
+    first = strings[0]
+    candidates = {first[start:start + length] for start in range(len(first) - length + 1)}
+    for string in strings[1:]:
+        factors = (string[start:start + length] for start in range(len(string) - length + 1))
+        candidates = {factor for factor in factors if factor in candidates}
+        if not candidates:
+            return None
+    return next(first[start:start + length] for start in range(len(first) - length + 1) if first[start:start + length] in candidates)
+
+
+def concat_literals(left, right):
+    """ leftの後にrightを連結したもののLiterals """
+    if left.exact is not None and right.exact is not None:
+        return exact_literals(left.exact + right.exact)
+    prefix = left.prefix if left.exact is None else left.exact + right.prefix
+    suffix = right.suffix if right.exact is None else left.suffix + right.exact
+    # 境目ではleftの末尾のすぐ後にrightの先頭が続く
+    factor = max([left.factor, right.factor, left.suffix + right.prefix, prefix, suffix], key=len)
+    max_length = None if left.max_length is None or right.max_length is None else left.max_length + right.max_length
+    return Literals(None, prefix, suffix, factor, left.min_length + right.min_length, max_length)
+
+
+def required_literals(node):
     """
-    和の正規表現stringを分割して返す
-    >>> union_split("(a|b|c)")
-    ['a', 'b', 'c']
-    >>> union_split("(a|ab|(b)*)")
-    ['a', 'ab', '(b)*']
+    構文木nodeが表す文字列が必ず持つリテラル(Literals)を返す
+
+    >>> required_literals(parse("ab(cd|ce)*xyz.*(bx|ax)"))
+    Literals(exact=None, prefix='ab', suffix='x', factor='xyz', min_length=7, max_length=None)
+    >>> required_literals(parse("(foobar|fooquux)"))
+    Literals(exact=None, prefix='foo', suffix='', factor='foo', min_length=6, max_length=7)
+    >>> required_literals(parse("a(bc)")).exact
+    'abc'
     """
-    return string[1:-1].split("|")
-
-
-def single_regex_to_eNFA(string, alphabet):
-    """ 一項からなる正規表現stringを認識するeNFAを返す """
-    if is_dot(string):
-        return eNFA.any_word(alphabet)
-    if is_atom(string):
-        return eNFA.one_word(string, alphabet)
-    elif is_repeat(string):
-        return eNFA.repeat(regex_to_eNFA(string[:-1], alphabet))
-    elif is_union(string):
-        return eNFA.parallel_connect([regex_to_eNFA(sub_regex, alphabet) for sub_regex in union_split(string)])
-    else:
-        assert False, "invalid regular expression: %s" % string
+    def function(node, children):
+        if node.kind == EPSILON:
+            return exact_literals("")
+        if node.kind == CHAR:
+            return exact_literals(node.char)
+        if node.kind == DOT:
+            return Literals(None, "", "", "", 1, 1)
+        if node.kind == STAR:
+            return Literals(None, "", "", "", 0, 0 if children[0].max_length == 0 else None)
+        if node.kind == CONCAT:
+            result = children[0]
+            for child in children[1:]:
+                result = concat_literals(result, child)
+            return result
+        # UNION
+        exacts = set(child.exact for child in children)
+        if len(exacts) == 1 and None not in exacts:
+            return children[0]
+        prefix = common_prefix([child.prefix for child in children])
+        suffix = common_prefix([child.suffix[::-1] for child in children])[::-1]
+        factor = max([common_factor([child.factor for child in children]), prefix, suffix], key=len)
+        lengths = [child.max_length for child in children]
+        max_length = None if None in lengths else max(lengths)
+        return Literals(None, prefix, suffix, factor, min(child.min_length for child in children), max_length)
+    return fold(node, function)
+
+
+def prefilter_of(node):
+    """ 構文木nodeの必ず持つリテラルを先に調べるPrefilterを返す """
+    literals = required_literals(node)
+    return Prefilter(literals.prefix, literals.suffix, literals.factor, literals.min_length, literals.max_length)
+
+
+def prefilter(string):
+    """ 正規表現stringの必ず持つリテラルを先に調べるPrefilterを返す """
+    return prefilter_of(parse(string))
 
 
 def regex_to_eNFA(string, alphabet):
     """ 正規表現stringを認識するeNFAを返す """
-    return eNFA.serial_connect([single_regex_to_eNFA(single_regex, alphabet) for single_regex in concat_split(string)])
+    return ast_to_eNFA(parse(string), alphabet)
+
+
+def regex_to_derivative_DFA(string, alphabet):
+    """ 正規表現stringを認識するDFAを導関数で作って返す(DerivativeDFA) """
+    return ast_to_derivative_DFA(parse(string), alphabet)
+
+
+# compileで選べるエンジン
+#     "dfa" : 最小化したDFA(整数の遷移表で実行する)
+#     "lazy": eNFA(必要な状態だけその場で作るLazyDFAで実行する)
+#     "derivative": 導関数で作るDFA(eNFAを作らず、必要な状態だけその場で作るDerivativeEngineで実行する)
+ENGINES = ("dfa", "lazy", "derivative")
+
+
+def build(string, alphabet, engine="dfa"):
+    """ 正規表現stringをengineで実行するオートマトンを作る(キャッシュは使わない、Prefilterも付ける) """
+    node = parse(string)
+    if engine == "dfa":
+        automata = ast_to_eNFA(node, alphabet).convert_to_DFA().minimized()
+    elif engine == "lazy":
+        automata = ast_to_eNFA(node, alphabet)
+    elif engine == "derivative":
+        automata = ast_to_derivative_DFA(node, alphabet)
+    else:
+        raise ValueError("unknown engine: %s" % engine)
+    automata.set_prefilter(prefilter_of(node))
+    return automata
+
+
+cache = PatternCache(build)
+
+
+def configure_cache(maxsize=256, directory=None, max_bytes=None):
+    """ compileが使うキャッシュを作り直す(directoryを指定するとコンパイル済みのDFAをディスクにも保存する) """
+    global cache
+    cache = PatternCache(build, maxsize, directory, max_bytes)
+    return cache
+
+
+def compile(string, alphabet, engine="dfa"):
+    """ 正規表現stringをengineで実行するオートマトンを返す(同じ引数ならキャッシュしたものを返す) """
+    automata = cache.get(string, alphabet, engine)
+    if automata.prefilter() is None:
+        # ディスクのキャッシュから読んだDFAにはPrefilterが付いていない
+        automata.set_prefilter(prefilter(string))
+    return automata
+
 
 if __name__ == "__main__":
     import doctest
@@ -1,5 +1,5 @@
 import unittest
-from Regex import regex_to_eNFA
+from Regex import CONCAT, STAR, UNION, parse, regex_to_eNFA
 
 
 class RegexTest(unittest.TestCase):
@@ -66,9 +66,74 @@ class RegexTest(unittest.TestCase):
                 self.assertEqual(enfa.run(test), expected)
 
 
+class ParseTest(unittest.TestCase):
+
+    def test_nested_union(self):
+        """ 入れ子になった和も正しく分割される """
+        alphabet = {"a", "b", "c"}
+        cases = [["(a|(b|c))",
+                  [["a", True],
+                   ["b", True],
+                   ["c", True],
+                   ["bc", False]]],
+                 ["(a|(b|ab)*)c",
+                  [["ac", True],
+                   ["c", True],
+                   ["babbc", True],
+                   ["aac", False]]],
+                 ["a|b*",
+                  [["a", True],
+                   ["bbb", True],
+                   ["", True],
+                   ["ab", False]]],
+                 ["(a|)b",
+                  [["ab", True],
+                   ["b", True],
+                   ["a", False]]],
+                 ["",
+                  [["", True],
+                   ["a", False]]]]
+        for regex, tests in cases:
+            enfa = regex_to_eNFA(regex, alphabet)
+            for test, expected in tests:
+                self.assertEqual(enfa.run(test), expected)
+
+    def test_tree(self):
+        tree = parse("(ab)*|c")
+        self.assertEqual(tree.kind, UNION)
+        self.assertEqual(tree.children[0].kind, STAR)
+        self.assertEqual(tree.children[0].children[0].kind, CONCAT)
+        self.assertEqual(parse("(((a)))"), parse("a"))
+
+    def test_long_pattern(self):
+        """ 長くて深い正規表現でも再帰の上限に引っかからない """
+        depth = 20000
+        tree = parse("(a|" * depth + "b" + ")" * depth)
+        for _ in range(depth - 1):
+            tree = tree.children[1]
+        self.assertEqual(tree.children[1].char, "b")
+
+    def test_flat_states(self):
+        """ eNFAの状態は整数で、数は正規表現の長さに比例する """
+        for depth in [10, 100, 1000]:
+            enfa = regex_to_eNFA("(a|" * depth + "b" + ")" * depth, {"a", "b"})
+            self.assertEqual(enfa.states, frozenset(range(len(enfa.states))))
+            self.assertLessEqual(len(enfa.states), 2 * (2 * depth + 1))
+        enfa = regex_to_eNFA("(a|" * 5000 + "b" + ")" * 5000, {"a", "b"})
+        self.assertTrue(enfa.run("a"))
+        self.assertTrue(enfa.run("b"))
+        self.assertFalse(enfa.run("ab"))
+
+    def test_invalid(self):
+        for regex in ["(a", "a)", "*a", "(|*)"]:
+            with self.assertRaises(ValueError):
+                parse(regex)
+
+
 def run():
     suite = unittest.TestSuite()
     suite.addTest(RegexTest())
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(ParseTest))
     unittest.TextTestRunner().run(suite)
 
 
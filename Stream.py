@@ -0,0 +1,110 @@
+import asyncio
+import codecs
+import mmap
+
+CHUNK_SIZE = 1 << 16
+
+
+def feed_file(matcher, file, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+    """
+    ファイルオブジェクトfileをchunk_sizeずつmatcherに読ませてmatcherを返す
+    バイナリモードで開いたファイルはencodingで少しずつ復号する
+    """
+    decoder = None
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        if not isinstance(chunk, str):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(encoding)()
+            chunk = decoder.decode(chunk)
+        matcher.feed(chunk)
+    if decoder is not None:
+        matcher.feed(decoder.decode(b"", final=True))
+    return matcher
+
+
+def feed_buffer(matcher, buffer, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+    """
+    bytes-likeなbuffer(memoryview, mmapなど)をコピーせずにchunk_sizeバイトずつmatcherに読ませてmatcherを返す
+    一つのstrになるのは各chunkを復号した分だけ
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    with memoryview(buffer) as base, base.cast("B") as view:
+        for start in range(0, len(view), chunk_size):
+            with view[start:start + chunk_size] as chunk:
+                matcher.feed(decoder.decode(chunk))
+    matcher.feed(decoder.decode(b"", final=True))
+    return matcher
+
+
+def match_file(automata, file, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+    """ ファイルオブジェクトfileの中身全体をautomataが受理するならTrue """
+    return feed_file(automata.matcher(), file, chunk_size, encoding).finish()
+
+
+def match_buffer(automata, buffer, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+    """ bytes-likeなbufferの中身全体をautomataが受理するならTrue """
+    return feed_buffer(automata.matcher(), buffer, chunk_size, encoding).finish()
+
+
+def match_mmap(automata, path, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+    """ pathのファイルをmmapで読み、中身全体をautomataが受理するならTrue """
+    with open(path, "rb") as file:
+        if file.seek(0, 2) == 0:
+            # 空のファイルはmmapできない
+            return automata.matcher().finish()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as region:
+            # 必ず持つリテラルが無ければ、復号も遷移もせずにbytesのまま探すだけで分かる
+            prefilter = automata.prefilter()
+            if prefilter and not prefilter.may_match(region, encoding):
+                return False
+            return match_buffer(automata, region, chunk_size, encoding)
+
+
+class AsyncMatcher(object):
+    """
+    asyncio.StreamReaderから少しずつ読んで認識するMatcher
+    行き止まりの状態に入ったら(この後何を読んでも受理しないので)残りを読まずにすぐ結果を返す
+    """
+
+    def __init__(self, automata, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+        self.matcher = automata.matcher()
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+
+    @property
+    def position(self):
+        """ 今までに読んだ文字数 """
+        return self.matcher.position
+
+    async def feed_from(self, reader):
+        """ readerを終わりまで(行き止まりの状態に入ったらそこまで)読み、読んだ文字列全体を受理するかを返す """
+        matcher = self.matcher
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        while not matcher.is_dead():
+            chunk = await reader.read(self.chunk_size)
+            if not chunk:
+                matcher.feed(decoder.decode(b"", final=True))
+                return matcher.finish()
+            matcher.feed(decoder.decode(chunk))
+        matcher.reset()
+        return False
+
+
+async def match_streams(automata, readers, chunk_size=CHUNK_SIZE, encoding="utf-8", limit=None):
+    """
+    複数のStreamReaderを同時に読み、それぞれの中身全体をautomataが受理するかを並べたリストを返す
+    実行器(コンパイルしたDFAなど)は一つだけ作って全部で共有し、各ストリームは今の状態だけを持つ
+    limitを指定すると同時に読むストリームをその数までにする
+    """
+    automata.engine()
+    semaphore = asyncio.Semaphore(limit) if limit is not None else None
+
+    async def match(reader):
+        if semaphore is None:
+            return await AsyncMatcher(automata, chunk_size, encoding).feed_from(reader)
+        async with semaphore:
+            return await AsyncMatcher(automata, chunk_size, encoding).feed_from(reader)
+    return await asyncio.gather(*(match(reader) for reader in readers))
@@ -0,0 +1,161 @@
+import asyncio
+import io
+import os
+import tempfile
+import unittest
+from Regex import regex_to_eNFA
+from Stream import AsyncMatcher, feed_file, match_buffer, match_file, match_mmap, match_streams
+from Examples import Has010, Has010_DFA, IsDivisibleBy3, IsIncreasingSequence
+
+
+class MatcherTest(unittest.TestCase):
+    """ 少しずつ読ませるMatcherの確認 """
+
+    def test_feed(self):
+        for automata in [IsDivisibleBy3, Has010_DFA, Has010, IsIncreasingSequence]:
+            instance = automata()
+            matcher = instance.matcher()
+            for string, expected in automata.tests:
+                for i in range(len(string) + 1):
+                    matcher.feed(string[:i]).feed(string[i:])
+                    self.assertEqual(expected, matcher.is_accepting())
+                    self.assertEqual(expected, matcher.finish())
+
+    def test_invalid_character(self):
+        matcher = IsDivisibleBy3().matcher()
+        matcher.feed("0x").feed("0")
+        self.assertFalse(matcher.finish())
+        self.assertTrue(matcher.feed("0").finish())
+
+
+class StreamTest(unittest.TestCase):
+    """ ファイル・mmap・memoryviewからの認識の確認 """
+
+    def setUp(self):
+        self.automata = regex_to_eNFA("(ab)*", {"a", "b"})
+        self.text = "ab" * 50000
+
+    def test_file(self):
+        self.assertTrue(match_file(self.automata, io.StringIO(self.text), chunk_size=999))
+        self.assertTrue(match_file(self.automata, io.BytesIO(self.text.encode()), chunk_size=999))
+        self.assertFalse(match_file(self.automata, io.StringIO(self.text + "a"), chunk_size=999))
+        matcher = feed_file(self.automata.matcher(), io.StringIO(self.text), chunk_size=999)
+        self.assertEqual(matcher.position, len(self.text))
+
+    def test_multibyte(self):
+        """ 複数バイトの文字がチャンクの境目で切れても正しく読める """
+        automata = regex_to_eNFA("(あい)*", {"あ", "い"})
+        data = ("あい" * 1000).encode()
+        self.assertTrue(match_file(automata, io.BytesIO(data), chunk_size=7))
+        self.assertTrue(match_buffer(automata, memoryview(data), chunk_size=7))
+
+    def test_buffer(self):
+        data = bytearray(self.text.encode())
+        self.assertTrue(match_buffer(self.automata, memoryview(data), chunk_size=1000))
+        self.assertFalse(match_buffer(self.automata, memoryview(data)[1:], chunk_size=1000))
+
+    def test_mmap(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "input.txt")
+            with open(path, "w") as file:
+                file.write(self.text)
+            self.assertTrue(match_mmap(self.automata, path))
+            self.assertTrue(match_mmap(self.automata.convert_to_DFA(), path, chunk_size=4096))
+            with open(path, "w") as file:
+                file.write("")
+            self.assertTrue(match_mmap(self.automata, path))
+
+
+class MatcherDeadTest(unittest.TestCase):
+    """ 行き止まりの状態の確認 """
+
+    def test_is_dead(self):
+        for automata in [regex_to_eNFA("(ab)*", {"a", "b"}), regex_to_eNFA("(ab)*", {"a", "b"}).convert_to_DFA()]:
+            matcher = automata.matcher()
+            self.assertFalse(matcher.feed("aba").is_dead())
+            self.assertTrue(matcher.feed("a").is_dead())
+            matcher.reset()
+            self.assertTrue(matcher.feed("abx").is_dead())
+
+
+class AsyncStreamTest(unittest.IsolatedAsyncioTestCase):
+    """ asyncioのStreamReaderからの認識の確認(同じプロセスの中でサーバーを立てる) """
+
+    async def asyncSetUp(self):
+        self.automata = regex_to_eNFA("(ab)*", {"a", "b"}).convert_to_DFA()
+
+        async def validate(reader, writer):
+            result = await AsyncMatcher(self.automata, chunk_size=7).feed_from(reader)
+            writer.write(b"1" if result else b"0")
+            await writer.drain()
+            writer.close()
+        self.server = await asyncio.start_server(validate, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def request(self, data, eof=True):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(data)
+        if eof:
+            writer.write_eof()
+        await writer.drain()
+        try:
+            return await asyncio.wait_for(reader.read(), 5)
+        finally:
+            writer.close()
+
+    async def test_verdict_at_eof(self):
+        self.assertEqual(b"1", await self.request(b"ab" * 1000))
+        self.assertEqual(b"1", await self.request(b""))
+        self.assertEqual(b"0", await self.request(b"ab" * 1000 + b"a"))
+
+    async def test_early_reject(self):
+        """ 行き止まりの状態に入ったら入力が終わる前に結果が返る """
+        self.assertEqual(b"0", await self.request(b"abb", eof=False))
+        self.assertEqual(b"0", await self.request(b"abx", eof=False))
+
+    async def test_match_streams(self):
+        expected = [i % 3 != 0 for i in range(2000)]
+        self.assertEqual(expected, await match_streams(self.automata, self.readers(2000), chunk_size=256))
+        self.assertEqual(expected[:50], await match_streams(regex_to_eNFA("(ab)*", {"a", "b"}), self.readers(50), limit=8))
+
+    async def test_match_streams_sockets(self):
+        """ サーバーから送られてくる複数のストリームを一つのDFAで同時に読む """
+        async def send(reader, writer):
+            count = int((await reader.readline()).decode())
+            for _ in range(count):
+                writer.write(b"ab")
+                await writer.drain()
+                await asyncio.sleep(0)
+            writer.close()
+        server = await asyncio.start_server(send, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        connections = []
+        try:
+            for i in range(100):
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(b"%d\n" % (i % 20))
+                connections.append((reader, writer))
+            self.assertEqual([True] * 100, await match_streams(self.automata, [reader for reader, _ in connections], chunk_size=3))
+        finally:
+            for _, writer in connections:
+                writer.close()
+            server.close()
+            await server.wait_closed()
+
+    @staticmethod
+    def readers(count):
+        """ i番目に"ab"をi % 50回(iが3の倍数なら最後に余計な"b"を付けて)読ませたStreamReaderをcount個作る """
+        readers = []
+        for i in range(count):
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"ab" * (i % 50) + b"b" * (i % 3 == 0))
+            reader.feed_eof()
+            readers.append(reader)
+        return readers
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,286 +1,14 @@
+import itertools
+import os
+import tempfile
 import unittest
+from unittest import mock
+import Automata
 from Automata import DeterministicFiniteAutomata as DFA
 from Automata import NondeterministicFiniteAutomata as NFA
 from Automata import NFAWithEpsilonTransition as eNFA
-
-
-class IsLengthEven(DFA):
-    """ 長さが偶数の文字列を認識 """
-    tests = (("0111", True),
-             ("1", False),
-             ("", True),
-             ("0011011", False))
-
-    def __init__(self):
-        a, b = range(2)
-        states = {a, b}
-        alphabet = {"0", "1"}
-        transitions = {
-            a: {"0": b, "1": b},
-            b: {"0": a, "1": a},
-        }
-        init_state = a
-        final_states = {a}
-        super().__init__(states, alphabet, transitions, init_state, final_states)
-
-
-class IsDivisibleBy3(DFA):
-    """ 二進表記で3の倍数の文字列を認識 """
-    tests = (("00000", True),       # 0
-             ("0011", True),        # 3
-             ("01110", False),      # 14
-             ("1001", True),        # 9
-             ("1110101110", True))  # 942
-
-    def __init__(self):
-        a, b, c = range(3)
-        states = {a, b, c}
-        alphabet = {"0", "1"}
-        transitions = {
-            a: {"0": a, "1": b},
-            b: {"0": c, "1": a},
-            c: {"0": b, "1": c},
-        }
-
-        init_state = a
-        final_states = {a}
-        super().__init__(states, alphabet, transitions, init_state, final_states)
-
-
-class IsEnd0XXX(NFA):
-    """ 最後から四文字目が0である文字列を認識 """
-    tests = (("00000000", True),
-             ("000110", True),
-             ("1110", False),
-             ("01", False),
-             ("1110100110", True))
-
-    def __init__(self):
-        a, b, c, d, e = range(5)
-        states = {a, b, c, d, e}
-        alphabet = {"0", "1"}
-        transitions = {
-            a: {"0": {a, b}, "1": {a}},
-            b: {"0": {c}, "1": {c}},
-            c: {"0": {d}, "1": {d}},
-            d: {"0": {e}, "1": {e}},
-            e: {},
-        }
-        init_state = a
-        final_states = {e}
-        super().__init__(states, alphabet, transitions, init_state, final_states)
-
-
-class Has010(NFA):
-    """ 010を部分列に持つ文字列を認識 """
-    tests = (("010", True),
-             ("000110", False),
-             ("111111001010", True),
-             ("111101", False),
-             ("1110100110", True))
-
-    def __init__(self):
-        a, b, c, d = range(4)
-        states = {a, b, c, d}
-        alphabet = {"0", "1"}
-        transitions = {
-            a: {"0": {a, b}, "1": {a}},
-            b: {"1": {c}},
-            c: {"0": {d}},
-            d: {"0": {d}, "1": {d}},
-        }
-        init_state = a
-        final_states = {d}
-        super().__init__(states, alphabet, transitions, init_state, final_states)
-
-
-class IsIncreasingSequence(eNFA):
-    """ 広義単調増加な文字列を認識 """
-    tests = (("01234", True),
-             ("01122334444", True),
-             ("01234231", False),
-             ("1111", True),
-             ("1133344", True))
-
-    def __init__(self):
-        a, b, c, d, e = range(5)
-        states = {a, b, c, d, e}
-        alphabet = {"0", "1", "2", "3", "4"}
-        transitions = {
-            a: {"0": {a}, -1: {b}},
-            b: {"1": {b}, -1: {c}},
-            c: {"2": {c}, -1: {d}},
-            d: {"3": {d}, -1: {e}},
-            e: {"4": {e}}
-        }
-        init_state = a
-        final_states = {e}
-        super().__init__(states, alphabet, transitions, init_state, final_states)
-
-
-class IsEnd0XXX_DFA(DFA):
-    """ 最後から四文字目が0である文字列を認識 """
-    tests = (("00000000", True),
-             ("000110", True),
-             ("1110", False),
-             ("01", False),
-             ("1110100110", True))
-
-    def __init__(self):
-        a, b, c, d, e = range(5)
-        states = {a, b, c, d, e}
-        alphabet = {"0", "1"}
-        transitions = {
-            a: {"0": {a, b}, "1": {a}},
-            b: {"0": {c}, "1": {c}},
-            c: {"0": {d}, "1": {d}},
-            d: {"0": {e}, "1": {e}},
-            e: {},
-        }
-        init_state = a
-        final_states = {e}
-        temp = NFA(states, alphabet, transitions, init_state, final_states).convert_to_DFA()
-        super().__init__(temp.states, temp.alphabet, temp.transitions, temp.init_state, temp.final_states)
-
-
-class Has010_DFA(DFA):
-    """ 010を部分列に持つ文字列を認識 """
-    tests = (("010", True),
-             ("000110", False),
-             ("111111001010", True),
-             ("111101", False),
-             ("1110100110", True))
-
-    def __init__(self):
-        a, b, c, d = range(4)
-        states = {a, b, c, d}
-        alphabet = {"0", "1"}
-        transitions = {
-            a: {"0": {a, b}, "1": {a}},
-            b: {"1": {c}},
-            c: {"0": {d}},
-            d: {"0": {d}, "1": {d}},
-        }
-        init_state = a
-        final_states = {d}
-        temp = NFA(states, alphabet, transitions, init_state, final_states).convert_to_DFA()
-        super().__init__(temp.states, temp.alphabet, temp.transitions, temp.init_state, temp.final_states)
-
-
-class IsIncreasingSequence_DFA(DFA):
-    """ 広義単調増加な文字列を認識 """
-    tests = (("01234", True),
-             ("01122334444", True),
-             ("01234231", False),
-             ("1111", True),
-             ("1133344", True))
-
-    def __init__(self):
-        a, b, c, d, e = range(5)
-        states = {a, b, c, d, e}
-        alphabet = {"0", "1", "2", "3", "4"}
-        transitions = {
-            a: {"0": {a}, -1: {b}},
-            b: {"1": {b}, -1: {c}},
-            c: {"2": {c}, -1: {d}},
-            d: {"3": {d}, -1: {e}},
-            e: {"4": {e}}
-        }
-        init_state = a
-        final_states = {e}
-        temp = eNFA(states, alphabet, transitions, init_state, final_states).convert_to_DFA()
-        super().__init__(temp.states, temp.alphabet, temp.transitions, temp.init_state, temp.final_states)
-
-
-class MinimizeTest(DFA):
-    """ DFAの最小化のテスト """
-    tests = {}
-
-    def __init__(self):
-        a, b, c, d, e, f, g, h, = range(8)
-        states = {a, b, c, d, e, f, g, h}
-        alphabet = {"0", "1"}
-        transitions = {
-            a: {"0": b, "1": f},
-            b: {"0": g, "1": c},
-            c: {"0": a, "1": c},
-            d: {"0": c, "1": g},
-            e: {"0": h, "1": f},
-            f: {"0": c, "1": g},
-            g: {"0": g, "1": e},
-            h: {"0": g, "1": c}
-        }
-        init_state = a
-        final_states = {c}
-        temp = DFA(states, alphabet, transitions, init_state, final_states)
-        print(temp)
-        temp = temp.minimized()
-        super().__init__(temp.states, temp.alphabet, temp.transitions, temp.init_state, temp.final_states)
-
-
-class IsNotDivisibleBy3(DFA):
-    """ 二進表記で3の倍数でない文字列を認識 """
-    tests = (("00000", not True),       # 0
-             ("0011", not True),        # 3
-             ("01110", not False),      # 14
-             ("1001", not True),        # 9
-             ("1110101110", not True))  # 942
-
-    def __init__(self):
-        a, b, c = range(3)
-        states = {a, b, c}
-        alphabet = {"0", "1"}
-        transitions = {
-            a: {"0": a, "1": b},
-            b: {"0": c, "1": a},
-            c: {"0": b, "1": c},
-        }
-
-        init_state = a
-        final_states = {a}
-        temp = DFA(states, alphabet, transitions, init_state, final_states).flliped()
-        super().__init__(temp.states, temp.alphabet, temp.transitions, temp.init_state, temp.final_states)
-
-
-class IsDoubleIncreasingSequence(eNFA):
-
-    tests = (("0013", True),
-             ("10311", False),
-             ("0130112", True),
-             ("13230001", False),
-             ("22223344012344", True))
-
-    def __init__(self):
-        inc = IsIncreasingSequence()
-        temp = eNFA.serial_connect([inc, inc])
-        super().__init__(temp.states, temp.alphabet, temp.transitions, temp.init_state, temp.final_states)
-
-
-class Has010OrEnd0XXX(eNFA):
-
-    tests = (("0010", True),
-             ("00111", True),
-             ("011111", False),
-             ("00010001111", True),
-             ("0001111001111", False))
-
-    def __init__(self):
-        zero10 = Has010()
-        zeroxxx = IsEnd0XXX()
-        temp = eNFA.parallel_connect([zero10, zeroxxx])
-        super().__init__(temp.states, temp.alphabet, temp.transitions, temp.init_state, temp.final_states)
-
-
-class TrivialTest(eNFA):
-
-    tests = (("", False),
-             ("0", True),
-             ("100", False),
-             ("1", True))
-
-    def __init__(self):
-        temp = eNFA.any_word("01")
-        super().__init__(temp.states, temp.alphabet, temp.transitions, temp.init_state, temp.final_states)
+from Examples import Has010, Has010OrEnd0XXX, Has010_DFA, IsDivisibleBy3, IsDoubleIncreasingSequence, IsEnd0XXX, IsEnd0XXX_DFA, IsIncreasingSequence
+from Examples import IsIncreasingSequence_DFA, IsLengthEven, IsNotDivisibleBy3, MinimizeTest, TrivialTest
 
 
 class AutomatonTest(unittest.TestCase):
@@ -312,5 +40,707 @@ class AutomatonTest(unittest.TestCase):
                 print("%s: \"%s\"" % (str(result).ljust(5), string))
                 self.assertEqual(expected, result)
 
+
+class MinimizeMethodTest(unittest.TestCase):
+    """ 最小化アルゴリズムの比較 """
+
+    def test_same_result(self):
+        """ Hopcroftと表を埋めるアルゴリズムで同じ最小DFAになるか """
+        for automata in [IsLengthEven, IsDivisibleBy3, IsEnd0XXX_DFA, Has010_DFA, IsIncreasingSequence_DFA, IsNotDivisibleBy3]:
+            instance = automata()
+            self.assertEqual(instance.minimized("hopcroft"), instance.minimized("table"))
+            minimized = instance.minimized()
+            for string, expected in instance.tests:
+                self.assertEqual(expected, minimized.run(string))
+
+    def test_state_count(self):
+        """ 最小DFAの状態数 """
+        # MinimizeTestの最小化する前のDFA(dには行けず、aとe、bとhが同じ状態になる)
+        transitions = {0: {"0": 1, "1": 5}, 1: {"0": 6, "1": 2}, 2: {"0": 0, "1": 2}, 3: {"0": 2, "1": 6},
+                       4: {"0": 7, "1": 5}, 5: {"0": 2, "1": 6}, 6: {"0": 6, "1": 4}, 7: {"0": 6, "1": 2}}
+        dfa = DFA(range(8), {"0", "1"}, transitions, 0, {2})
+        for method in ["hopcroft", "table"]:
+            self.assertEqual(len(dfa.minimized(method).states), 5)
+        self.assertEqual(len(IsEnd0XXX_DFA().minimized().states), 16)
+        self.assertEqual(len(Has010_DFA().minimized().states), 4)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            IsLengthEven().minimized("brzozowski")
+
+
+class CompiledDFATest(unittest.TestCase):
+    """ 整数の遷移表にまとめたDFAの確認 """
+
+    def test_run(self):
+        for automata in [IsLengthEven, IsDivisibleBy3, IsEnd0XXX_DFA, Has010_DFA, IsIncreasingSequence_DFA, IsNotDivisibleBy3]:
+            compiled = automata().compile()
+            for string, expected in automata.tests:
+                self.assertEqual(expected, compiled.run(string))
+
+    def test_table(self):
+        dfa = IsDivisibleBy3()
+        compiled = dfa.compile()
+        self.assertIs(compiled, dfa.compile())
+        self.assertEqual(compiled.init_state, 0)
+        self.assertEqual(compiled.states[0], dfa.init_state)
+        self.assertEqual(len(compiled.table), 3 * 2)
+        self.assertEqual(compiled.table.typecode, "i")
+
+    def test_partial_transitions(self):
+        """ 遷移が定義されていない所は行き止まりになる """
+        dfa = DFA({0, 1}, {"a", "b"}, {0: {"a": 1}, 1: {}}, 0, {1})
+        self.assertTrue(dfa.run("a"))
+        self.assertFalse(dfa.run("ab"))
+        self.assertFalse(dfa.run("b"))
+
+    def test_invalidate(self):
+        """ 遷移を書き換えたら表も作り直される """
+        dfa = IsLengthEven()
+        self.assertTrue(dfa.run("00"))
+        dfa.transitions = {0: {"0": 0, "1": 0}, 1: {"0": 1, "1": 1}}
+        self.assertTrue(dfa.run("0"))
+
+    def test_invalidate_states(self):
+        """ 始状態や受理状態を代入しても表は作り直される """
+        dfa = IsLengthEven()
+        self.assertTrue(dfa.run("00"))
+        dfa.final_states = {1}
+        self.assertFalse(dfa.run("00"))
+        self.assertTrue(dfa.run("0"))
+        dfa.init_state = 1
+        self.assertTrue(dfa.run("00"))
+        self.assertEqual(frozenset({1}), dfa.final_states)
+
+
+class RunManyTest(unittest.TestCase):
+    """ 複数の文字列をまとめて認識するrun_manyの確認 """
+    automaton = [IsLengthEven, IsDivisibleBy3, IsEnd0XXX_DFA, Has010_DFA, IsIncreasingSequence_DFA, IsNotDivisibleBy3]
+
+    def check(self):
+        for automata in self.automaton:
+            instance = automata()
+            strings = [string for string, _ in automata.tests] + ["", "x", "0x"]
+            expected = [instance.run(string) for string in strings[:-2]] + [False, False]
+            self.assertEqual(expected, instance.run_many(strings))
+        self.assertEqual([], IsLengthEven().run_many([]))
+
+    def test_run_many(self):
+        self.check()
+
+    def test_without_numpy(self):
+        with mock.patch.object(Automata, "numpy", None):
+            self.check()
+
+
+class LazyDFATest(unittest.TestCase):
+    """ 状態をその場で作るLazyDFAの確認 """
+    automaton = [IsEnd0XXX, Has010, IsIncreasingSequence, IsDoubleIncreasingSequence, Has010OrEnd0XXX, TrivialTest]
+
+    def test_run(self):
+        for automata in self.automaton:
+            for cache_size, policy in [(1024, "lru"), (1, "lru"), (2, "clear")]:
+                lazy = automata().lazy_DFA(cache_size, policy)
+                for string, expected in automata.tests:
+                    self.assertEqual(expected, lazy.run(string))
+
+    def test_stats(self):
+        lazy = IsEnd0XXX().lazy_DFA()
+        lazy.run("0000")
+        self.assertEqual(lazy.stats(), {"hits": 0, "misses": 4, "evictions": 0, "states": 4})
+        lazy.run("0000")
+        self.assertEqual(lazy.stats(), {"hits": 4, "misses": 4, "evictions": 0, "states": 4})
+
+    def test_eviction(self):
+        lru = IsEnd0XXX().lazy_DFA(2, "lru")
+        lru.run("0000")
+        self.assertEqual(lru.stats()["evictions"], 2)
+        self.assertEqual(lru.stats()["states"], 2)
+        clear = IsEnd0XXX().lazy_DFA(2, "clear")
+        clear.run("0000")
+        self.assertEqual(clear.stats()["evictions"], 2)
+        self.assertEqual(clear.stats()["states"], 2)
+        with self.assertRaises(ValueError):
+            IsEnd0XXX().lazy_DFA(2, "fifo")
+
+    def test_default_engine(self):
+        """ 基底クラスのままでもLazyDFAで実行できる """
+        nfa = IsEnd0XXX()
+        automata = Automata.Automata(nfa.states, nfa.alphabet, nfa.transitions, nfa.init_state, nfa.final_states)
+        self.assertIsInstance(automata.engine(), Automata.LazyDFA)
+        for string, expected in IsEnd0XXX.tests:
+            self.assertEqual(expected, automata.run(string))
+
+
+class EpsilonClosureTest(unittest.TestCase):
+    """ ε閉包の表とε遷移の除去の確認 """
+    automaton = [IsIncreasingSequence, IsDoubleIncreasingSequence, Has010OrEnd0XXX, TrivialTest]
+
+    def test_closures(self):
+        closures = IsIncreasingSequence().epsilon_closures()
+        self.assertEqual(closures[0], frozenset(range(5)))
+        self.assertEqual(closures[3], frozenset({3, 4}))
+        self.assertEqual(closures[4], frozenset({4}))
+
+    def test_cycle(self):
+        """ ε遷移の閉路の中の状態は同じ閉包を共有する """
+        transitions = {
+            0: {-1: {1}},
+            1: {-1: {2}, "a": {0}},
+            2: {-1: {0, 3}},
+            3: {},
+        }
+        enfa = eNFA({0, 1, 2, 3}, {"a"}, transitions, 0, {3})
+        closures = enfa.epsilon_closures()
+        self.assertEqual(closures[0], frozenset({0, 1, 2, 3}))
+        self.assertIs(closures[0], closures[2])
+        self.assertEqual(closures[3], frozenset({3}))
+
+    def test_invalidate(self):
+        enfa = IsIncreasingSequence()
+        self.assertTrue(enfa.run("04"))
+        enfa.transitions = {0: {"0": {0}}, 1: {}, 2: {}, 3: {}, 4: {}}
+        self.assertEqual(enfa.epsilon_closures()[0], frozenset({0}))
+        self.assertFalse(enfa.run("04"))
+
+    def test_epsilon_free(self):
+        for automata in self.automaton:
+            nfa = automata().epsilon_free()
+            self.assertIsInstance(nfa, NFA)
+            for transitions in nfa.transitions.values():
+                self.assertNotIn(-1, transitions)
+            for string, expected in automata.tests:
+                self.assertEqual(expected, nfa.run(string))
+
+
+class BitsetNFATest(unittest.TestCase):
+    """ 状態集合をビット列で表すNFAの実行器の確認 """
+    automaton = [IsEnd0XXX, Has010, IsIncreasingSequence, IsDoubleIncreasingSequence, Has010OrEnd0XXX, TrivialTest]
+
+    def test_run(self):
+        for automata in self.automaton:
+            bitset = automata().bitset()
+            for string, expected in automata.tests:
+                self.assertEqual(expected, bitset.run(string))
+
+    def test_masks(self):
+        nfa = IsEnd0XXX()
+        bitset = nfa.bitset()
+        self.assertEqual(bitset.to_states(bitset.init_state), frozenset({0}))
+        mask = bitset.next_states(bitset.init_state, "0")
+        self.assertEqual(bitset.to_states(mask), nfa.next_states({0}, "0"))
+
+    def test_epsilon_folded(self):
+        """ ε閉包は始状態と遷移のビット列に畳み込まれている """
+        enfa = IsIncreasingSequence()
+        bitset = enfa.bitset()
+        self.assertEqual(bitset.to_states(bitset.init_state), frozenset(range(5)))
+        mask = bitset.next_states(bitset.init_state, "2")
+        self.assertEqual(bitset.to_states(mask), enfa.next_states(frozenset(range(5)), "2"))
+
+
+class SearchTest(unittest.TestCase):
+    """ 文字列の中から受理される部分を探すsearch, match, finditerの確認 """
+
+    @staticmethod
+    def brute_force_search(automata, text, pos):
+        """ 全部の部分文字列を試して最も左から始まる最長の受理される部分を探す """
+        for start in range(pos, len(text) + 1):
+            ends = [end for end in range(start, len(text) + 1) if automata.matcher().feed(text[start:end]).finish()]
+            if ends:
+                return (start, max(ends))
+        return None
+
+    def test_search(self):
+        texts = ["", "0", "1101", "0101100", "111", "1x01", "01x0110", "0000111100"]
+        for automata in [IsLengthEven, IsDivisibleBy3, Has010, Has010_DFA, IsEnd0XXX, TrivialTest]:
+            instance = automata()
+            for text in texts:
+                for pos in range(len(text) + 1):
+                    self.assertEqual(self.brute_force_search(instance, text, pos), instance.search(text, pos))
+
+    def test_leftmost(self):
+        """ 一番早く終わる部分より左から始まって後ろまで続く部分を選び、候補を一つずつ試すことはしない """
+        # abcd|c
+        nfa = NFA(range(6), "abcd", {0: {"a": {1}, "c": {5}}, 1: {"b": {2}}, 2: {"c": {3}}, 3: {"d": {4}}}, 0, {4, 5})
+        for text in ["abcd", "xabcd", "abcx", "abcabcd", "ab", "cabcd"]:
+            for pos in range(len(text) + 1):
+                self.assertEqual(self.brute_force_search(nfa, text, pos), nfa.search(text, pos), (text, pos))
+        self.assertEqual([(0, 1), (2, 6), (7, 8)], list(nfa.finditer("cxabcdxc")))
+        # a*b|c
+        nfa = NFA(range(3), "abc", {0: {"a": {1}, "b": {2}, "c": {2}}, 1: {"a": {1}, "b": {2}}}, 0, {2})
+        text = "a" * 100000 + "c"
+        self.assertEqual((100000, 100001), nfa.search(text))
+        self.assertEqual([(100000, 100001)], list(nfa.finditer(text)))
+
+    def test_match(self):
+        dfa = IsDivisibleBy3()
+        self.assertEqual(dfa.match("11011"), (0, 5))
+        self.assertEqual(dfa.match("11011", 1), (1, 1))
+        self.assertIsNone(Has010().match("1100"))
+
+    def test_finditer(self):
+        trivial = TrivialTest()
+        self.assertEqual(list(trivial.finditer("01x1")), [(0, 1), (1, 2), (3, 4)])
+        self.assertEqual(list(Has010_DFA().finditer("11010x010")), [(0, 5), (6, 9)])
+        self.assertEqual(list(IsLengthEven().finditer("0x00")), [(0, 0), (1, 1), (2, 4), (4, 4)])
+
+
+class SerializeTest(unittest.TestCase):
+    """ コンパイルしたDFAのバイナリ形式での保存と読み込みの確認 """
+    automaton = [IsLengthEven, IsDivisibleBy3, IsEnd0XXX_DFA, Has010_DFA, IsIncreasingSequence_DFA, IsNotDivisibleBy3]
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "automata.dfa")
+            for automata in self.automaton:
+                automata().save(path)
+                for use_mmap in [True, False]:
+                    loaded = Automata.CompiledDFA.load(path, mmap=use_mmap)
+                    self.assertEqual(loaded.size, automata().compile().size)
+                    for string, expected in automata.tests:
+                        self.assertEqual(expected, loaded.run(string))
+                        self.assertEqual(expected, loaded.to_DFA().run(string))
+                del loaded
+
+    def test_mmap_view(self):
+        """ mmapで読み込んだ遷移表はファイルを写像したmemoryviewそのもの """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "automata.dfa")
+            dfa = DFA({0, 1}, {"あ", "a"}, {0: {"あ": 1, "a": 0}, 1: {"あ": 0, "a": 1}}, 0, {1})
+            dfa.save(path)
+            loaded = Automata.CompiledDFA.load(path)
+            self.assertIsInstance(loaded.table, memoryview)
+            self.assertTrue(loaded.run("aあaa"))
+            self.assertFalse(loaded.run("あaあ"))
+            del loaded
+
+    def test_sink_states(self):
+        """ 書き出したsink_statesは読み込んだ時にそのまま使い、無いファイルでは調べずに最後まで遷移させる """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "automata.dfa")
+            dfa = DFA({0, 1, 2}, {"0", "1"}, {0: {"0": 1, "1": 2}, 1: {"0": 1, "1": 1}, 2: {"0": 2, "1": 2}}, 0, {1})
+            dfa.save(path)
+            loaded = Automata.CompiledDFA.load(path)
+            self.assertIsInstance(loaded.sink_states(), memoryview)
+            self.assertEqual(list(dfa.compile().sink_states()), list(loaded.sink_states()))
+            self.assertEqual(dfa.compile().dead_state(), loaded.dead_state())
+            self.assertEqual(loaded.advance(0, "0"), loaded.advance(0, "0" + "1" * 1000))
+            del loaded
+            # フラグを消してsink_statesを落とした(前の形式の)ファイル
+            with open(path, "rb") as file:
+                data = bytearray(file.read())
+            data[6:8] = (0).to_bytes(2, "little")
+            with open(path, "wb") as file:
+                file.write(data[:-dfa.compile().size])
+            loaded = Automata.CompiledDFA.load(path)
+            self.assertTrue(loaded.run("0" + "1" * 1000))
+            self.assertFalse(loaded.run("1" + "0" * 1000))
+            self.assertIsNone(loaded.advance(0, "0x"))
+            self.assertIsNone(loaded._sinks)
+            self.assertEqual(dfa.compile().dead_state(), loaded.dead_state())
+            del loaded
+
+    def test_invalid_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "automata.dfa")
+            with open(path, "wb") as file:
+                file.write(b"NOTADFA" * 10)
+            with self.assertRaises(ValueError):
+                Automata.CompiledDFA.load(path)
+
+    def test_out_of_range(self):
+        """ 始状態(validate=Trueなら遷移先とsink_statesも)が範囲を超えていればValueErrorにし、写像したメモリは閉じる """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "automata.dfa")
+            IsDivisibleBy3().save(path)
+            with open(path, "rb") as file:
+                data = bytearray(file.read())
+            header = Automata.CompiledDFA.HEADER
+            symbols_length = header.unpack_from(data)[-1]
+            table_start = header.size + symbols_length + (-symbols_length % 4)
+            broken = [bytearray(data), bytearray(data), data[:header.size + 2], bytearray(data)]
+            broken[0][16:20] = (3).to_bytes(4, "little")
+            broken[1][table_start:table_start + 4] = (100).to_bytes(4, "little")
+            broken[2][20:24] = (100).to_bytes(4, "little")
+            broken[3][-1] = 9
+            for contents in broken:
+                with open(path, "wb") as file:
+                    file.write(contents)
+                regions = []
+                memory_map = Automata.memory_map
+
+                def tracked(*args, **kwargs):
+                    regions.append(memory_map(*args, **kwargs))
+                    return regions[-1]
+                for use_mmap in [True, False]:
+                    with mock.patch.object(Automata, "memory_map", tracked):
+                        with self.assertRaises(ValueError):
+                            Automata.CompiledDFA.load(path, mmap=use_mmap, validate=True)
+                self.assertTrue(all(region.closed for region in regions))
+                self.assertEqual(1, len(regions))
+            # validateしなければ遷移先は全部は調べない
+            with open(path, "wb") as file:
+                file.write(broken[1])
+            loaded = Automata.CompiledDFA.load(path)
+            self.assertEqual(100, loaded.table[0])
+            del loaded
+
+
+class ParallelTest(unittest.TestCase):
+    """ 共有メモリの遷移表を使って複数のプロセスで認識するmatch_parallelの確認 """
+
+    def test_match_parallel(self):
+        for automata in [IsDivisibleBy3, Has010_DFA, IsIncreasingSequence]:
+            instance = automata()
+            strings = [string for string, _ in automata.tests] * 5
+            expected = [instance.run(string) for string in strings]
+            self.assertEqual(expected, list(instance.match_parallel(strings, workers=2, chunksize=3)))
+            self.assertEqual(expected, list(instance.match_parallel(iter(strings), workers=1)))
+
+    def test_converted(self):
+        automata = Has010OrEnd0XXX()
+        dfa = automata.convert_to_DFA()
+        strings = ["".join(chars) for length in range(7) for chars in itertools.product("01", repeat=length)]
+        self.assertEqual([automata.run(string) for string in strings], list(dfa.match_parallel(strings, workers=2, chunksize=16)))
+
+    def test_invalid_character(self):
+        self.assertEqual([True, False, False], list(IsDivisibleBy3().match_parallel(["11", "1x", "1"], workers=2)))
+
+    def test_chunk_mapping(self):
+        for automata in [IsDivisibleBy3, IsEnd0XXX_DFA, Has010_DFA]:
+            compiled = automata().compile()
+            sinks = compiled.sink_states()
+            for string, _ in automata.tests:
+                for state, target in enumerate(compiled.chunk_mapping(string)):
+                    # 行き止まりの状態などに入ったら読むのをやめるので、同じ種類の状態なら本当の最後の状態でなくてよい
+                    expected = state
+                    for char in string:
+                        expected = compiled.table[expected * compiled.width + compiled.symbols[char]]
+                    self.assertTrue(target == expected or sinks[target] and sinks[target] == sinks[expected])
+        self.assertIsNone(IsDivisibleBy3().compile().chunk_mapping("01x1"))
+
+    def test_shared_sinks(self):
+        """ 共有メモリにつないだCompiledDFAはsink_statesも調べ直さずに共有メモリのものを使う """
+        compiled = Has010_DFA().compile()
+        memory, arguments = compiled.share()
+        try:
+            attached = Automata.CompiledDFA.attach(*arguments)
+            self.assertIsInstance(attached.sink_states(), memoryview)
+            self.assertEqual(list(compiled.sink_states()), list(attached.sink_states()))
+            del attached
+        finally:
+            memory.close()
+            memory.unlink()
+
+    def test_unmerged(self):
+        """ 読み始めの状態がまとまらないDFAでは表を作るのをあきらめ、run_parallelはその部分を普通に読む """
+        dfa = Automata.DeterministicFiniteAutomata(range(7), {"0", "1"}, {i: {"0": i * 2 % 7, "1": (i * 2 + 1) % 7} for i in range(7)}, 0, {0})
+        compiled = dfa.compile()
+        self.assertEqual([], compiled.chunk_mapping("01" * 100))
+        self.assertEqual(7, len(set(compiled.chunk_mapping("01" * 10))))
+        # 一文字ごとにまとまっていくならあきらめない
+        compiled = IsEnd0XXX_DFA().compile()
+        self.assertEqual(compiled.size, len(compiled.chunk_mapping("0110" * 50, window=1)))
+        for string in ["0110" * 200, "0111" * 200 + "1"]:
+            self.assertEqual(dfa.run(string), dfa.run_parallel(string, workers=2, chunk_size=100))
+        self.assertFalse(dfa.run_parallel("0" * 300 + "x", workers=2, chunk_size=100))
+
+    def test_run_parallel(self):
+        for automata in [IsDivisibleBy3, IsEnd0XXX_DFA, Has010_DFA, IsIncreasingSequence]:
+            instance = automata()
+            for string, expected in automata.tests:
+                for chunk_size in [1, 2, 5]:
+                    self.assertEqual(expected, instance.run_parallel(string, workers=2, chunk_size=chunk_size))
+        self.assertFalse(IsDivisibleBy3().run_parallel("0110x0", workers=2, chunk_size=2))
+        long_string = "0110" * 1000
+        self.assertEqual(Has010OrEnd0XXX().run(long_string), Has010OrEnd0XXX().run_parallel(long_string, workers=3))
+
+    def test_attach(self):
+        compiled = IsDivisibleBy3().compile()
+        memory, arguments = compiled.share()
+        try:
+            attached = Automata.CompiledDFA.attach(*arguments)
+            for string, expected in IsDivisibleBy3.tests:
+                self.assertEqual(expected, attached.run(string))
+            del attached
+        finally:
+            memory.close()
+            memory.unlink()
+
+
+class ProductTest(unittest.TestCase):
+    """ 直積で作る共通部分・和・差・対称差と空かどうかの判定の確認 """
+
+    automaton = [IsLengthEven, IsDivisibleBy3, Has010, IsEnd0XXX, TrivialTest]
+    operations = {
+        "intersect": lambda left, right: left and right,
+        "union": lambda left, right: left or right,
+        "difference": lambda left, right: left and not right,
+        "symmetric_difference": lambda left, right: left != right,
+    }
+
+    @staticmethod
+    def strings(alphabet, length):
+        """ alphabetの文字でできた長さlength以下の文字列を全部返す """
+        for n in range(length + 1):
+            for chars in itertools.product(sorted(alphabet), repeat=n):
+                yield "".join(chars)
+
+    def test_operations(self):
+        for left, right in itertools.product(self.automaton, repeat=2):
+            left, right = left(), right()
+            for name, expected in self.operations.items():
+                product = getattr(left, name)(right)
+                for string in self.strings({"0", "1"}, 6):
+                    self.assertEqual(expected(left.run(string), right.run(string)), product.run(string), (name, string))
+
+    def test_witness(self):
+        self.assertEqual(IsLengthEven().find_witness(), "")
+        self.assertEqual(Has010().find_witness(), "010")
+        # 長さが偶数で3の倍数でない最も短い文字列
+        witness = IsLengthEven().difference(IsDivisibleBy3()).find_witness()
+        self.assertEqual(witness, "01")
+        self.assertIsNone(Has010().difference(Has010_DFA()).find_witness())
+
+    def test_is_empty(self):
+        even, odd = IsLengthEven(), IsLengthEven().flliped()
+        self.assertTrue(even.intersect(odd).is_empty())
+        self.assertFalse(even.union(odd).is_empty())
+        self.assertTrue(Has010_DFA().symmetric_difference(Has010()).is_empty())
+
+    def test_is_subset_of(self):
+        self.assertTrue(Has010().is_subset_of(Has010().union(IsEnd0XXX())))
+        self.assertFalse(Has010().union(IsEnd0XXX()).is_subset_of(Has010()))
+        self.assertTrue(TrivialTest().is_subset_of(IsLengthEven().flliped()))
+
+    def test_lazy(self):
+        """ 受理状態の組が見つかった所でやめるので、行ける組を全部は作らない """
+        product = Has010_DFA().intersect(IsDivisibleBy3())
+        self.assertEqual(product.find_witness(), "01001")
+        self.assertIsNone(product._transitions)
+        self.assertEqual(len(product.states), len(product.transitions))
+        self.assertIsNotNone(product._transitions)
+
+    def test_partial_transitions(self):
+        """ 遷移が足りないDFAや、アルファベットが違うDFAとの組み合わせ """
+        ab = DFA({0, 1, 2}, {"a", "b"}, {0: {"a": 1}, 1: {"b": 2}}, 0, {2})
+        a_star = DFA({0}, {"a"}, {0: {"a": 0}}, 0, {0})
+        self.assertEqual(ab.union(a_star).find_witness(), "")
+        self.assertTrue(ab.intersect(a_star).is_empty())
+        self.assertEqual(ab.difference(a_star).find_witness(), "ab")
+        self.assertEqual(a_star.difference(ab).find_witness(), "")
+        self.assertFalse(a_star.difference(ab).run("ab"))
+        self.assertTrue(a_star.symmetric_difference(ab).run("ab"))
+        self.assertTrue(ab.is_subset_of(ab.union(a_star)))
+
+
+class EquivalenceTest(unittest.TestCase):
+    """ Hopcroft-Karpとantichainによる言語の比較の確認 """
+
+    automaton = [IsLengthEven, IsDivisibleBy3, Has010, Has010_DFA, IsEnd0XXX, IsEnd0XXX_DFA, TrivialTest, Has010OrEnd0XXX]
+
+    @staticmethod
+    def brute_force(left, right, length=7):
+        """ 長さlength以下の文字列を短い順に全部試して、片方だけが受理する最初の文字列を返す """
+        for string in ProductTest.strings({"0", "1"}, length):
+            if left.run(string) != right.run(string):
+                return string
+        return None
+
+    def test_distinguishing_string(self):
+        for left, right in itertools.product(self.automaton, repeat=2):
+            left, right = left(), right()
+            expected = self.brute_force(left, right)
+            witness = left.distinguishing_string(right)
+            if expected is None:
+                self.assertIsNone(witness)
+            else:
+                self.assertEqual(len(expected), len(witness))
+                self.assertNotEqual(left.run(witness), right.run(witness))
+
+    def test_equivalent(self):
+        self.assertTrue(Automata.equivalent(Has010(), Has010_DFA()))
+        self.assertTrue(Automata.equivalent(IsEnd0XXX_DFA(), IsEnd0XXX()))
+        self.assertTrue(Automata.equivalent(IsDivisibleBy3(), IsDivisibleBy3().minimized()))
+        self.assertFalse(Automata.equivalent(IsLengthEven(), IsDivisibleBy3()))
+        # 状態の名前が違っても同じ言語なら等しい
+        renamed = DFA({"x", "y"}, {"0", "1"}, {"x": {"0": "y", "1": "y"}, "y": {"0": "x", "1": "x"}}, "x", {"x"})
+        self.assertTrue(Automata.equivalent(IsLengthEven(), renamed))
+        self.assertNotEqual(IsLengthEven(), renamed)
+
+    def test_hopcroft_karp(self):
+        self.assertTrue(Automata.hopcroft_karp(Has010_DFA(), Has010_DFA().minimized()))
+        self.assertFalse(Automata.hopcroft_karp(IsLengthEven(), IsLengthEven().flliped()))
+        self.assertEqual(IsLengthEven().distinguishing_string(IsLengthEven().flliped()), "")
+
+    def test_inclusion(self):
+        self.assertEqual(Has010().inclusion_witness(IsEnd0XXX()), "010")
+        self.assertIsNone(Has010().inclusion_witness(Has010OrEnd0XXX()))
+        self.assertTrue(IsEnd0XXX().is_subset_of(Has010OrEnd0XXX()))
+        self.assertFalse(Has010OrEnd0XXX().is_subset_of(IsEnd0XXX_DFA()))
+
+    def test_partial_alphabet(self):
+        """ 片方のアルファベットに無い文字を読むと、その側は行き止まりになる """
+        a_star = NFA({0}, {"a"}, {0: {"a": {0}}}, 0, {0})
+        ab_star = NFA({0}, {"a", "b"}, {0: {"a": {0}, "b": {0}}}, 0, {0})
+        self.assertTrue(a_star.is_subset_of(ab_star))
+        self.assertEqual(ab_star.inclusion_witness(a_star), "b")
+        self.assertEqual(a_star.distinguishing_string(ab_star), "b")
+
+
+class CompactTest(unittest.TestCase):
+    """ 遷移関数を整数の配列にまとめたCompactTransitionsと、それを辞書として読み出すTransitionViewの確認 """
+
+    def test_view(self):
+        for automata in [IsLengthEven, IsDivisibleBy3, IsEnd0XXX, Has010, IsIncreasingSequence, Has010OrEnd0XXX]:
+            instance = automata()
+            self.assertIsInstance(instance.transitions, Automata.TransitionView)
+            for string, expected in automata.tests:
+                self.assertEqual(expected, instance.run(string))
+
+    def test_dict_api(self):
+        transitions = {0: {"a": 1}, 1: {}, 2: {"a": 2, "b": 0}}
+        dfa = DFA({0, 1, 2}, {"a", "b"}, transitions, 0, {1})
+        self.assertEqual(dfa.transitions, transitions)
+        self.assertEqual(len(dfa.transitions), 3)
+        self.assertEqual(dfa.transitions[2], {"a": 2, "b": 0})
+        self.assertEqual(dfa.transitions.get(1), {})
+        self.assertIsNone(dfa.transitions.get(3))
+        self.assertIn(1, dfa.transitions)
+        self.assertEqual(sorted(dfa.transitions), [0, 1, 2])
+        with self.assertRaises(KeyError):
+            dfa.transitions[3]
+        self.assertEqual(dfa.step(0, "a"), 1)
+        self.assertIsNone(dfa.step(0, "b"))
+        # 行の中の文字の順番は決まらないので、一文字ずつの行で比べる
+        self.assertEqual("{0: {'a': 1}, 1: {}}", repr(DFA({0, 1}, {"a"}, {0: {"a": 1}, 1: {}}, 0, {1}).transitions))
+        self.assertNotEqual(dfa.transitions, {0: {"a": 1}})
+
+    def test_read_only(self):
+        """ 読み出した行をその場で書き換えようとするとTypeErrorになり、黙って無視されることはない """
+        dfa = IsDivisibleBy3()
+        with self.assertRaises(TypeError):
+            dfa.transitions[0]["0"] = 1
+        with self.assertRaises(TypeError):
+            dfa.transitions[0] = {"0": 1}
+        with self.assertRaises(AttributeError):
+            Has010().transitions[0]["0"].add(3)
+        self.assertTrue(dfa.run("0011"))
+        # 遷移を変える時は辞書を代入する
+        transitions = {state: dict(row) for state, row in dfa.transitions.items()}
+        transitions[0]["0"] = 1
+        dfa.transitions = transitions
+        self.assertFalse(dfa.run("0011"))
+
+    def test_nondeterministic(self):
+        transitions = {"p": {"0": {"p", "q"}, -1: {"r"}}, "q": {}}
+        enfa = eNFA({"p", "q"}, {"0"}, transitions, "p", {"r"})
+        # statesに無い状態"r"も行き先として番号が振られる
+        self.assertEqual(enfa.transitions["p"], {"0": frozenset({"p", "q"}), -1: frozenset({"r"})})
+        self.assertNotIn("r", enfa.transitions)
+        self.assertEqual(enfa.reachables_with_a_epsilon_from("p"), frozenset({"r"}))
+        self.assertEqual(enfa.next_states({"p"}, "0"), frozenset({"p", "q", "r"}))
+        self.assertTrue(enfa.run(""))
+
+    def test_shared(self):
+        """ 同じ種類のオートマトンの間ではまとめた配列をそのまま共有する """
+        dfa = IsDivisibleBy3()
+        flipped = dfa.flliped()
+        self.assertIs(dfa.transitions.compact, flipped.transitions.compact)
+        self.assertFalse(flipped.run("11"))
+
+    def test_slots(self):
+        dfa = DFA({0}, {"a"}, {0: {"a": 0}}, 0, {0})
+        with self.assertRaises(AttributeError):
+            dfa.extra = 1
+
+    def test_smaller(self):
+        """ 配列にまとめた方が辞書より小さい """
+        dfa = Automata.DeterministicFiniteAutomata(range(1000), {"0", "1"}, {i: {"0": i * 2 % 1000, "1": (i * 2 + 1) % 1000} for i in range(1000)}, 0, {0})
+        compact = dfa.transitions.compact
+        self.assertEqual(len(compact.offsets), 1001)
+        self.assertEqual(len(compact.targets), 2000)
+        self.assertLess(compact.nbytes(), 1000 * 200)
+
+    def test_sparse(self):
+        """ 配列の大きさは辺の数に比例し、アルファベットが大きくても状態の数との積にはならない """
+        alphabet = [chr(0x3000 + i) for i in range(3000)]
+        transitions = {i: {alphabet[i]: {i + 1}} for i in range(3000)}
+        nfa = NFA(range(3001), alphabet, transitions, 0, {3000})
+        compact = nfa.transitions.compact
+        self.assertEqual(len(compact.offsets), 3002)
+        self.assertEqual(len(compact.targets), 3000)
+        self.assertLess(compact.nbytes(), 3000 * 200)
+        self.assertTrue(nfa.run("".join(alphabet)))
+        self.assertFalse(nfa.run("".join(alphabet[1:])))
+        self.assertEqual(nfa.transitions[5], {alphabet[5]: {6}})
+
+
+class SinkTest(unittest.TestCase):
+    """ 行き止まりの状態と受理し続ける状態での打ち切り、アルファベットに無い文字の扱いの確認 """
+
+    def setUp(self):
+        # 0で始まる文字列を認識(1は受理し続ける状態、2は行き止まりの状態)
+        self.dfa = DFA({0, 1, 2}, {"0", "1"}, {0: {"0": 1, "1": 2}, 1: {"0": 1, "1": 1}, 2: {"0": 2, "1": 2}}, 0, {1})
+        self.nfa = NFA({0, 1}, {"0", "1"}, {0: {"0": {1}}, 1: {"0": {1}, "1": {1}}}, 0, {1})
+
+    def test_sink_states(self):
+        compiled = self.dfa.compile()
+        sinks = [compiled.sink_states()[compiled.states.index(state)] for state in range(3)]
+        self.assertEqual([Automata.CompiledDFA.UNDECIDED, Automata.CompiledDFA.ACCEPTING_SINK, Automata.CompiledDFA.DEAD], sinks)
+        self.assertEqual(compiled.states.index(2), compiled.dead_state())
+        # any_wordの状態2やconvert_to_DFAの空集合の状態も行き止まり
+        dfa = eNFA.any_word({"a", "b"}).convert_to_DFA()
+        self.assertTrue(dfa.compile().is_dead(dfa.compile().advance(0, "aa")))
+        self.assertTrue(Has010_DFA().compile().sink_states().count(Automata.CompiledDFA.ACCEPTING_SINK) > 0)
+
+    def test_early_exit(self):
+        """ 打ち切った後の部分は遷移させない(invalidが"raise"なら後ろのアルファベットに無い文字だけは探す) """
+        long_string = "1" * 100000
+        for automata in [self.dfa, self.nfa]:
+            self.assertTrue(automata.run("0" + long_string))
+            self.assertFalse(automata.run("1" + long_string))
+            self.assertFalse(automata.run("1" + long_string + "x"))
+            with self.assertRaises(Automata.InvalidSymbolError) as context:
+                automata.run("1" + long_string + "x", invalid="raise")
+            self.assertEqual(100001, context.exception.position)
+        # 受理し続ける状態でも残りにアルファベットに無い文字があれば受理しない
+        self.assertFalse(self.dfa.run("0" + long_string + "x"))
+        with self.assertRaises(Automata.InvalidSymbolError) as context:
+            self.dfa.run("0" + long_string + "x", invalid="raise")
+        self.assertEqual(100001, context.exception.position)
+
+    def test_invalid_policies(self):
+        for engine in [self.dfa.compile(), self.nfa.engine(), self.nfa.bitset()]:
+            with mock.patch("builtins.print") as printed:
+                self.assertFalse(engine.run("0x1"))
+                self.assertFalse(engine.run("0x1", invalid="dead"))
+            printed.assert_not_called()
+            self.assertIsNone(engine.advance(engine.init_state, "0x"))
+            with self.assertRaises(Automata.InvalidSymbolError) as context:
+                engine.run("0x1", invalid="raise")
+            self.assertEqual(("x", 1), (context.exception.symbol, context.exception.position))
+            with self.assertRaises(ValueError):
+                engine.run("x", invalid="ignore")
+        # deadなら行き止まりの状態になる
+        self.assertEqual(0, self.nfa.engine().advance(self.nfa.engine().init_state, "x0", invalid="dead"))
+        compiled = self.dfa.compile()
+        self.assertEqual(compiled.dead_state(), compiled.advance(compiled.init_state, "x", invalid="dead"))
+
+    def test_matcher(self):
+        matcher = self.dfa.matcher(invalid="raise")
+        matcher.feed("0110")
+        with self.assertRaises(Automata.InvalidSymbolError) as context:
+            matcher.feed("11x")
+        self.assertEqual(6, context.exception.position)
+        matcher = self.nfa.matcher(invalid="dead")
+        self.assertTrue(matcher.feed("0x").is_dead())
+        self.assertIsNotNone(matcher.state)
+        self.assertFalse(matcher.finish())
+        with self.assertRaises(ValueError):
+            self.dfa.matcher(invalid="ignore")
+
+
 if __name__ == "__main__":
     unittest.main()